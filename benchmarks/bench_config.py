@@ -0,0 +1,239 @@
+"""
+Copyright (c) 2015 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the MIT license. See the LICENSE file for details.
+
+Benchmarks for configuration generation with synthetic environments.
+
+Every case runs in a fresh interpreter so that its peak RSS is its own; the
+wall time is the best of --repeat runs. Results are compared against
+benchmarks/baselines.json and the run fails if a case is slower, bigger or
+produces more output than its baseline allows. After an intended change
+re-record the baselines with --update.
+
+    python benchmarks/bench_config.py [--update] [CASE...]
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(ROOT, "benchmarks", "baselines.json")
+TEMPLATE = os.path.join(ROOT, "os-eap7-openshift", "added", "standalone-openshift.xml")
+ACTIVEMQ_SUBSYSTEM = os.path.join(ROOT, "os-eap7-launch", "added", "launch", "activemq-subsystem.xml")
+
+# allowed growth over the baseline before a case counts as a regression;
+# wall time is noisy so it also gets an absolute allowance
+TIME_TOLERANCE = 1.5
+TIME_SLACK_MS = 20.0
+MEMORY_TOLERANCE = 1.25
+OUTPUT_TOLERANCE = 1.10
+
+def datasources_env(count):
+    """COUNT datasources, alternating between MySQL and PostgreSQL."""
+    environ = {}
+    mappings = []
+    for i in range(count):
+        db = "MYSQL" if i % 2 else "POSTGRESQL"
+        service = "APP{}_{}".format(i, db)
+        prefix = "APP{}".format(i)
+        mappings.append("app{}-{}={}".format(i, db.lower(), prefix))
+        environ.update({
+            "{}_SERVICE_HOST".format(service): "10.0.{}.{}".format(i // 256, i % 256),
+            "{}_SERVICE_PORT".format(service): "3306" if db == "MYSQL" else "5432",
+            "{}_USERNAME".format(prefix): "user{}".format(i),
+            "{}_PASSWORD".format(prefix): "secret{}".format(i),
+            "{}_DATABASE".format(prefix): "db{}".format(i),
+            "{}_MIN_POOL_SIZE".format(prefix): "5",
+            "{}_MAX_POOL_SIZE".format(prefix): "20",
+        })
+    environ["DB_SERVICE_PREFIX_MAPPING"] = ",".join(mappings)
+    return environ
+
+def tx_datasource_env():
+    environ = datasources_env(1)
+    environ.update({
+        "TX_DATABASE_PREFIX_MAPPING": "txstore-postgresql=TX",
+        "TXSTORE_POSTGRESQL_SERVICE_HOST": "10.1.0.1",
+        "TXSTORE_POSTGRESQL_SERVICE_PORT": "5432",
+        "TX_USERNAME": "tx",
+        "TX_PASSWORD": "secret",
+        "TX_DATABASE": "tx",
+    })
+    return environ
+
+def destinations_env(count):
+    return {
+        "MQ_QUEUES": ",".join("queue{}".format(i) for i in range(count)),
+        "MQ_TOPICS": ",".join("topic{}".format(i) for i in range(count)),
+    }
+
+def brokers_env(count, destinations=20):
+    """COUNT A-MQ brokers, each with DESTINATIONS queues and topics."""
+    environ = {}
+    mappings = []
+    for i in range(count):
+        service = "BROKER{}_AMQ".format(i)
+        prefix = "MQ{}".format(i)
+        mappings.append("broker{}-amq={}".format(i, prefix))
+        environ.update({
+            "{}_TCP_SERVICE_HOST".format(service): "10.2.{}.{}".format(i // 256, i % 256),
+            "{}_TCP_SERVICE_PORT".format(service): "61616",
+            "{}_USERNAME".format(prefix): "user{}".format(i),
+            "{}_PASSWORD".format(prefix): "secret{}".format(i),
+            "{}_QUEUES".format(prefix): ",".join("q{}_{}".format(i, j) for j in range(destinations)),
+            "{}_TOPICS".format(prefix): ",".join("t{}_{}".format(i, j) for j in range(destinations)),
+        })
+    environ["MQ_SERVICE_PREFIX_MAPPING"] = ",".join(mappings)
+    return environ
+
+# name: (what to run, synthetic environment)
+CASES = {}
+for _count in [1, 10, 100, 1000]:
+    CASES["datasources-{}".format(_count)] = ("datasources", datasources_env(_count))
+_streaming = dict(datasources_env(1000), CONFIG_XML_BACKEND="streaming")
+CASES["datasources-1000-streaming"] = ("datasources", _streaming)
+CASES["tx-datasource"] = ("datasources", tx_datasource_env())
+CASES["configure-datasources-100"] = ("configure", datasources_env(100))
+CASES["configure-destinations-1000"] = ("configure", destinations_env(1000))
+CASES["configure-destinations-10000"] = ("configure", destinations_env(10000))
+CASES["configure-brokers-10"] = ("configure", brokers_env(10))
+CASES["configure-brokers-100"] = ("configure", brokers_env(100))
+CASES["configure-defaults"] = ("configure", {})
+CASES["configure-defaults-precompiled"] = ("configure-precompiled", {})
+
+def prepare_jboss_home(workdir):
+    jboss_home = os.path.join(workdir, "eap")
+    config_dir = os.path.join(jboss_home, "standalone", "configuration")
+    launch_dir = os.path.join(jboss_home, "bin", "launch")
+    if not os.path.isdir(config_dir):
+        os.makedirs(config_dir)
+        os.makedirs(launch_dir)
+        shutil.copy(ACTIVEMQ_SUBSYSTEM, launch_dir)
+    shutil.copy(TEMPLATE, config_dir)
+    return jboss_home
+
+def run_case(name, repeat):
+    """Run a case in this process and return its measurements."""
+    target, environ = CASES[name]
+    workdir = tempfile.mkdtemp(prefix="bench-config")
+    try:
+        os.environ.clear()
+        os.environ.update(environ)
+        os.environ["STARTUP_TIMELINE_FILE"] = ""
+
+        sys.path.insert(0, ROOT)
+        import run as run_module
+        run_module.LAUNCH_ENVS_FILE = os.path.join(workdir, "launch_envs")
+
+        best = None
+        for _ in range(repeat):
+            os.environ["JBOSS_HOME"] = prepare_jboss_home(workdir)
+            if target == "configure-precompiled":
+                run_module.Run('run','run').precompile()
+            start = time.time()
+            run = run_module.Run('run','run')
+            if target.startswith("configure"):
+                run.configure()
+            else:
+                # the only bare placeholder; as in tests/test_datasources.py
+                run.set_placeholder("DEFAULT_JMS", "")
+                run.setup_xml()
+                run.inject_datasources()
+                run.teardown_xml()
+            elapsed = (time.time() - start) * 1000.0
+            best = elapsed if best is None else min(best, elapsed)
+
+        output = [run.get_config_file()]
+        if target.startswith("configure"):
+            output.append(run_module.LAUNCH_ENVS_FILE)
+        return {
+            "wall_ms": round(best, 3),
+            "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "output_bytes": sum(os.path.getsize(path) for path in output),
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+def measure(name, repeat):
+    """Run a case in a fresh interpreter."""
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", "--repeat", str(repeat), name],
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = child.communicate()
+    if child.returncode != 0:
+        return {"error": err.decode("utf-8", "replace").strip().splitlines()[-1] if err.strip() else "exit status {}".format(child.returncode)}
+    return json.loads(out.decode("utf-8").strip().splitlines()[-1])
+
+def regressions(result, baseline):
+    """The ways in which RESULT is worse than BASELINE."""
+    if "error" in result:
+        return ["failed: {}".format(result["error"])] if baseline else []
+    if not baseline:
+        return []
+    found = []
+    if result["wall_ms"] > baseline["wall_ms"] * TIME_TOLERANCE + TIME_SLACK_MS:
+        found.append("wall time {:.1f}ms > {:.1f}ms".format(result["wall_ms"], baseline["wall_ms"]))
+    if result["peak_rss_kb"] > baseline["peak_rss_kb"] * MEMORY_TOLERANCE:
+        found.append("peak RSS {}KiB > {}KiB".format(result["peak_rss_kb"], baseline["peak_rss_kb"]))
+    if result["output_bytes"] > baseline["output_bytes"] * OUTPUT_TOLERANCE:
+        found.append("output {}B > {}B".format(result["output_bytes"], baseline["output_bytes"]))
+    return found
+
+def load_baselines():
+    if not os.path.isfile(BASELINES):
+        return {}
+    with open(BASELINES, "r") as fh:
+        return json.load(fh)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark configuration generation.")
+    parser.add_argument("cases", nargs="*", help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best is kept")
+    parser.add_argument("--update", action="store_true", help="record the results as the new baselines")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_case(args.cases[0], args.repeat)))
+        return 0
+
+    names = args.cases or sorted(CASES)
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error("unknown case(s): {}".format(", ".join(unknown)))
+
+    baselines = load_baselines()
+    failed = False
+    print("{:<32} {:>12} {:>12} {:>12}".format("case", "wall ms", "peak KiB", "output B"))
+    for name in names:
+        result = measure(name, args.repeat)
+        if "error" in result:
+            print("{:<32} {}".format(name, result["error"]))
+        else:
+            print("{:<32} {:>12.1f} {:>12} {:>12}".format(name, result["wall_ms"], result["peak_rss_kb"], result["output_bytes"]))
+        if args.update:
+            baselines[name] = None if "error" in result else result
+            continue
+        for regression in regressions(result, baselines.get(name)):
+            failed = True
+            print("  REGRESSION: {}".format(regression))
+
+    if args.update:
+        with open(BASELINES, "w") as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True, separators=(",", ": "))
+            fh.write("\n")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
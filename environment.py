@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2015 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the MIT license. See the LICENSE file for details.
+"""
+
+import os
+
+TRUE_VALUES = ["true", "yes", "1"]
+FALSE_VALUES = ["false", "no", "0"]
+
+class InvalidSetting(ValueError):
+    """An environment variable whose value does not have the expected type."""
+
+    def __init__(self, name, value, expected):
+        ValueError.__init__(self, "Invalid value for {}: '{}' (expected {})".format(name, value, expected))
+        self.name = name
+        self.value = value
+
+class Settings(object):
+    """
+    A group of environment variables sharing a prefix, e.g. for the prefix
+    TEST_MYSQL the key USERNAME is the variable TEST_MYSQL_USERNAME.
+
+    get() behaves like os.getenv; the typed accessors treat an empty value
+    as unset and raise InvalidSetting for values of the wrong type.
+    """
+
+    def __init__(self, prefix, values):
+        self.prefix = prefix
+        self.values = values
+
+    def name(self, key):
+        return "{}_{}".format(self.prefix, key) if self.prefix else key
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def integer(self, key, default=None, minimum=0, maximum=None):
+        value = self.values.get(key, "")
+        if not value:
+            return default
+        try:
+            number = int(value)
+        except ValueError:
+            raise InvalidSetting(self.name(key), value, "an integer")
+        if number < minimum or (maximum is not None and number > maximum):
+            raise InvalidSetting(self.name(key), value, "an integer between {} and {}".format(minimum, maximum if maximum is not None else "infinity"))
+        return number
+
+    def number(self, key, default=None, minimum=0, maximum=None):
+        value = self.values.get(key, "")
+        if not value:
+            return default
+        try:
+            number = float(value)
+        except ValueError:
+            raise InvalidSetting(self.name(key), value, "a number")
+        if number < minimum or (maximum is not None and number > maximum):
+            raise InvalidSetting(self.name(key), value, "a number between {} and {}".format(minimum, maximum if maximum is not None else "infinity"))
+        return number
+
+    def port(self, key, default=None):
+        return self.integer(key, default, minimum=1, maximum=65535)
+
+    def boolean(self, key, default=False):
+        value = self.values.get(key, "").lower()
+        if not value:
+            return default
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+        raise InvalidSetting(self.name(key), value, "true or false")
+
+    def list(self, key, default="", separator=","):
+        """The non-empty items of a separated list."""
+        return [item.strip() for item in self.values.get(key, default).split(separator) if item.strip()]
+
+class Overrides(object):
+    """
+    Lenient lookups in SETTINGS: an invalid value falls back to the default
+    for that setting alone, and its InvalidSetting is kept in errors for the
+    caller to report.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.errors = []
+
+    def override(self, lookup, key, default, **kwargs):
+        """SETTINGS.LOOKUP(KEY, DEFAULT, ...), or DEFAULT if invalid."""
+        try:
+            return getattr(self.settings, lookup)(key, default, **kwargs)
+        except InvalidSetting as e:
+            self.errors.append(e)
+            return default
+
+    def choice(self, key, choices, default):
+        """KEY upper-cased if one of CHOICES; DEFAULT if empty, unset or invalid."""
+        value = (self.settings.get(key) or default).upper()
+        if value not in choices:
+            self.errors.append(InvalidSetting(self.settings.name(key), value,
+                                              "one of {}".format(", ".join(sorted(choices)))))
+            return default
+        return value
+
+class EnvironmentSnapshot(Settings):
+    """
+    A copy of the environment taken once, with every variable indexed
+    under each of its underscore-separated prefixes so that group() can
+    return all the settings of a service or datasource prefix in a single
+    lookup.
+    """
+
+    def __init__(self, environ=None):
+        Settings.__init__(self, "", dict(os.environ if environ is None else environ))
+        self._groups = None
+
+    def group(self, prefix):
+        if self._groups is None:
+            self._groups = {}
+            for name, value in self.values.items():
+                start = name.find("_")
+                while start > 0:
+                    self._groups.setdefault(name[:start], {})[name[start + 1:]] = value
+                    start = name.find("_", start + 1)
+        return Settings(prefix, self._groups.get(prefix, {}))
@@ -0,0 +1,240 @@
+"""
+Copyright (c) 2015 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the MIT license. See the LICENSE file for details.
+
+Offline renderer: runs Run.configure for many environments at once, outside
+of a container, to check and diff the configuration of every deployment or
+to measure what each one costs to render.
+
+Each environment file (JSON object or KEY=VALUE .env lines) is rendered in a
+scratch JBOSS_HOME holding only the template and the launch files, by a pool
+of worker processes. OUTPUT/<name>/ receives standalone-openshift.xml,
+launch_envs and timeline.json, and OUTPUT/summary.json the render time and
+the errors logged for every environment. The template is precompiled once
+up front, as Install does at build time.
+
+The container limits come from --memory and --cpus, and the CPUs of the node
+from --host-cpus (by default --cpus rounded up), not from the machine running
+the renderer; without them every environment is rendered as if it had no
+limits, on this machine.
+
+    python fleet.py [--template FILE] [--output DIR] [--jobs N]
+                    [--memory BYTES] [--cpus N] [--host-cpus N] ENVFILE...
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import json
+import math
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+from collections import OrderedDict
+
+import run as run_module
+
+from environment import EnvironmentSnapshot
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE = os.path.join(ROOT, "os-eap7-openshift", "added", "standalone-openshift.xml")
+LAUNCH_DIR = os.path.join(ROOT, "os-eap7-launch", "added", "launch")
+
+CONFIG_NAME = "standalone-openshift.xml"
+
+ENV_LINE_RE = re.compile(r"^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_]*)=(.*)$")
+
+def load_environment(path):
+    """The variables in PATH, a JSON object or KEY=VALUE lines."""
+    with open(path, "r") as fh:
+        text = fh.read()
+    if path.endswith(".json"):
+        values = json.loads(text)
+        if not isinstance(values, dict):
+            raise ValueError("{}: expected a JSON object".format(path))
+        return dict((str(name), "" if value is None else str(value)) for name, value in values.items())
+
+    environ = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        match = ENV_LINE_RE.match(line)
+        if not match:
+            raise ValueError("{}:{}: expected KEY=VALUE".format(path, number))
+        name, value = match.group(1), match.group(2).strip()
+        if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+            value = value[1:-1]
+        environ[name] = value
+    return environ
+
+def environment_names(paths):
+    """A distinct output directory name for each environment file."""
+    names, seen = [], {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0] or "env"
+        seen[name] = seen.get(name, 0) + 1
+        names.append(name if seen[name] == 1 else "{}-{}".format(name, seen[name]))
+    return names
+
+def write_cgroup(root, memory=None, cpus=None):
+    """A cgroup v2 directory with the given limits, for CgroupLimits."""
+    os.makedirs(root)
+    for name, value in [("cgroup.controllers", "cpu memory"),
+                        ("memory.max", str(memory) if memory else "max"),
+                        ("cpu.max", "{} 100000".format(int(cpus * 100000)) if cpus else "max 100000")]:
+        with open(os.path.join(root, name), "w") as fh:
+            fh.write(value + "\n")
+    return root
+
+def prepare_jboss_home(jboss_home, template, precompiled=None):
+    """The parts of JBOSS_HOME that Run.configure reads."""
+    config_dir = os.path.join(jboss_home, "standalone", "configuration")
+    os.makedirs(config_dir)
+    shutil.copytree(LAUNCH_DIR, os.path.join(jboss_home, "bin", "launch"))
+    shutil.copy(template, os.path.join(config_dir, CONFIG_NAME))
+    if precompiled:
+        shutil.copy(precompiled, os.path.join(config_dir, CONFIG_NAME + run_module.PRECOMPILED_SUFFIX))
+    return jboss_home
+
+def precompile(template, workdir):
+    """Precompile TEMPLATE once for every worker, None if that fails."""
+    jboss_home = prepare_jboss_home(os.path.join(workdir, "precompiled"), template)
+    run = run_module.Run('run', 'run')
+    run.env = EnvironmentSnapshot({"JBOSS_HOME": jboss_home})
+    try:
+        run.precompile()
+    except Exception as e:
+        logging.getLogger("fleet").warning("Unable to precompile {}: {}".format(template, e))
+        return None
+    return run.get_config_file() + run_module.PRECOMPILED_SUFFIX
+
+class _Collector(logging.Handler):
+    """Keeps the warnings and errors logged while rendering."""
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append("{}: {}".format(record.levelname, record.getMessage()))
+
+def render_environment(task):
+    """
+    Render one environment in a scratch JBOSS_HOME and copy the results to
+    its output directory; runs in a worker process.
+    """
+    name, environ, template, precompiled, output, cgroup_root, host_cpus = task
+
+    workdir = tempfile.mkdtemp(prefix="fleet-{}-".format(name))
+    collector = _Collector()
+    result = OrderedDict([("name", name)])
+    saved = run_module.LAUNCH_ENVS_FILE, run_module.SERVICE_ACCOUNT_TOKEN
+    try:
+        jboss_home = prepare_jboss_home(os.path.join(workdir, "eap"), template, precompiled)
+        environ = dict(environ, JBOSS_HOME=jboss_home, STARTUP_TIMELINE_FILE="",
+                       OPENSHIFT_KUBE_PING_PERMISSION_CACHE=os.path.join(workdir, "kube_ping_permissions.json"))
+        environ.pop("CONFIG_RENDER_CACHE_DIR", None)
+
+        # keep the module's fixed paths inside the scratch directory, and
+        # never ask a Kubernetes API for permissions from here
+        run_module.LAUNCH_ENVS_FILE = os.path.join(workdir, "launch_envs")
+        run_module.SERVICE_ACCOUNT_TOKEN = os.path.join(workdir, "no-service-account-token")
+
+        run = run_module.Run('run', 'run')
+        run.env = EnvironmentSnapshot(environ)
+        run.render_cache_dir = ""
+        run.cgroup_root = cgroup_root
+        run.host_cpus = host_cpus
+        run.logger.addHandler(collector)
+        try:
+            start = time.time()
+            run.configure()
+            result["wall_ms"] = round((time.time() - start) * 1000.0, 3)
+        finally:
+            run.logger.removeHandler(collector)
+
+        target = os.path.join(output, name)
+        if not os.path.isdir(target):
+            os.makedirs(target)
+        shutil.copy(run.get_config_file(), os.path.join(target, CONFIG_NAME))
+        shutil.copy(run_module.LAUNCH_ENVS_FILE, os.path.join(target, "launch_envs"))
+        run.timeline.write(os.path.join(target, "timeline.json"))
+        result["output_bytes"] = os.path.getsize(os.path.join(target, CONFIG_NAME))
+    except Exception as e:
+        result["failed"] = "{}: {}".format(type(e).__name__, e)
+    finally:
+        run_module.LAUNCH_ENVS_FILE, run_module.SERVICE_ACCOUNT_TOKEN = saved
+        shutil.rmtree(workdir, ignore_errors=True)
+    result["messages"] = collector.messages
+    return result
+
+def render_fleet(paths, output, template=TEMPLATE, jobs=None, memory=None, cpus=None, host_cpus=None):
+    """Render every environment file in PATHS into OUTPUT; returns the results in order."""
+    if host_cpus is None and cpus:
+        host_cpus = int(math.ceil(cpus))
+    workdir = tempfile.mkdtemp(prefix="fleet-")
+    try:
+        cgroup_root = write_cgroup(os.path.join(workdir, "cgroup"), memory, cpus)
+        precompiled = precompile(template, workdir)
+        tasks = [(name, load_environment(path), template, precompiled, output, cgroup_root, host_cpus)
+                 for name, path in zip(environment_names(paths), paths)]
+        if jobs == 1:
+            results = [render_environment(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(jobs)
+            try:
+                results = pool.map(render_environment, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(os.path.join(output, "summary.json"), "w") as fh:
+        json.dump(results, fh, indent=2, separators=(",", ": "))
+        fh.write("\n")
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the configuration for many environments.")
+    parser.add_argument("environments", nargs="+", metavar="ENVFILE", help="JSON or .env files, one per environment")
+    parser.add_argument("--template", default=TEMPLATE, help="the standalone-openshift.xml template")
+    parser.add_argument("--output", default="fleet", help="directory for the rendered files (default: fleet)")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--memory", type=int, default=None, help="container memory limit in bytes")
+    parser.add_argument("--cpus", type=float, default=None, help="container CPU limit")
+    parser.add_argument("--host-cpus", type=int, default=None,
+                        help="CPUs of the node (default: --cpus rounded up, or this machine's)")
+    args = parser.parse_args(argv)
+
+    # what Run logs goes to summary.json rather than the terminal
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    logging.getLogger("cct").propagate = False
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    results = render_fleet(args.environments, args.output, args.template, args.jobs, args.memory, args.cpus,
+                           args.host_cpus)
+
+    failed = False
+    print("{:<32} {:>12} {:>12} {:>9}".format("environment", "wall ms", "output B", "errors"))
+    for result in results:
+        errors = [message for message in result["messages"] if message.startswith("ERROR")]
+        if "failed" in result:
+            failed = True
+            print("{:<32} {}".format(result["name"], result["failed"]))
+            continue
+        failed = failed or bool(errors)
+        print("{:<32} {:>12.1f} {:>12} {:>9}".format(result["name"], result["wall_ms"], result["output_bytes"], len(errors)))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,11 +11,15 @@ import shutil
 
 from cct.module import Module
 
+from environment import EnvironmentSnapshot
+from run import Run
+
 class Install(Module):
 
     def install(self):
         self.openshift_scripts()
         self.launch()
+        self.precompile()
 
     def launch(self):
         added = "/tmp/cct/openshift-eap/os-eap7-launch/added"
@@ -44,3 +48,12 @@ class Install(Module):
                 out_fh.write(in_fh.read())
 
         shutil.move("{}/standalone-openshift.xml".format(added), "{}/standalone/configuration/".format(jboss_home))
+
+    def precompile(self):
+        """
+        Store the template in the precompiled form used by Run.configure,
+        with the defaults for an empty environment already applied.
+        """
+        run = Run(self.name, self.directory)
+        run.env = EnvironmentSnapshot({"JBOSS_HOME": os.getenv("JBOSS_HOME")})
+        run.precompile()
@@ -0,0 +1,382 @@
+"""
+Copyright (c) 2015 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the MIT license. See the LICENSE file for details.
+"""
+
+import os
+import re
+import math
+import multiprocessing
+
+from collections import OrderedDict
+
+from environment import InvalidSetting, Overrides, Settings
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+
+# cgroup v1 reports "no limit" as a huge page-aligned number
+UNLIMITED = 1 << 50
+
+MIB = 1024 * 1024
+
+# a GC already selected in JAVA_OPTS or JAVA_OPTS_APPEND
+GC_OPTION_RE = re.compile(r"-XX:\+Use\w+GC\b")
+
+GC_OPTIONS = {
+    "serial": "-XX:+UseSerialGC",
+    "parallel": "-XX:+UseParallelGC",
+    "g1": "-XX:+UseG1GC",
+}
+
+class CgroupLimits(object):
+    """
+    The memory and CPU limits of the container, from the cgroup v2 unified
+    hierarchy or the v1 memory and cpu controllers under ROOT. HOST_CPUS
+    stands in for the CPUs of the node, e.g. when rendering offline.
+    """
+
+    def __init__(self, root=CGROUP_ROOT, host_cpus=None):
+        self.root = root
+        self._host_cpus = host_cpus
+        self.version = 2 if os.path.isfile(os.path.join(root, "cgroup.controllers")) else 1
+
+    def _read(self, *names):
+        for name in names:
+            path = os.path.join(self.root, name)
+            if os.path.isfile(path):
+                with open(path, "r") as fh:
+                    return fh.read().strip()
+        return None
+
+    def host_cpus(self):
+        """The CPUs of the node."""
+        return self._host_cpus or multiprocessing.cpu_count()
+
+    def memory(self):
+        """The memory limit in bytes, or None if unlimited."""
+        if self.version == 2:
+            value = self._read("memory.max")
+        else:
+            value = self._read("memory/memory.limit_in_bytes")
+        if not value or not value.isdigit() or int(value) >= UNLIMITED:
+            return None
+        return int(value)
+
+    def cpus(self):
+        """The CPU quota in (fractional) CPUs, or None if unlimited."""
+        if self.version == 2:
+            fields = (self._read("cpu.max") or "max").split()
+            quota, period = fields[0], fields[1] if len(fields) > 1 else "100000"
+        else:
+            quota = self._read("cpu/cpu.cfs_quota_us", "cpu,cpuacct/cpu.cfs_quota_us") or "-1"
+            period = self._read("cpu/cpu.cfs_period_us", "cpu,cpuacct/cpu.cfs_period_us") or "100000"
+        try:
+            quota, period = int(quota), int(period)
+        except ValueError:
+            return None
+        if quota <= 0 or period <= 0:
+            return None
+        return float(quota) / period
+
+class JvmSizing(object):
+    """
+    JVM options derived from the container limits. Every value follows a
+    policy that can be overridden with its own environment variable:
+
+      max heap         CONTAINER_HEAP_PERCENT (default 0.5) of the memory
+                       limit, or JVM_MAX_HEAP_SIZE MiB; unset without a limit
+      initial heap     INITIAL_HEAP_PERCENT (default 1.0) of the max heap,
+                       or JVM_INITIAL_HEAP_SIZE MiB
+      metaspace        10% of the limit between 96 and 512 MiB, or
+                       JVM_MAX_METASPACE_SIZE MiB
+      direct memory    10% of the limit, at least 64 MiB, or
+                       JVM_MAX_DIRECT_MEMORY_SIZE MiB
+      processors       the CPU quota rounded up, up to the host CPUs, or
+                       the host CPUs without a quota; JVM_ACTIVE_PROCESSOR_COUNT
+      GC               serial below 2 processors or a 1 GiB heap, G1 from
+                       a 4 GiB heap, parallel otherwise; JVM_GC (serial,
+                       parallel or g1), none if JAVA_OPTS already picks one
+      GC threads       the processors, up to 8 plus 5/8 of the rest
+                       (HotSpot's own rule, but applied to the quota rather
+                       than the host); JVM_PARALLEL_GC_THREADS
+      concurrent GC    a quarter of the GC threads, at least 1;
+                       JVM_CONC_GC_THREADS
+    """
+
+    def __init__(self, limits, settings):
+        self.limits = limits
+        self.settings = settings
+
+    def _mib(self, key, default):
+        value = self.settings.integer(key, minimum=1)
+        return value if value is not None else default
+
+    def max_heap(self, memory):
+        if self.settings.get("JVM_MAX_HEAP_SIZE"):
+            return self.settings.integer("JVM_MAX_HEAP_SIZE", minimum=1)
+        if memory is None:
+            return None
+        ratio = self.settings.number("CONTAINER_HEAP_PERCENT", 0.5, minimum=0.01, maximum=1)
+        return max(1, int(memory * ratio / MIB))
+
+    def initial_heap(self, max_heap):
+        if self.settings.get("JVM_INITIAL_HEAP_SIZE"):
+            return self.settings.integer("JVM_INITIAL_HEAP_SIZE", minimum=1)
+        if max_heap is None:
+            return None
+        ratio = self.settings.number("INITIAL_HEAP_PERCENT", 1.0, minimum=0.01, maximum=1)
+        return max(1, int(max_heap * ratio))
+
+    def processors(self):
+        count = self.settings.integer("JVM_ACTIVE_PROCESSOR_COUNT", minimum=1)
+        if count is not None:
+            return count
+        cpus = self.limits.cpus()
+        host = self.limits.host_cpus()
+        return min(host, max(1, int(math.ceil(cpus)))) if cpus else host
+
+    def gc(self, processors, max_heap):
+        selected = self.settings.get("JVM_GC", "").lower()
+        if selected:
+            if selected not in GC_OPTIONS:
+                raise InvalidSetting("JVM_GC", selected, "one of {}".format(", ".join(sorted(GC_OPTIONS))))
+            return selected
+        if GC_OPTION_RE.search("{} {}".format(self.settings.get("JAVA_OPTS", ""), self.settings.get("JAVA_OPTS_APPEND", ""))):
+            return None
+        if processors < 2 or (max_heap is not None and max_heap < 1024):
+            return "serial"
+        if max_heap is not None and max_heap >= 4096:
+            return "g1"
+        return "parallel"
+
+    def parallel_gc_threads(self, processors):
+        threads = self.settings.integer("JVM_PARALLEL_GC_THREADS", minimum=1)
+        if threads is not None:
+            return threads
+        return processors if processors <= 8 else 8 + (processors - 8) * 5 // 8
+
+    def options(self):
+        """The sizing as an ordered name: value mapping, and as JVM options."""
+        memory = self.limits.memory()
+        sizing = OrderedDict()
+        sizing["max_heap_mb"] = self.max_heap(memory)
+        sizing["initial_heap_mb"] = self.initial_heap(sizing["max_heap_mb"])
+        if sizing["max_heap_mb"] and sizing["initial_heap_mb"] > sizing["max_heap_mb"]:
+            sizing["initial_heap_mb"] = sizing["max_heap_mb"]
+        sizing["max_metaspace_mb"] = self._mib("JVM_MAX_METASPACE_SIZE",
+                                               min(512, max(96, memory // 10 // MIB)) if memory else None)
+        sizing["max_direct_memory_mb"] = self._mib("JVM_MAX_DIRECT_MEMORY_SIZE",
+                                                   max(64, memory // 10 // MIB) if memory else None)
+        sizing["active_processor_count"] = self.processors()
+        sizing["gc"] = self.gc(sizing["active_processor_count"], sizing["max_heap_mb"])
+        if sizing["gc"] in ["parallel", "g1"]:
+            sizing["parallel_gc_threads"] = self.parallel_gc_threads(sizing["active_processor_count"])
+        if sizing["gc"] == "g1":
+            sizing["conc_gc_threads"] = self.settings.integer(
+                "JVM_CONC_GC_THREADS", max(1, (sizing["parallel_gc_threads"] + 3) // 4), minimum=1)
+
+        opts = []
+        for key, template in [("initial_heap_mb", "-Xms{}m"), ("max_heap_mb", "-Xmx{}m"),
+                              ("max_metaspace_mb", "-XX:MaxMetaspaceSize={}m"),
+                              ("max_direct_memory_mb", "-XX:MaxDirectMemorySize={}m"),
+                              ("active_processor_count", "-XX:ActiveProcessorCount={}"),
+                              ("parallel_gc_threads", "-XX:ParallelGCThreads={}"),
+                              ("conc_gc_threads", "-XX:ConcGCThreads={}")]:
+            if sizing.get(key) is not None:
+                opts.append(template.format(sizing[key]))
+        if sizing["gc"]:
+            opts.append(GC_OPTIONS[sizing["gc"]])
+        return sizing, " ".join(opts)
+
+class Sizing(Overrides):
+    """
+    Base for the policies built on JvmSizing, whose overrides fall back to
+    the policy's value one setting at a time.
+    """
+
+    def __init__(self, limits, settings):
+        Overrides.__init__(self, settings)
+        self.jvm = JvmSizing(limits, settings)
+        self.limits = limits
+
+    def _fallback(self, method, *args):
+        """JvmSizing.METHOD, without the JVM overrides if they are invalid (configure_jvm reports those)."""
+        try:
+            return getattr(self.jvm, method)(*args)
+        except InvalidSetting:
+            return getattr(JvmSizing(self.limits, Settings("", {})), method)(*args)
+
+class ThreadPoolSizing(Sizing):
+    """
+    Thread pool and buffer sizes for the ejb3, batch-jberet, jca and io
+    subsystems, from the processors and heap that JvmSizing settles on.
+    Each has its own override:
+
+      EJB3_MAX_THREADS               ejb3 default pool: 4 per processor, at least 10
+      BATCH_MAX_THREADS              batch-jberet pool: 2 per processor, at least 2
+      JCA_SHORT_RUNNING_MAX_THREADS  jca short-running work: 8 per processor, at least 8
+      JCA_LONG_RUNNING_MAX_THREADS   jca long-running work: 4 per processor, at least 4
+      IO_WORKER_IO_THREADS           io worker: 2 per processor
+      IO_WORKER_TASK_MAX_THREADS     io worker tasks: 16 per processor
+
+    No pool gets more threads than one per 4 MiB of heap. The io buffer
+    pool follows WildFly's own rule for the heap (IO_BUFFER_SIZE,
+    IO_BUFFERS_PER_SLICE): 512 bytes by 10 below 64 MiB, 1 KiB by 10
+    below 128 MiB, 16 KiB by 20 otherwise. The undertow buffer cache
+    keeps WildFly's 1 MiB regions (BUFFER_CACHE_BUFFER_SIZE by
+    BUFFER_CACHE_BUFFERS_PER_REGION) but holds one region per 64 MiB of
+    heap, up to the default 10 (BUFFER_CACHE_MAX_REGIONS). sizes() leaves
+    the processors it sized for in processors.
+    """
+
+    # name: (threads per processor, minimum)
+    POLICY = OrderedDict([
+        ("EJB3_MAX_THREADS", (4, 10)),
+        ("BATCH_MAX_THREADS", (2, 2)),
+        ("JCA_SHORT_RUNNING_MAX_THREADS", (8, 8)),
+        ("JCA_LONG_RUNNING_MAX_THREADS", (4, 4)),
+        ("IO_WORKER_IO_THREADS", (2, 1)),
+        ("IO_WORKER_TASK_MAX_THREADS", (16, 1)),
+    ])
+
+    processors = None
+
+    def sizes(self):
+        processors = self.processors = self._fallback("processors")
+        heap = self._fallback("max_heap", self.limits.memory())
+        sizes = OrderedDict()
+        for name, (per_processor, minimum) in self.POLICY.items():
+            threads = max(minimum, per_processor * processors)
+            if heap:
+                threads = max(minimum, min(threads, heap // 4))
+            sizes[name] = self.override("integer", name, threads, minimum=1)
+
+        if heap and heap < 64:
+            buffer_size, per_slice = 512, 10
+        elif heap and heap < 128:
+            buffer_size, per_slice = 1024, 10
+        else:
+            buffer_size, per_slice = 16384, 20
+        sizes["IO_BUFFER_SIZE"] = self.override("integer", "IO_BUFFER_SIZE", buffer_size, minimum=1)
+        sizes["IO_BUFFERS_PER_SLICE"] = self.override("integer", "IO_BUFFERS_PER_SLICE", per_slice, minimum=1)
+
+        sizes["BUFFER_CACHE_BUFFER_SIZE"] = self.override("integer", "BUFFER_CACHE_BUFFER_SIZE", 1024, minimum=1)
+        sizes["BUFFER_CACHE_BUFFERS_PER_REGION"] = self.override("integer", "BUFFER_CACHE_BUFFERS_PER_REGION",
+                                                                 1024, minimum=1)
+        sizes["BUFFER_CACHE_MAX_REGIONS"] = self.override("integer", "BUFFER_CACHE_MAX_REGIONS",
+                                                          max(1, min(10, heap // 64)) if heap else 10, minimum=1)
+        return sizes
+
+class PoolSizing(object):
+    """
+    Connection pool sizes for one datasource, from the database's connection
+    budget, the number of pods sharing it and the pod's processors and
+    thread pools. The budget is {prefix}_CONNECTION_BUDGET, or
+    DB_CONNECTION_BUDGET for every datasource; each pod gets the budget
+    divided by DB_POOL_REPLICAS (default 1) plus DB_POOL_SURGE (default 1),
+    the extra pods a rolling update starts before the old ones stop.
+
+      max      the threads that can hold a connection at once (io worker
+               tasks, ejb3 and batch threads), at most the pod's share of
+               the budget; {prefix}_MAX_POOL_SIZE
+      min      one per processor, at most max; {prefix}_MIN_POOL_SIZE
+      initial  min; {prefix}_INITIAL_POOL_SIZE
+      prefill  whether min is above 0; {prefix}_PREFILL
+
+    Without a budget only the overrides are set (None otherwise), so the
+    server's own defaults (max 20, no prefill) apply: sizing to the thread
+    demand alone would let every pod open hundreds of connections.
+    """
+
+    DEMAND = ["IO_WORKER_TASK_MAX_THREADS", "EJB3_MAX_THREADS", "BATCH_MAX_THREADS"]
+
+    def __init__(self, settings, defaults, processors, threads):
+        self.settings = settings
+        self.defaults = defaults
+        self.processors = processors
+        self.threads = threads
+
+    def share(self):
+        """This pod's share of the connection budget, or None without one."""
+        budget = self.settings.integer("CONNECTION_BUDGET",
+                                       self.defaults.integer("DB_CONNECTION_BUDGET", minimum=1), minimum=1)
+        if budget is None:
+            return None
+        pods = self.defaults.integer("DB_POOL_REPLICAS", 1, minimum=1) + \
+               self.defaults.integer("DB_POOL_SURGE", 1)
+        return budget // pods
+
+    def sizes(self):
+        share = self.share()
+        demand = max(1, sum(self.threads.get(name, 0) for name in self.DEMAND))
+        sizes = OrderedDict()
+        sizes["min"] = self.settings.integer("MIN_POOL_SIZE")
+        sizes["initial"] = self.settings.integer("INITIAL_POOL_SIZE")
+        sizes["max"] = self.settings.integer("MAX_POOL_SIZE")
+        if sizes["max"] is not None and sizes["min"] is not None and sizes["min"] > sizes["max"]:
+            raise InvalidSetting(self.settings.name("MIN_POOL_SIZE"), sizes["min"],
+                                 "at most {} ({})".format(sizes["max"], self.settings.name("MAX_POOL_SIZE")))
+        if share is None:
+            if sizes["initial"] is not None:
+                sizes["initial"] = max(sizes["min"] or 0, sizes["initial"])
+                if sizes["max"] is not None:
+                    sizes["initial"] = min(sizes["max"], sizes["initial"])
+            sizes["prefill"] = self.settings.boolean("PREFILL", None)
+            return sizes
+
+        if sizes["max"] is None:
+            sizes["max"] = max(1, sizes["min"] or 0, min(demand, share))
+        if sizes["min"] is None:
+            sizes["min"] = min(self.processors, sizes["max"])
+        if sizes["initial"] is None:
+            sizes["initial"] = sizes["min"]
+        sizes["initial"] = min(sizes["max"], max(sizes["min"], sizes["initial"]))
+        sizes["prefill"] = self.settings.boolean("PREFILL", sizes["min"] > 0)
+        return sizes
+
+class MessagingSizing(Sizing):
+    """
+    Journal, paging and batching settings for the embedded ActiveMQ
+    server. Paging follows the heap JvmSizing settles on; each value has
+    its own override:
+
+      MQ_MAX_SIZE_BYTES                  memory an address holds before paging: 5% of
+                                         the heap between 1 and 100 MiB, 10 MiB without
+                                         a limit
+      MQ_PAGE_SIZE_BYTES                 page file size: a fifth of MQ_MAX_SIZE_BYTES
+      MQ_ADDRESS_FULL_POLICY             PAGE, BLOCK, DROP or FAIL (PAGE)
+      MQ_JOURNAL_TYPE                    ASYNCIO (NIO is used without libaio) or NIO
+      MQ_JOURNAL_FILE_SIZE               bytes per journal file (10 MiB)
+      MQ_JOURNAL_MIN_FILES               journal files created up front (2)
+      MQ_JOURNAL_BUFFER_TIMEOUT          nanoseconds between journal buffer flushes:
+                                         500000 for ASYNCIO, 3333333 for NIO
+      MQ_JOURNAL_SYNC_TRANSACTIONAL      sync the journal on commit (true)
+      MQ_JOURNAL_SYNC_NON_TRANSACTIONAL  sync the journal on durable sends (true)
+      MQ_BATCH_DELAY                     milliseconds the throughput connector and
+                                         acceptor batch writes for (50)
+    """
+
+    JOURNAL_TYPES = {"ASYNCIO": 500000, "NIO": 3333333}
+
+    ADDRESS_FULL_POLICIES = ["PAGE", "BLOCK", "DROP", "FAIL"]
+
+    def sizes(self):
+        heap = self._fallback("max_heap", self.limits.memory())
+        max_size = min(100 * MIB, max(MIB, heap * MIB // 20)) if heap else 10 * MIB
+        sizes = OrderedDict()
+        sizes["MQ_MAX_SIZE_BYTES"] = self.override("integer", "MQ_MAX_SIZE_BYTES", max_size, minimum=-1)
+        sizes["MQ_PAGE_SIZE_BYTES"] = self.override(
+            "integer", "MQ_PAGE_SIZE_BYTES", max(64 * 1024, sizes["MQ_MAX_SIZE_BYTES"] // 5), minimum=1)
+        sizes["MQ_ADDRESS_FULL_POLICY"] = self.choice("MQ_ADDRESS_FULL_POLICY", self.ADDRESS_FULL_POLICIES, "PAGE")
+        sizes["MQ_JOURNAL_TYPE"] = self.choice("MQ_JOURNAL_TYPE", self.JOURNAL_TYPES, "ASYNCIO")
+        sizes["MQ_JOURNAL_FILE_SIZE"] = self.override("integer", "MQ_JOURNAL_FILE_SIZE", 10 * MIB, minimum=1024)
+        sizes["MQ_JOURNAL_MIN_FILES"] = self.override("integer", "MQ_JOURNAL_MIN_FILES", 2, minimum=2)
+        sizes["MQ_JOURNAL_BUFFER_TIMEOUT"] = self.override(
+            "integer", "MQ_JOURNAL_BUFFER_TIMEOUT", self.JOURNAL_TYPES[sizes["MQ_JOURNAL_TYPE"]], minimum=0)
+        for key in ["MQ_JOURNAL_SYNC_TRANSACTIONAL", "MQ_JOURNAL_SYNC_NON_TRANSACTIONAL"]:
+            sizes[key] = "true" if self.override("boolean", key, True) else "false"
+        sizes["MQ_BATCH_DELAY"] = self.override("integer", "MQ_BATCH_DELAY", 50, minimum=0)
+        return sizes
@@ -188,7 +188,7 @@ function inject_timer_service() {
                     <!-- ##DATASTORES## -->\
                 </data-stores>\
             </timer-service>"
-  sed -i "s|<!-- ##TIMER_SERVICE## -->|${timerservice%$'\n'}|" $CONFIG_FILE
+  set_placeholder TIMER_SERVICE "${timerservice%$'\n'}"
 }
 
 # Arguments:
@@ -198,7 +198,7 @@ function inject_timer_service() {
 function inject_datastore() {
   datastore="<database-data-store name=\"${1}_ds\" datasource-jndi-name=\"${2}\" database=\"${3}\" partition=\"${1}_part\"/>\
         <!-- ##DATASTORES## -->"
-  sed -i "s|<!-- ##DATASTORES## -->|${datastore%$'\n'}|" $CONFIG_FILE
+  set_placeholder DATASTORES "${datastore%$'\n'}"
 }
 
 # Arguments:
@@ -206,7 +206,7 @@ function inject_datastore() {
 function inject_default_job_repository() {
   defaultjobrepo="     <default-job-repository name=\"${1}\"/>"
 
-  sed -i "s|<!-- ##DEFAULT_JOB_REPOSITORY## -->|${defaultjobrepo%$'\n'}|" $CONFIG_FILE
+  set_placeholder DEFAULT_JOB_REPOSITORY "${defaultjobrepo%$'\n'}"
 }
 
 function inject_job_repository() {
@@ -215,7 +215,7 @@ function inject_job_repository() {
     </job-repository>\
     <!-- ##JOB_REPOSITORY## -->"
 
-  sed -i "s|<!-- ##JOB_REPOSITORY## -->|${jobrepo%$'\n'}|" $CONFIG_FILE
+  set_placeholder JOB_REPOSITORY "${jobrepo%$'\n'}"
 }
 
 # Finds the name of the database services and generates data sources
@@ -359,8 +359,8 @@ function inject_datasources() {
     defaultDatasource=""
   fi
 
-  sed -i "s|<!-- ##DATASOURCES## -->|${datasources%$'\n'}|" $CONFIG_FILE
-  sed -i "s|##DEFAULT_DATASOURCE##|${defaultDatasource}|" $CONFIG_FILE
+  set_placeholder DATASOURCES "${datasources%$'\n'}"
+  set_placeholder DEFAULT_DATASOURCE "${defaultDatasource}"
 }
 
 function get_jndi_name() {
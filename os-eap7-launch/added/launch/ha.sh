@@ -52,7 +52,8 @@ function configure_ha() {
                 </protocol>\n"
   fi
 
-  sed -i "s|<!-- ##JGROUPS_AUTH## -->|${JGROUPS_AUTH}|g" $CONFIG_FILE
+  set_placeholder JGROUPS_AUTH "${JGROUPS_AUTH}"
+  set_placeholder JGROUPS_STACK "${JGROUPS_STACK:-tcp}"
 
 }
 
@@ -72,5 +73,5 @@ function configure_jgroups_encryption() {
     fi
   fi
 
-  sed -i "s|<!-- ##JGROUPS_ENCRYPT## -->|$jgroups_encrypt|g" "$CONFIG_FILE"
+  set_placeholder JGROUPS_ENCRYPT "$jgroups_encrypt"
 }
@@ -18,6 +18,6 @@ function configure_https() {
     echo "WARNING! Partial HTTPS configuration, the https connector WILL NOT be configured."
   fi
 
-  sed -i "s|<!-- ##SSL## -->|${ssl}|" $CONFIG_FILE
-  sed -i "s|<!-- ##HTTPS_CONNECTOR## -->|${https_connector}|" $CONFIG_FILE
+  set_placeholder SSL "${ssl}"
+  set_placeholder HTTPS_CONNECTOR "${https_connector}"
 }
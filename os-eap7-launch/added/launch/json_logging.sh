@@ -1,3 +1,16 @@
 function configure_json_logging() {
   sed -i "s|^.*\.module=org\.jboss\.logmanager\.ext$||" $LOGGING_FILE
 }
+
+# Logging subsystem; Run.configure_logging also validates these and takes
+# LOGGER_CATEGORIES, this only keeps the previous fixed loggers.
+function configure_logging() {
+  if [ "${ENABLE_JSON_LOGGING,,}" = "true" ]; then
+    set_placeholder LOGGING_FORMATTER "OPENSHIFT"
+  else
+    set_placeholder LOGGING_FORMATTER "COLOR-PATTERN"
+  fi
+  set_placeholder LOGGING_ASYNC_QUEUE_LENGTH "${LOGGING_ASYNC_QUEUE_LENGTH:-512}"
+  set_placeholder LOGGING_ASYNC_OVERFLOW_ACTION "${LOGGING_ASYNC_OVERFLOW_ACTION:-block}"
+  set_placeholder LOGGERS '<logger category="com.arjuna"><level name="WARN"/></logger>\n            <logger category="org.jboss.as.config"><level name="DEBUG"/></logger>\n            <logger category="sun.rmi"><level name="WARN"/></logger>'
+}
@@ -8,8 +8,8 @@
 # $1 env variable name to check
 # $2 default value if environment variable was not set
 function find_env() {
-#  echo "${1-$2}"
-  var=`printenv "$1"`
+  # indirect expansion rather than forking printenv for every lookup
+  var="${!1}"
 
   # If environment variable exists
   if [ -n "$var" ]; then
@@ -18,3 +18,29 @@ function find_env() {
     echo $2
   fi
 }
+
+# Records the replacement text for a placeholder in the server configuration.
+# Rather than rewriting $CONFIG_FILE once per placeholder, the substitutions
+# are collected in $PLACEHOLDERS_FILE and applied in a single pass by
+# Run.render_template.
+#
+# Arguments:
+# $1 placeholder name, e.g. SSL for <!-- ##SSL## -->
+# $2 replacement text
+function set_placeholder() {
+  printf '%s\t%s\n' "$1" "$2" >> "$PLACEHOLDERS_FILE"
+}
+
+# Runs a launch step in the current shell, appending its name and start and
+# end times (nanoseconds since the epoch) to $SHELL_TIMELINE_FILE.
+#
+# Arguments:
+# $1 function to run
+# $@ its arguments
+function timed() {
+  local start=$(date +%s%N)
+  "$@"
+  local status=$?
+  printf '%s %s %s\n' "$1" "$start" "$(date +%s%N)" >> "$SHELL_TIMELINE_FILE"
+  return $status
+}
@@ -36,10 +36,23 @@ function configure_mq() {
     configure_mq_cluster_password
 
     destinations=$(configure_mq_destinations)
-    activemq_subsystem=$(sed -e "s|<!-- ##DESTINATIONS## -->|${destinations}|" <"${ACTIVEMQ_SUBSYSTEM_FILE}" | sed ':a;N;$!ba;s|\n|\\n|g')
-
-    sed -i "s|<!-- ##MESSAGING_SUBSYSTEM_CONFIG## -->|${activemq_subsystem%$'\n'}|" "${CONFIG_FILE}"
-    sed -i 's|<!-- ##MESSAGING_PORTS## -->|<socket-binding name="messaging" port="5445"/><socket-binding name="messaging-throughput" port="5455"/>|' "${CONFIG_FILE}"
+    # Run.configure_mq sizes these to the container, this only keeps the previous fixed values
+    activemq_subsystem=$(sed -e "s|<!-- ##DESTINATIONS## -->|${destinations}|" \
+                             -e "s|<!-- ##MQ_ADDRESS_SETTINGS## -->||" \
+                             -e "s|##MQ_JOURNAL_TYPE##|${MQ_JOURNAL_TYPE:-ASYNCIO}|" \
+                             -e "s|##MQ_JOURNAL_FILE_SIZE##|${MQ_JOURNAL_FILE_SIZE:-10485760}|" \
+                             -e "s|##MQ_JOURNAL_MIN_FILES##|${MQ_JOURNAL_MIN_FILES:-2}|" \
+                             -e "s|##MQ_JOURNAL_BUFFER_TIMEOUT##|${MQ_JOURNAL_BUFFER_TIMEOUT:-500000}|" \
+                             -e "s|##MQ_JOURNAL_SYNC_TRANSACTIONAL##|${MQ_JOURNAL_SYNC_TRANSACTIONAL:-true}|" \
+                             -e "s|##MQ_JOURNAL_SYNC_NON_TRANSACTIONAL##|${MQ_JOURNAL_SYNC_NON_TRANSACTIONAL:-true}|" \
+                             -e "s|##MQ_MAX_SIZE_BYTES##|${MQ_MAX_SIZE_BYTES:-10485760}|" \
+                             -e "s|##MQ_PAGE_SIZE_BYTES##|${MQ_PAGE_SIZE_BYTES:-2097152}|" \
+                             -e "s|##MQ_ADDRESS_FULL_POLICY##|${MQ_ADDRESS_FULL_POLICY:-PAGE}|" \
+                             -e "s|##MQ_BATCH_DELAY##|${MQ_BATCH_DELAY:-50}|g" \
+                             <"${ACTIVEMQ_SUBSYSTEM_FILE}" | sed ':a;N;$!ba;s|\n|\\n|g')
+
+    set_placeholder MESSAGING_SUBSYSTEM_CONFIG "${activemq_subsystem%$'\n'}"
+    set_placeholder MESSAGING_PORTS '<socket-binding name="messaging" port="5445"/><socket-binding name="messaging-throughput" port="5455"/>'
   fi
 }
 
@@ -257,7 +270,8 @@ function inject_brokers() {
     defaultJms="jms-connection-factory=\"$defaultJmsConnectionFactoryJndi\""
   fi
 
-  sed -i "s|<!-- ##RESOURCE_ADAPTERS## -->|${ras%$'\n'}|" $CONFIG_FILE
-  sed -i "s|##DEFAULT_JMS##|${defaultJms}|" $CONFIG_FILE
+  set_placeholder RESOURCE_ADAPTERS "${ras%$'\n'}"
+  set_placeholder DEFAULT_JMS "${defaultJms}"
+  set_placeholder ANNOTATION_PROPERTY_REPLACEMENT ""
 }
 
@@ -31,5 +31,5 @@ configure_security_domains() {
           echo "WARNING! Both user and roles files must exist before an additional security domain can be configured, current values are ${SECDOMAIN_USERS_PROPERTIES} and ${SECDOMAIN_ROLES_PROPERTIES}."
       fi
   fi
-  sed -i "s|<!-- ##ADDITIONAL_SECURITY_DOMAINS## -->|$domains|" "$CONFIG_FILE"
+  set_placeholder ADDITIONAL_SECURITY_DOMAINS "$domains"
 }
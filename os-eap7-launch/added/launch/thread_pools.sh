@@ -0,0 +1,15 @@
+# Thread pool sizes; Run.configure_thread_pools derives these from the
+# container limits, this only keeps the previous fixed values.
+function configure_thread_pools() {
+  set_placeholder EJB3_MAX_THREADS "${EJB3_MAX_THREADS:-10}"
+  set_placeholder BATCH_MAX_THREADS "${BATCH_MAX_THREADS:-10}"
+  set_placeholder JCA_SHORT_RUNNING_MAX_THREADS "${JCA_SHORT_RUNNING_MAX_THREADS:-50}"
+  set_placeholder JCA_LONG_RUNNING_MAX_THREADS "${JCA_LONG_RUNNING_MAX_THREADS:-50}"
+  set_placeholder IO_WORKER_IO_THREADS "${IO_WORKER_IO_THREADS:-$((2 * $(nproc)))}"
+  set_placeholder IO_WORKER_TASK_MAX_THREADS "${IO_WORKER_TASK_MAX_THREADS:-$((16 * $(nproc)))}"
+  set_placeholder IO_BUFFER_SIZE "${IO_BUFFER_SIZE:-16384}"
+  set_placeholder IO_BUFFERS_PER_SLICE "${IO_BUFFERS_PER_SLICE:-20}"
+  set_placeholder BUFFER_CACHE_BUFFER_SIZE "${BUFFER_CACHE_BUFFER_SIZE:-1024}"
+  set_placeholder BUFFER_CACHE_BUFFERS_PER_REGION "${BUFFER_CACHE_BUFFERS_PER_REGION:-1024}"
+  set_placeholder BUFFER_CACHE_MAX_REGIONS "${BUFFER_CACHE_MAX_REGIONS:-10}"
+}
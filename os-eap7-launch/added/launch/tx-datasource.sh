@@ -46,7 +46,7 @@ function generate_tx_datasource() {
 
 function inject_jdbc_store() {
   jdbcStore="<jdbc-store datasource-jndi-name=\"${1}ObjectStore\"/>"
-  sed -i "s|<!-- ##JDBC_STORE## -->|${jdbcStore}|" $CONFIG_FILE
+  set_placeholder JDBC_STORE "${jdbcStore}"
 }
 
 function inject_tx_datasource() {
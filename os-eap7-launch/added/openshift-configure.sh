@@ -1,9 +1,18 @@
 #!/bin/sh
 # Openshift EAP launch script
+# Superseded by Run.configure, which implements every step below in Python
 
 CONFIG_FILE=$JBOSS_HOME/standalone/configuration/standalone-openshift.xml
 LOGGING_FILE=$JBOSS_HOME/standalone/configuration/logging.properties
 
+# Placeholder substitutions, applied to $CONFIG_FILE by Run.render_template
+PLACEHOLDERS_FILE=/tmp/launch_placeholders
+> $PLACEHOLDERS_FILE
+
+# Step timings, added to the startup timeline by Run.load_shell_timeline
+SHELL_TIMELINE_FILE=/tmp/launch_timeline
+> $SHELL_TIMELINE_FILE
+
 #For backward compatibility
 ADMIN_USERNAME=${ADMIN_USERNAME:-${EAP_ADMIN_USERNAME:-eapadmin}}
 ADMIN_PASSWORD=${ADMIN_PASSWORD:-$EAP_ADMIN_PASSWORD}
@@ -17,37 +26,43 @@ SECDOMAIN_ROLES_PROPERTIES=${SECDOMAIN_ROLES_PROPERTIES:-${EAP_SECDOMAIN_ROLES_P
 SECDOMAIN_NAME=${SECDOMAIN_NAME:-$EAP_SECDOMAIN_NAME}
 SECDOMAIN_PASSWORD_STACKING=${SECDOMAIN_PASSWORD_STACKING:-$EAP_SECDOMAIN_PASSWORD_STACKING}
 
+. $JBOSS_HOME/bin/launch/launch-common.sh
+
 . $JBOSS_HOME/bin/launch/messaging.sh
-inject_brokers
-configure_mq
+timed inject_brokers
+timed configure_mq
 
 . $JBOSS_HOME/bin/launch/datasource.sh
 
 . $JBOSS_HOME/bin/launch/admin.sh
-configure_administration
+timed configure_administration
 
 . $JBOSS_HOME/bin/launch/ha.sh
-check_view_pods_permission
-configure_ha
-configure_jgroups_encryption
+timed check_view_pods_permission
+timed configure_ha
+timed configure_jgroups_encryption
 
 . $JBOSS_HOME/bin/launch/https.sh
-configure_https
+timed configure_https
 
 . $JBOSS_HOME/bin/launch/json_logging.sh
-configure_json_logging
+timed configure_json_logging
+timed configure_logging
 
 . $JBOSS_HOME/bin/launch/security-domains.sh
-configure_security_domains
+timed configure_security_domains
 
 . $JBOSS_HOME/bin/launch/jboss_modules_system_pkgs.sh
-configure_jboss_modules_system_pkgs
+timed configure_jboss_modules_system_pkgs
 
 . $JBOSS_HOME/bin/launch/keycloak.sh
-configure_keycloak
+timed configure_keycloak
 
 . $JBOSS_HOME/bin/launch/deploymentScanner.sh
-configure_deployment_scanner
+timed configure_deployment_scanner
+
+. $JBOSS_HOME/bin/launch/thread_pools.sh
+timed configure_thread_pools
 
 echo "Running $JBOSS_IMAGE_NAME image, version $JBOSS_IMAGE_VERSION-$JBOSS_IMAGE_RELEASE"
 
@@ -6,63 +6,941 @@ This software may be modified and distributed under the terms
 of the MIT license. See the LICENSE file for details.
 """
 
+import re
+import sys
 import ssl
+import json
+import glob
 import shutil
+import socket
+import time
+import urllib
+import hashlib
+import StringIO
+import tempfile
+import threading
 import urllib2
 import xml.dom.minidom
 
+from xml.sax.saxutils import escape, quoteattr
+
 import os
 
+from collections import OrderedDict
+
 from cct.module import Module
 
+from environment import EnvironmentSnapshot, InvalidSetting, Overrides
+from timeline import StartupTimeline
+from jvm import CGROUP_ROOT, CgroupLimits, JvmSizing, ThreadPoolSizing, PoolSizing, MessagingSizing
+
+# substitutions recorded by set_placeholder in launch/launch-common.sh
+PLACEHOLDERS_FILE = "/tmp/launch_placeholders"
+
+# matches both <!-- ##NAME## --> and bare ##NAME## placeholders
+PLACEHOLDER_RE = re.compile(r'<!-- ##([A-Z0-9_]+)## -->|##([A-Z0-9_]+)##')
+
+# arguments for openshift-launch.sh
+LAUNCH_ENVS_FILE = "/tmp/launch_envs"
+
+# per-phase startup timings, see StartupTimeline
+STARTUP_TIMELINE_FILE = "/tmp/startup_timeline.json"
+
+# phases recorded by the timed function in launch/launch-common.sh
+SHELL_TIMELINE_FILE = "/tmp/launch_timeline"
+
+# configure() steps, in order; the template is parsed after the steps
+# that only record placeholders
+CONFIGURE_STEPS = [
+    "inject_brokers",
+    "configure_mq",
+    "configure_administration",
+    "check_view_pods_permission",
+    "configure_ha",
+    "configure_jgroups_encryption",
+    "configure_https",
+    "configure_json_logging",
+    "configure_logging",
+    "configure_security_domains",
+    "configure_jboss_modules_system_pkgs",
+    "configure_deployment_scanner",
+    "configure_jvm",
+    "configure_thread_pools",
+    "configure_document",
+    "report_view_pods_permission",
+    "write_launch_envs",
+    "save_render_cache",
+]
+
+# configure_document() steps that work on the parsed configuration
+DOCUMENT_STEPS = [
+    "setup_xml",
+    "inject_datasources",
+    "inject_messaging",
+    "inject_jgroups",
+    "inject_infinispan",
+    "inject_undertow",
+    "teardown_xml",
+]
+
+# JGroups tuning settings, see jgroups_tuning: each sets a property of a
+# protocol ("transport" for TCP or UDP) or an attribute of a transport
+# thread pool ("<name>-thread-pool") in both stacks, and is overridden by
+# JGROUPS_<SETTING>
+JGROUPS_SETTINGS = OrderedDict([
+    ("BUNDLER_TYPE", ("transport", "bundler_type")),
+    ("MAX_BUNDLE_SIZE", ("transport", "max_bundle_size")),
+    ("RECV_BUF_SIZE", ("transport", "recv_buf_size")),
+    ("SEND_BUF_SIZE", ("transport", "send_buf_size")),
+    ("DEFAULT_MIN_THREADS", ("default-thread-pool", "min-threads")),
+    ("DEFAULT_MAX_THREADS", ("default-thread-pool", "max-threads")),
+    ("DEFAULT_QUEUE_LENGTH", ("default-thread-pool", "queue-length")),
+    ("OOB_MIN_THREADS", ("oob-thread-pool", "min-threads")),
+    ("OOB_MAX_THREADS", ("oob-thread-pool", "max-threads")),
+    ("FD_TIMEOUT", ("FD", "timeout")),
+    ("FD_MAX_TRIES", ("FD", "max_tries")),
+    ("FD_ALL_TIMEOUT", ("FD_ALL", "timeout")),
+    ("FD_ALL_INTERVAL", ("FD_ALL", "interval")),
+    ("FC_MAX_CREDITS", ("MFC UFC", "max_credits")),
+    ("FC_MIN_THRESHOLD", ("MFC UFC", "min_threshold")),
+    ("FRAG_SIZE", ("FRAG2", "frag_size")),
+])
+
+# the UDP transport has separate unicast and multicast socket buffers
+JGROUPS_UDP_PROPERTIES = {
+    "recv_buf_size": ["ucast_recv_buf_size", "mcast_recv_buf_size"],
+    "send_buf_size": ["ucast_send_buf_size", "mcast_send_buf_size"],
+}
+
+# a transport's thread pool elements, in schema order, after its properties
+JGROUPS_THREAD_POOLS = ["default-thread-pool", "internal-thread-pool", "oob-thread-pool", "timer-thread-pool"]
+
+JGROUPS_BUNDLERS = ["transfer-queue", "sender-sends", "sender-sends-with-timer"]
+
+# JGROUPS_PROFILE values: "default" keeps the JGroups defaults; small
+# clusters detect failures quickly and send without bundling, large ones
+# bundle, give flow control more credit and allow longer pauses before
+# suspecting a member
+JGROUPS_PROFILES = {
+    "default": {},
+    "low-latency": {
+        "BUNDLER_TYPE": "sender-sends",
+        "DEFAULT_MIN_THREADS": 10, "DEFAULT_MAX_THREADS": 100, "DEFAULT_QUEUE_LENGTH": 0,
+        "FD_TIMEOUT": 3000, "FD_MAX_TRIES": 3,
+        "FD_ALL_TIMEOUT": 12000, "FD_ALL_INTERVAL": 3000,
+    },
+    "high-throughput": {
+        "BUNDLER_TYPE": "transfer-queue", "MAX_BUNDLE_SIZE": 64000,
+        "RECV_BUF_SIZE": 20000000, "SEND_BUF_SIZE": 1000000,
+        "DEFAULT_MIN_THREADS": 20, "DEFAULT_MAX_THREADS": 300, "DEFAULT_QUEUE_LENGTH": 100,
+        "OOB_MIN_THREADS": 20, "OOB_MAX_THREADS": 300,
+        "FD_TIMEOUT": 10000, "FD_MAX_TRIES": 5,
+        "FD_ALL_TIMEOUT": 60000, "FD_ALL_INTERVAL": 15000,
+        "FC_MAX_CREDITS": 4000000, "FC_MIN_THRESHOLD": 0.4,
+    },
+}
+
+JGROUPS_STACKS = ["tcp", "udp"]
+
+# cache containers tuned by inject_infinispan, each through the
+# INFINISPAN_<CONTAINER>_<SETTING> variables
+INFINISPAN_CONTAINERS = ["web", "ejb"]
+INFINISPAN_SETTINGS = ["CACHE", "OWNERS", "EVICTION_MAX_ENTRIES", "EVICTION_STRATEGY", "EXPIRATION_MAX_IDLE",
+                       "FILE_STORE"]
+
+# the default-cache choices of those containers
+INFINISPAN_CACHES = OrderedDict([("repl", "replicated-cache"), ("dist", "distributed-cache")])
+
+INFINISPAN_EVICTION_STRATEGIES = ["NONE", "UNORDERED", "FIFO", "LRU", "LIRS"]
+
+# a cache's children, in schema order
+INFINISPAN_CACHE_ELEMENTS = ["locking", "transaction", "eviction", "expiration", "file-store"]
+
+# deployment scanner modes, see configure_deployment_scanner
+DEPLOYMENT_SCAN_MODES = ["periodic", "boot", "index"]
+
+# what the scanner would deploy from deployments/
+DEPLOYMENT_EXTENSIONS = [".war", ".ear", ".jar", ".rar", ".sar", ".wab", ".esa"]
+
+# listener attributes set by inject_undertow on every undertow listener,
+# each from UNDERTOW_<SETTING>
+UNDERTOW_LISTENER_SETTINGS = OrderedDict([
+    ("MAX_CONNECTIONS", "max-connections"),
+    ("MAX_POST_SIZE", "max-post-size"),
+    ("NO_REQUEST_TIMEOUT", "no-request-timeout"),
+    ("TCP_BACKLOG", "tcp-backlog"),
+    ("BUFFER_POOL", "buffer-pool"),
+])
+
+UNDERTOW_LISTENERS = ["http-listener", "https-listener", "ajp-listener"]
+
+# environment variables that make the document steps differ from the
+# precompiled defaults
+DOCUMENT_ENV = [
+    "DB_SERVICE_PREFIX_MAPPING",
+    "TX_DATABASE_PREFIX_MAPPING",
+    "TX_OBJECT_STORE",
+    "TIMER_SERVICE_DATA_STORE",
+    "DEFAULT_JOB_REPOSITORY",
+    "DEFAULT_DATASOURCE",
+    "DB_JNDI",
+    "DB_POOL",
+    "JGROUPS_PROFILE",
+] + ["JGROUPS_{}".format(setting) for setting in JGROUPS_SETTINGS] + [
+    "INFINISPAN_{}_{}".format(container.upper(), setting)
+    for container in INFINISPAN_CONTAINERS for setting in INFINISPAN_SETTINGS] + [
+    "UNDERTOW_{}".format(setting) for setting in list(UNDERTOW_LISTENER_SETTINGS) + ["ENABLE_HTTP2"]]
+
+# the DOCUMENT_ENV variables the document steps act on when set at all,
+# even to an empty value
+DOCUMENT_ENV_PRESENT = ["TIMER_SERVICE_DATA_STORE", "DEFAULT_JOB_REPOSITORY", "DB_JNDI", "DB_POOL"]
+
+# written by Install next to the template, see Run.precompile
+PRECOMPILED_SUFFIX = ".precompiled"
+
+# stand in for the bare ##NAME## placeholders, which are only valid inside
+# a start tag, while the defaults are precompiled: an attribute, or a token
+# inside an attribute value
+PRECOMPILED_ATTR = 'precompiled-placeholder-{}=""'
+PRECOMPILED_VALUE = '@@{}@@'
+PRECOMPILED_RE = re.compile(r'precompiled-placeholder-([A-Z0-9_]+)=""|@@([A-Z0-9_]+)@@')
+
+# service account token used to check the KUBE_PING permissions
+SERVICE_ACCOUNT_TOKEN = "/var/run/secrets/kubernetes.io/serviceaccount/token"
+
+# seconds to wait for the pod view permission check, and its result cache
+POD_VIEW_TIMEOUT = 5
+POD_VIEW_CACHE_FILE = "/tmp/kube_ping_permissions.json"
+
+# datasource tuning defaults per driver, each overridden by {prefix}_<KEY>;
+# connections are validated in the background rather than on every checkout
+DATASOURCE_TUNING = {
+    # Connector/J has no prepared statement cache of its own by default
+    "mysql": {"PS_CACHE_SIZE": 256, "BACKGROUND_VALIDATION_MILLIS": 10000, "IDLE_TIMEOUT": 10},
+    # pgjdbc caches server-side statements, the pool keeps their PreparedStatements alive
+    "postgresql": {"PS_CACHE_SIZE": 64, "BACKGROUND_VALIDATION_MILLIS": 10000, "IDLE_TIMEOUT": 10},
+}
+
+# transaction object stores, see inject_tx_datasource
+TX_OBJECT_STORES = ["file", "journal", "jdbc"]
+
+# the jdbc-store's stores, each with its own table prefix
+TX_JDBC_STORES = ["action", "communication", "state"]
+
+FLUSH_STRATEGIES = ["FailingConnectionOnly", "InvalidIdleConnections", "IdleConnections", "Gracefully",
+                    "EntirePool", "AllInvalidIdleConnections", "AllIdleConnections", "AllGracefully",
+                    "AllConnections"]
+
+# logging subsystem defaults, see configure_logging; LOGGER_CATEGORIES
+# adds to and overrides the categories
+LOGGING_CATEGORIES = OrderedDict([("com.arjuna", "WARN"), ("org.jboss.as.config", "DEBUG"), ("sun.rmi", "WARN")])
+LOGGING_ASYNC_QUEUE_LENGTH = 512
+LOGGING_OVERFLOW_ACTIONS = ["block", "discard"]
+LOG_LEVELS = ["ALL", "FINEST", "FINER", "TRACE", "DEBUG", "FINE", "CONFIG", "INFO", "WARN", "WARNING",
+              "ERROR", "SEVERE", "FATAL", "OFF"]
+
+MESSAGING_PORTS = '<socket-binding name="messaging" port="5445"/><socket-binding name="messaging-throughput" port="5455"/>'
+
+# environment variables that differ between otherwise identical starts
+VOLATILE_ENV = ["_", "SHLVL", "PWD", "OLDPWD", "CONFIG_RENDER_CACHE_INVALIDATE"]
+
+# start/end/empty tags; comments, CDATA and processing instructions are
+# matched (so tags inside them are skipped) but have no tag name
+TAG_RE = re.compile(r'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|'
+                    r'<(/?)([^\s/>!?]+)((?:[^>"\']|"[^"]*"|\'[^\']*\')*?)(/?)>', re.S)
+
+# matches the namespace declaration in a start tag
+XMLNS_RE = re.compile(r'\sxmlns=["\']([^"\']*)["\']')
+
+# elements looked up by tag name, indexed alongside the subsystems
+INDEXED_TAGS = ["default-bindings", "datasources"]
+
+class _Section(object):
+    """One top-level section of the configuration, kept as text until used."""
+
+    def __init__(self, text, namespace=None, start=None):
+        self.text = text
+        self.namespace = namespace
+        self.element = None
+        # offset in the document text, see Run.precompile
+        self.start = start
+
+    def materialise(self):
+        if self.element is None:
+            self.element = xml.dom.minidom.parseString(self.text).documentElement
+            self.text = None
+        return self.element
+
+    def writexml(self, writer):
+        if self.element is None:
+            writer.write(self.text)
+        else:
+            self.element.writexml(writer)
+
+class SubsystemDocument(object):
+    """
+    A lazily parsed view of standalone-openshift.xml.
+
+    The file is split in one streaming pass into sections: every subsystem
+    of the <profile>, and every other child of <server>. A section is only
+    parsed (into a minidom element, so the Run helpers work unchanged) when
+    a lookup needs something inside it; all other sections are written back
+    exactly as they were read.
+    """
+
+    def __init__(self, text):
+        self._factory = xml.dom.minidom.Document()
+        self.segments = []
+        self.sections = []
+
+        stack = []
+        start = None
+        level = 0
+        last = 0
+        for match in TAG_RE.finditer(text):
+            closing, name, empty = match.group(1), match.group(2), match.group(4)
+            if name is None:
+                continue
+            if closing:
+                stack.pop()
+            elif start is None and ((len(stack) == 1 and name != "profile") or stack[1:] == ["profile"]):
+                start = match.start()
+                level = len(stack)
+                namespace = XMLNS_RE.search(match.group(3))
+            if not closing and not empty:
+                stack.append(name)
+            elif start is not None and len(stack) == level:
+                self._add_section(text[last:start], text[start:match.end()],
+                                  namespace.group(1) if namespace else None, start)
+                last = match.end()
+                start = None
+        self.segments.append(text[last:])
+
+    def _add_section(self, preceding, text, namespace, start=None):
+        section = _Section(text, namespace, start)
+        self.segments.append(preceding)
+        self.segments.append(section)
+        self.sections.append(section)
+
+    @classmethod
+    def from_sections(cls, text, sections):
+        """
+        Split TEXT at known (start, end, namespace) section offsets, as
+        recorded by Run.precompile, instead of scanning it.
+        """
+        doc = cls("")
+        doc.segments = []
+        last = 0
+        for start, end, namespace in sections:
+            doc._add_section(text[last:start], text[start:end], namespace, start)
+            last = end
+        doc.segments.append(text[last:])
+        return doc
+
+    @classmethod
+    def parse(cls, filename):
+        with open(filename, "r") as fh:
+            return cls(fh.read())
+
+    def createElement(self, tag):
+        return self._factory.createElement(tag)
+
+    def createTextNode(self, data):
+        return self._factory.createTextNode(data)
+
+    def createComment(self, data):
+        return self._factory.createComment(data)
+
+    def _select(self, pattern, tag):
+        found = xml.dom.minicompat.NodeList()
+        for section in self.sections:
+            if section.element is None and pattern.search(section.text):
+                section.materialise()
+            if section.element is not None:
+                if section.element.tagName == tag:
+                    found.append(section.element)
+                found.extend(section.element.getElementsByTagName(tag))
+        return found
+
+    def getElementsByTagName(self, tag):
+        """As minidom, parsing only the sections that contain TAG."""
+        return self._select(re.compile(r"<{}[\s/>]".format(re.escape(tag))), tag)
+
+    def getElementsByAttribute(self, tag, attr, val):
+        """TAG elements whose ATTR is VAL, parsing only sections that may match."""
+        pattern = re.compile(r"<{}\s[^>]*{}=[\"']{}[\"']".format(re.escape(tag), re.escape(attr), re.escape(val)))
+        return [elem for elem in self._select(pattern, tag) if elem.getAttribute(attr) == val]
+
+    def writexml(self, writer):
+        for segment in self.segments:
+            if isinstance(segment, _Section):
+                segment.writexml(writer)
+            else:
+                writer.write(segment)
+
+class DocumentIndex(object):
+    """
+    Subsystems by namespace and the INDEXED_TAGS elements by tag name.
+
+    The index is built with a single walk of the document (for a
+    SubsystemDocument, from the section namespaces without parsing
+    anything) and new elements are added to it with add().
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.subsystems = {}
+        self.tags = {}
+        self.sections = {}
+        if isinstance(document, SubsystemDocument):
+            for section in document.sections:
+                if section.namespace:
+                    self.sections.setdefault(section.namespace, section)
+        else:
+            self.add(document.documentElement)
+
+    def add(self, node):
+        """Index NODE and everything below it."""
+        pending = [node]
+        while pending:
+            elem = pending.pop()
+            if elem.nodeType != elem.ELEMENT_NODE:
+                continue
+            if elem.tagName == "subsystem":
+                self.subsystems.setdefault(elem.getAttribute("xmlns"), elem)
+            elif elem.tagName in INDEXED_TAGS:
+                self.tags.setdefault(elem.tagName, elem)
+            pending.extend(reversed(elem.childNodes))
+
+    def subsystem(self, namespace):
+        if namespace not in self.subsystems and namespace in self.sections:
+            self.add(self.sections[namespace].materialise())
+        return self.subsystems.get(namespace)
+
+    def element(self, tag):
+        if tag not in self.tags and isinstance(self.document, SubsystemDocument):
+            found = self.document.getElementsByTagName(tag)
+            if found:
+                self.tags[tag] = found[0]
+        return self.tags.get(tag)
+
 class Run(Module):
 
+    def __init__(self, *args, **kwargs):
+        Module.__init__(self, *args, **kwargs)
+        self.timeline = StartupTimeline()
+        self.env = EnvironmentSnapshot()
+        self.placeholders = OrderedDict()
+        self.render_cache_dir = self.env.get("CONFIG_RENDER_CACHE_DIR", "")
+        self.render_cache_key = None
+        self._index = None
+        self.amq = False
+        self.mq_destinations = None
+        self.resource_adapters = []
+        self.pods_probe = None
+        self.precompiled = None
+        self._thread_pools = None
+        # where CgroupLimits finds the container limits, and the node's CPUs
+        # if not this machine's
+        self.cgroup_root = CGROUP_ROOT
+        self.host_cpus = None
+        self.launch_envs = OrderedDict([("JBOSS_HA_ARGS", ""), ("JBOSS_MESSAGING_ARGS", ""), ("JVM_SIZING_OPTS", "")])
+
     def configure(self):
         """
         Aggregate method that calls all configure_ methods in sequence.
+
+        The steps that used to live in openshift-configure.sh record their
+        placeholder substitutions; the template is then rendered and parsed
+        once and the remaining steps work on that document.
         """
-        self.run_shell_launch_script()
-        self.setup_xml()
-        self.inject_datasources()
-        self.teardown_xml()
+        try:
+            with self.timeline.phase("restore_render_cache"):
+                restored = self.restore_render_cache()
+            self.timeline.annotate("render_cache", "hit" if restored else "miss" if self.render_cache_dir else "disabled")
+            if restored:
+                return
+            self.logger.info("Running {} image, version {}-{}".format(
+                self.env.get("JBOSS_IMAGE_NAME", ""), self.env.get("JBOSS_IMAGE_VERSION", ""), self.env.get("JBOSS_IMAGE_RELEASE", "")))
+            for step in CONFIGURE_STEPS:
+                with self.timeline.phase(step):
+                    getattr(self, step)()
+        finally:
+            self.write_timeline()
+
+    def write_timeline(self):
+        """
+        Write the startup timeline to STARTUP_TIMELINE_FILE (an empty value
+        disables it) and, if STARTUP_TIMELINE_SUMMARY=true, print a one-line
+        summary on stdout.
+        """
+        path = self.env.get("STARTUP_TIMELINE_FILE", STARTUP_TIMELINE_FILE)
+        if path:
+            try:
+                self.timeline.write(path)
+            except (IOError, OSError) as e:
+                self.logger.warning("Unable to write the startup timeline to {}: {}".format(path, e))
+        if self.env.get("STARTUP_TIMELINE_SUMMARY", "false").lower() == "true":
+            sys.stdout.write(self.timeline.summary() + "\n")
+            sys.stdout.flush()
 
     def run_shell_launch_script(self):
         """
         Executes the original shell wrapper script.
 
-        This step is necessary until such time as all the shell has been
-        re-implemented: we need to be able to run some Python code *after*
-        the shell code.
+        configure() no longer needs this, as every step of the script is
+        implemented by a method of this class; follow it with
+        load_placeholders() and render_template() to apply its output.
+        """
+        with self.timeline.phase("run_shell_launch_script"):
+            status = os.system('/opt/eap/bin/openshift-configure.sh')
+        self.timeline.spawned()
+        self.load_shell_timeline()
+        return status
+
+    def load_shell_timeline(self, path=SHELL_TIMELINE_FILE):
+        """
+        Add the phases timed by openshift-configure.sh, one "name start end"
+        line per step with the times in nanoseconds since the epoch.
+        """
+        if not os.path.isfile(path):
+            return
+        with open(path, "r") as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) != 3:
+                    continue
+                name, start, end = fields
+                try:
+                    self.timeline.add_phase(name, int(start) / 1e9, int(end) / 1e9, shell=True)
+                except ValueError:
+                    continue
+
+    def set_placeholder(self, name, value):
+        """
+        Record the replacement text for the placeholder NAME.
+
+        Substitutions behave as if they had been applied to the template
+        one after another: if an earlier replacement re-introduced the
+        placeholder (e.g. <!-- ##DATASTORES## --> inside the timer service)
+        the new value is spliced into it, otherwise a placeholder that has
+        already been consumed is left alone.
+        """
+        for key, current in self.placeholders.items():
+            if "##{}##".format(name) in current:
+                self.placeholders[key] = PLACEHOLDER_RE.sub(
+                    lambda m: value if name in m.groups() else m.group(0), current)
+        if name not in self.placeholders:
+            self.placeholders[name] = value
+
+    def load_placeholders(self, path=PLACEHOLDERS_FILE):
+        """
+        Read the substitutions recorded by the shell launch scripts.
+
+        Each line is NAME<tab>VALUE, with VALUE using sed's \\n escape for
+        newlines.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "r") as fh:
+            for line in fh:
+                name, _, value = line.rstrip("\n").partition("\t")
+                if name:
+                    self.set_placeholder(name, value.replace("\\n", "\n"))
+
+    def _placeholder_value(self, match):
+        name = match.group(1) or match.group(2)
+        return self.placeholders.get(name, match.group(0))
+
+    def render(self, text):
+        """Apply the recorded placeholder substitutions to TEXT in one pass."""
+        return PLACEHOLDER_RE.sub(self._placeholder_value, text)
+
+    def render_template(self):
+        """
+        Apply every recorded placeholder substitution to the configuration
+        file in a single streaming pass, replacing the file atomically.
+        """
+        if not self.placeholders:
+            return
+        config_file = self.get_config_file()
+        rendered = "{}.rendering".format(config_file)
+        with open(config_file, "r") as in_fh:
+            with open(rendered, "w") as out_fh:
+                for line in in_fh:
+                    out_fh.write(self.render(line))
+        os.rename(rendered, config_file)
+
+    def get_config_file(self):
+        jboss_home = self.env.get("JBOSS_HOME")
+        return "{}/standalone/configuration/standalone-openshift.xml".format(jboss_home)
+
+    def get_render_cache_files(self):
+        """The files produced by configure, in the order they are cached."""
+        config_dir = os.path.dirname(self.get_config_file())
+        return [
+            self.get_config_file(),
+            LAUNCH_ENVS_FILE,
+            os.path.join(config_dir, "logging.properties"),
+            os.path.join(config_dir, "mgmt-users.properties"),
+            os.path.join(config_dir, "mgmt-groups.properties"),
+        ]
+
+    def render_fingerprint(self):
         """
-        return os.system('/opt/eap/bin/openshift-configure.sh')
+        Hash everything the generated configuration depends on: the
+        environment, the container limits, the unrendered template and the
+        launch scripts (including this module).
+        """
+        jboss_home = self.env.get("JBOSS_HOME")
+        digest = hashlib.sha256()
+        limits = self.cgroup_limits()
+        digest.update("memory={} cpus={} host_cpus={}\0".format(
+            limits.memory(), limits.cpus(), limits.host_cpus()).encode("utf-8"))
+        for name in sorted(self.env.values):
+            if name not in VOLATILE_ENV:
+                digest.update("{}={}\0".format(name, self.env.values[name]).encode("utf-8"))
+
+        sources = [self.get_config_file(), self.get_config_file() + PRECOMPILED_SUFFIX,
+                   "{}/bin/openshift-configure.sh".format(jboss_home)]
+        sources.extend(sorted(glob.glob("{}/bin/launch/*".format(jboss_home))))
+        sources.append(os.path.splitext(__file__)[0] + ".py")
+        if self.env.get("DEPLOYMENT_SCAN_MODE") == "index":
+            # the index is only as current as the listing it was made from
+            deployments_dir = self.get_deployments_dir()
+            if os.path.isdir(deployments_dir):
+                for name in sorted(os.listdir(deployments_dir)):
+                    digest.update("deployment={}\0".format(name).encode("utf-8"))
+        for source in sources:
+            if os.path.isfile(source):
+                with open(source, "rb") as fh:
+                    digest.update(fh.read())
+        return digest.hexdigest()
+
+    def restore_render_cache(self):
+        """
+        Reuse the output of a previous configure run with the same
+        fingerprint. Caching is enabled by pointing CONFIG_RENDER_CACHE_DIR
+        at a volume that survives container restarts; set
+        CONFIG_RENDER_CACHE_INVALIDATE=true to discard the cache.
 
-    # this can't run until run_shell_launch_script has completed or the XML is not valid.
+        Returns True on a cache hit.
+        """
+        if not self.render_cache_dir:
+            return False
+
+        if self.env.get("CONFIG_RENDER_CACHE_INVALIDATE", "false").lower() == "true":
+            self.invalidate_render_cache()
+
+        self.render_cache_key = self.render_fingerprint()
+        entry = os.path.join(self.render_cache_dir, self.render_cache_key)
+        manifest = os.path.join(entry, "manifest.json")
+        if not os.path.isfile(manifest):
+            self.logger.info("Render cache miss (key {})".format(self.render_cache_key[:12]))
+            return False
+
+        with open(manifest, "r") as fh:
+            files = json.load(fh)
+        for index, path in enumerate(files):
+            shutil.copy(os.path.join(entry, str(index)), path)
+        self.logger.info("Render cache hit (key {}), restored {} files".format(self.render_cache_key[:12], len(files)))
+        return True
+
+    def save_render_cache(self):
+        """
+        Store the output of this configure run under the fingerprint taken
+        before it started, replacing any older entries.
+        """
+        if not self.render_cache_key:
+            return
+        if not os.path.exists(self.render_cache_dir):
+            os.makedirs(self.render_cache_dir)
+
+        staging = tempfile.mkdtemp(dir=self.render_cache_dir)
+        files = [path for path in self.get_render_cache_files() if os.path.isfile(path)]
+        for index, path in enumerate(files):
+            shutil.copy(path, os.path.join(staging, str(index)))
+        with open(os.path.join(staging, "manifest.json"), "w") as fh:
+            json.dump(files, fh)
+
+        self.invalidate_render_cache()
+        os.rename(staging, os.path.join(self.render_cache_dir, self.render_cache_key))
+
+    def invalidate_render_cache(self):
+        """Discard every cached configure result."""
+        if not self.render_cache_dir or not os.path.isdir(self.render_cache_dir):
+            return
+        for entry in os.listdir(self.render_cache_dir):
+            path = os.path.join(self.render_cache_dir, entry)
+            if len(entry) == 64 and os.path.isdir(path):
+                shutil.rmtree(path)
+
+    def write_launch_envs(self):
+        """Write the variables read by openshift-launch.sh."""
+        with open(LAUNCH_ENVS_FILE, "w") as fh:
+            for name, value in self.launch_envs.items():
+                value = re.sub(r'(["\\$`])', r'\\\1', value)
+                fh.write('export {}="{}"\n'.format(name, value))
+
+    def configure_document(self):
+        """
+        Apply the changes that need the parsed configuration. When nothing
+        in the environment asks for more than the defaults, the precompiled
+        default configuration is written with the placeholders spliced in
+        and nothing is parsed.
+        """
+        self.precompiled = self.load_precompiled()
+        if self.precompiled and self.uses_default_document():
+            self.logger.debug("Using the precompiled default configuration")
+            with self.timeline.phase("write_precompiled_default"):
+                # no destinations, so inject_messaging would just remove this
+                self.set_placeholder("DESTINATIONS", "")
+                start = time.time()
+                text, _ = self._splice(self.precompiled["defaults"])
+                self.write_config(self.get_config_file(), text, time.time() - start)
+            return
+        for step in DOCUMENT_STEPS:
+            with self.timeline.phase(step):
+                getattr(self, step)()
+
+    def uses_default_document(self):
+        if self.mq_destinations or self.resource_adapters:
+            return False
+        return not any(name in self.env if name in DOCUMENT_ENV_PRESENT else self.env.get(name)
+                       for name in DOCUMENT_ENV)
+
+    def load_precompiled(self):
+        """
+        The output of precompile, unless missing, CONFIG_PRECOMPILED=false or
+        made from another template (e.g. one an S2I build copied in). The
+        texts come back as UTF-8 str, as the template is read, so that the
+        offsets are byte offsets and they join with the placeholder values.
+        """
+        config_file = self.get_config_file()
+        path = config_file + PRECOMPILED_SUFFIX
+        try:
+            if not self.env.boolean("CONFIG_PRECOMPILED", True) or not os.path.isfile(path):
+                return None
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            return None
+        with open(path, "r") as fh:
+            precompiled = json.load(fh)
+        with open(config_file, "rb") as fh:
+            if hashlib.sha256(fh.read()).hexdigest() != precompiled.get("template_sha256"):
+                self.logger.info("{} does not match {}, not using it".format(path, config_file))
+                return None
+        for compiled in [precompiled["template"], precompiled["defaults"]]:
+            compiled["text"] = compiled["text"].encode("utf-8")
+            compiled["placeholders"] = [(start, end, name.encode("utf-8"), raw.encode("utf-8"))
+                                        for start, end, name, raw in compiled["placeholders"]]
+        return precompiled
+
+    def _splice(self, compiled, offsets=()):
+        """
+        Substitute the placeholders at the precompiled offsets of
+        COMPILED["text"]. Returns the text and OFFSETS (sorted) moved to
+        match it.
+        """
+        text = compiled["text"]
+        offsets = list(offsets)
+        parts = []
+        moved = []
+        last = 0
+        shift = 0
+        for start, end, name, raw in compiled["placeholders"]:
+            while offsets and offsets[0] <= start:
+                moved.append(offsets.pop(0) + shift)
+            value = self.placeholders.get(name, raw)
+            parts.append(text[last:start])
+            parts.append(value)
+            shift += len(value) - (end - start)
+            last = end
+        parts.append(text[last:])
+        moved.extend(offset + shift for offset in offsets)
+        return "".join(parts), moved
+
+    def precompile(self):
+        """
+        Build-time counterpart of configure_document, run by Install with an
+        empty environment. Next to the template it stores:
+
+          template: the template with the offsets of its placeholders and
+                    of its SubsystemDocument sections
+          defaults: the template with the default document steps (timer
+                    service, job repository, ExampleDS) applied, and the
+                    offsets of the placeholders that remain in it
+
+        and the template's sha256, for load_precompiled to check.
+        """
+        config_file = self.get_config_file()
+        with open(config_file, "r") as fh:
+            template = fh.read()
+
+        def placeholders(text):
+            found = [(m.start(), m.end(), m.group(1) or m.group(2), m.group(0)) for m in PLACEHOLDER_RE.finditer(text)]
+            found.extend((m.start(), m.end(), m.group(1) or m.group(2), "##{}##".format(m.group(1) or m.group(2)))
+                         for m in PRECOMPILED_RE.finditer(text))
+            return sorted(found)
+
+        def stand_in(match):
+            if match.group(1):
+                return match.group(0)
+            tag = template[template.rfind("<", 0, match.start()):match.start()]
+            if tag.count('"') % 2 or tag.count("'") % 2:
+                return PRECOMPILED_VALUE.format(match.group(2))
+            return PRECOMPILED_ATTR.format(match.group(2))
+
+        sections = [(section.start, section.start + len(section.text), section.namespace)
+                    for section in SubsystemDocument(template).sections]
+
+        # keep every placeholder: comments survive the DOM, bare ones become attributes
+        text = PLACEHOLDER_RE.sub(stand_in, template)
+        self.config = xml.dom.minidom.parseString(text)
+        self.inject_datasources()
+        self.inject_messaging()
+        out = StringIO.StringIO()
+        self.config.writexml(out)
+        defaults = out.getvalue()
+
+        with open(config_file + PRECOMPILED_SUFFIX, "w") as fh:
+            json.dump({
+                "template_sha256": hashlib.sha256(template).hexdigest(),
+                "template": {"text": template, "placeholders": placeholders(template), "sections": sections},
+                "defaults": {"text": defaults, "placeholders": placeholders(defaults)},
+            }, fh, separators=(",", ":"))
+
+    # this can't run until the placeholders have been recorded or the XML is not valid.
     # otherwise these could just be setup/teardown
     def setup_xml(self):
-        jboss_home = os.getenv("JBOSS_HOME")
-        self.config_file = "{}/standalone/configuration/standalone-openshift.xml".format(jboss_home)
-        self.config = xml.dom.minidom.parse(self.config_file)
+        """
+        Load the configuration, applying the placeholder substitutions on
+        the way in. CONFIG_XML_BACKEND=streaming selects SubsystemDocument,
+        which only parses the subsystems that are modified, instead of a
+        full minidom tree.
+
+        With a precompiled template the placeholders are spliced in at
+        their known offsets and the sections are not looked for again.
+        """
+        self.config_file = self.get_config_file()
+        streaming = self.env.get("CONFIG_XML_BACKEND", "minidom") == "streaming"
+        precompiled = self.precompiled
+        if precompiled:
+            compiled = precompiled["template"]
+            bounds = [offset for start, end, _ in compiled["sections"] for offset in (start, end)]
+            text, moved = self._splice(compiled, bounds)
+            if streaming:
+                # a subsystem added through a placeholder between sections
+                # (e.g. ##KEYCLOAK_SUBSYSTEM##) stays plain text; no document
+                # step looks one up
+                namespaces = [namespace for _, _, namespace in compiled["sections"]]
+                self.config = SubsystemDocument.from_sections(text, zip(moved[::2], moved[1::2], namespaces))
+                return
+        else:
+            with open(self.config_file, "r") as fh:
+                text = self.render(fh.read())
+        if streaming:
+            self.config = SubsystemDocument(text)
+        else:
+            self.config = xml.dom.minidom.parseString(text)
 
     def teardown_xml(self):
-        with open(self.config_file, "w") as fh:
-            self.config.writexml(fh)
+        start = time.time()
+        out = StringIO.StringIO()
+        self.config.writexml(out)
+        self.write_config(self.config_file, out.getvalue(), time.time() - start)
+
+    def write_config(self, config_file, text, serialise_time=0.0):
+        """
+        Write TEXT to CONFIG_FILE unless it already holds exactly that, so
+        an unchanged file in an image layer is not copied up. The file is
+        replaced atomically: written next to the original, then renamed
+        over it.
+        """
+        if isinstance(text, unicode):
+            text = text.encode("utf-8")
+        digest = hashlib.sha256(text).hexdigest()
+        changed = True
+        if os.path.isfile(config_file):
+            with open(config_file, "rb") as fh:
+                changed = hashlib.sha256(fh.read()).hexdigest() != digest
+
+        written = 0
+        if changed:
+            fd, staging = tempfile.mkstemp(dir=os.path.dirname(config_file), prefix=".standalone-openshift.xml.")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(text)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+                if os.path.exists(config_file):
+                    shutil.copymode(config_file, staging)
+                else:
+                    os.chmod(staging, 0o644)
+                os.rename(staging, config_file)
+            except Exception:
+                if os.path.exists(staging):
+                    os.remove(staging)
+                raise
+            written = len(text)
+
+        self.timeline.annotate("config_output", {
+            "bytes_written": written,
+            "serialise_ms": round(serialise_time * 1000.0, 3),
+            "changed": changed,
+        })
+        self.logger.info("{} {} ({} bytes, serialised in {:.1f}ms)".format(
+            "Wrote" if changed else "Unchanged", config_file, len(text), serialise_time * 1000.0))
+
+    @property
+    def index(self):
+        """The DocumentIndex for the current configuration document."""
+        if self._index is None or self._index.document is not self.config:
+            self._index = DocumentIndex(self.config)
+        return self._index
+
+    def _append(self, parent, child):
+        """Append CHILD to PARENT, keeping the index up to date."""
+        parent.appendChild(child)
+        self.index.add(child)
+        return child
+
+    def _get_subsystem(self, namespace):
+        """The subsystem element for NAMESPACE, via the index"""
+        ss = self.index.subsystem(namespace)
+        if not ss:
+            self.logger.error("couldn't find correct subsystem element for {}".format(namespace))
+        return ss
+
+    def _get_element(self, tag):
+        """The first TAG element in the document, via the index"""
+        elem = self.index.element(tag)
+        if not elem:
+            self.logger.error("couldn't find correct {} element".format(tag))
+        return elem
 
     def _get_tag_by_attr(self, tag, attr, val):
         """Convenience method for getting a tag via an attribute value"""
-        for elem in self.config.getElementsByTagName(tag):
+        if tag == "subsystem" and attr == "xmlns":
+            return self._get_subsystem(val)
+        if isinstance(self.config, SubsystemDocument):
+            candidates = self.config.getElementsByAttribute(tag, attr, val)
+        else:
+            candidates = self.config.getElementsByTagName(tag)
+        for elem in candidates:
             if elem.getAttribute(attr) == val:
                 return elem
         self.logger.error("couldn't find correct {} element".format(tag))
         return
 
-    def generate_datasource(self, pool_name="", jndi_name="", username="", password="", host="", port="", database="", checker="", sorter="", driver="", service_name="", orig_service_name="", datasource_jta="", NON_XA_DATASOURCE="", tx_isolation="", min_pool_size="", max_pool_size=""):
+    def generate_datasource(self, pool_name="", jndi_name="", username="", password="", host="", port="", database="", checker="", sorter="", driver="", service_name="", orig_service_name="", datasource_jta="", NON_XA_DATASOURCE="", tx_isolation="", pool=None, tuning=None):
         createElement = self.config.createElement
         createTextNode = self.config.createTextNode
 
-        if driver in ["postgres", "mysql"]:
+        if driver in ["postgresql", "mysql"]:
             if NON_XA_DATASOURCE == True:
                 ds = createElement('datasource')
-                ds.setAttribute('jta', jta)
+                ds.setAttribute('jta', "true" if datasource_jta else "false")
                 ds.setAttribute('jndi-name', jndi_name)
                 ds.setAttribute('pool-name', pool_name)
                 ds.setAttribute('use-java-context', "true")
@@ -98,23 +976,10 @@ class Run(Module):
                 ti.appendChild(createTextNode(tx_isolation))
                 ds.appendChild(ti)
 
-            if min_pool_size or max_pool_size:
-                if NON_XA_DATASOURCE:
-                    pool = createElement('pool')
-                else:
-                    pool = createElement('xa-pool')
-
-                if min_pool_size:
-                    mps = createElement('min-pool-size')
-                    mps.appendChild(createTextNode(min_pool_size))
-                    ds.appendChild(mps)
-
-                if max_pool_size:
-                    mps = createElement('max-pool-size')
-                    mps.appendChild(createTextNode(max_pool_size))
-                    ds.appendChild(mps)
-
-                ds.appendChild(pool)
+            tuning = tuning or {}
+            if pool or tuning.get("flush_strategy"):
+                ds.appendChild(self.generate_pool(pool or {}, xa=not NON_XA_DATASOURCE,
+                                                  flush_strategy=tuning.get("flush_strategy")))
 
             s = createElement('security')
             u = createElement('user-name')
@@ -126,21 +991,35 @@ class Run(Module):
             ds.appendChild(s)
 
             v = createElement('validation')
-            vom = createElement('validate-on-match')
-            vom.appendChild(createTextNode('true'))
-            v.appendChild(vom)
             vcc = createElement('valid-connection-checker')
             vcc.setAttribute('class-name', checker)
             v.appendChild(vcc)
+            v.appendChild(self._element('validate-on-match', "true" if tuning.get("validate_on_match", True) else "false"))
+            if tuning.get("background_validation_millis"):
+                v.appendChild(self._element('background-validation', "true"))
+                v.appendChild(self._element('background-validation-millis', str(tuning["background_validation_millis"])))
+            if "use_fast_fail" in tuning:
+                v.appendChild(self._element('use-fast-fail', "true" if tuning["use_fast_fail"] else "false"))
             es = createElement('exception-sorter')
             es.setAttribute('class-name', sorter)
             v.appendChild(es)
             ds.appendChild(v)
 
+            if tuning.get("idle_timeout_minutes"):
+                t = createElement('timeout')
+                t.appendChild(self._element('idle-timeout-minutes', str(tuning["idle_timeout_minutes"])))
+                ds.appendChild(t)
+
+            if tuning.get("ps_cache_size"):
+                st = createElement('statement')
+                st.appendChild(self._element('prepared-statement-cache-size', str(tuning["ps_cache_size"])))
+                st.appendChild(self._element('share-prepared-statements', "true" if tuning.get("share_prepared_statements") else "false"))
+                ds.appendChild(st)
+
         else:
             driver = "hsql"
-            jndi_name = os.getenv("DB_JNDI", "java:jboss/datasources/ExampleDS")
-            pool_name = os.getenv("DB_POOL", "ExampleDS")
+            jndi_name = self.env.get("DB_JNDI", "java:jboss/datasources/ExampleDS")
+            pool_name = self.env.get("DB_POOL", "ExampleDS")
             service_name = "ExampleDS"
 
             ds = createElement('datasource')
@@ -163,17 +1042,62 @@ class Run(Module):
             p.appendChild(createTextNode('sa'))
             s.appendChild(p)
 
-        if os.getenv("TIMER_SERVICE_DATA_STORE", "") == service_name:
+        if self.env.get("TIMER_SERVICE_DATA_STORE", "") == service_name:
             datastores = self.inject_timer_service("{}_ds".format(pool_name))
             if datastores:
-                datastores.appendChild(self.inject_datastore(pool_name, jndi_name, driver))
+                self._append(datastores, self.inject_datastore(pool_name, jndi_name, driver))
 
-        if os.getenv("DEFAULT_JOB_REPOSITORY", "") == service_name:
+        if self.env.get("DEFAULT_JOB_REPOSITORY", "") == service_name:
             self.inject_default_job_repository(pool_name)
             self.inject_job_repository(pool_name)
 
         return ds
 
+    def generate_pool(self, sizes, xa=False, flush_strategy=None):
+        """
+        A <pool> (or <xa-pool>) element for the PoolSizing sizes and the
+        flush strategy, its children in the order the datasources schema
+        requires.
+        """
+        pool = self._element('xa-pool' if xa else 'pool')
+        for tag, key in [('min-pool-size', 'min'), ('initial-pool-size', 'initial'),
+                         ('max-pool-size', 'max'), ('prefill', 'prefill')]:
+            value = sizes.get(key)
+            if value is not None and value != "":
+                pool.appendChild(self._element(tag, str(value).lower()))
+        if flush_strategy:
+            pool.appendChild(self._element('flush-strategy', flush_strategy))
+        return pool
+
+    def datasource_tuning(self, settings, driver):
+        """
+        The statement cache, validation, idle timeout and flush strategy of
+        a datasource: the DATASOURCE_TUNING defaults for DRIVER, each
+        overridden by its [NAME]_[DATABASE_TYPE]_ variable in SETTINGS.
+
+          PS_CACHE_SIZE                 prepared statements cached per connection, 0 for none
+          SHARE_PREPARED_STATEMENTS     share cached statements within a connection (true)
+          BACKGROUND_VALIDATION_MILLIS  validation interval, 0 to validate on every checkout
+          VALIDATE_ON_MATCH             validate on checkout (only without background validation)
+          USE_FAST_FAIL                 fail an allocation on the first invalid connection (true)
+          IDLE_TIMEOUT                  minutes before an idle connection above min is closed, 0 never
+          FLUSH_STRATEGY                what to close after a connection error (IdleConnections)
+        """
+        defaults = DATASOURCE_TUNING.get(driver, {})
+        tuning = OrderedDict()
+        tuning["ps_cache_size"] = settings.integer("PS_CACHE_SIZE", defaults.get("PS_CACHE_SIZE", 0))
+        tuning["share_prepared_statements"] = settings.boolean("SHARE_PREPARED_STATEMENTS", True)
+        tuning["background_validation_millis"] = settings.integer("BACKGROUND_VALIDATION_MILLIS",
+                                                                  defaults.get("BACKGROUND_VALIDATION_MILLIS", 0))
+        tuning["validate_on_match"] = settings.boolean("VALIDATE_ON_MATCH", not tuning["background_validation_millis"])
+        tuning["use_fast_fail"] = settings.boolean("USE_FAST_FAIL", True)
+        tuning["idle_timeout_minutes"] = settings.integer("IDLE_TIMEOUT", defaults.get("IDLE_TIMEOUT", 0))
+        tuning["flush_strategy"] = settings.get("FLUSH_STRATEGY", "IdleConnections")
+        if tuning["flush_strategy"] not in FLUSH_STRATEGIES:
+            raise InvalidSetting(settings.name("FLUSH_STRATEGY"), tuning["flush_strategy"],
+                                 "one of {}".format(", ".join(FLUSH_STRATEGIES)))
+        return tuning
+
     def inject_timer_service(self, arg):
         ts = self.config.createElement("timer-service")
         ts.setAttribute('thread-pool-name', 'default')
@@ -189,9 +1113,9 @@ class Run(Module):
 
         ds.appendChild(fds)
 
-        ss = self._get_tag_by_attr("subsystem", "xmlns", "urn:jboss:domain:ejb3:4.0")
+        ss = self._get_subsystem("urn:jboss:domain:ejb3:4.0")
         if ss:
-            ss.appendChild(ts)
+            self._append(ss, ts)
             return ts
         return
 
@@ -204,14 +1128,14 @@ class Run(Module):
         return dds
 
     def inject_default_job_repository(self, name):
-        ss = self._get_tag_by_attr("subsystem", "xmlns", "urn:jboss:domain:batch-jberet:1.0")
+        ss = self._get_subsystem("urn:jboss:domain:batch-jberet:1.0")
         if ss:
             djr = self.config.createElement('default-job-repository')
             djr.setAttribute('name', name)
-            ss.appendChild(djr)
+            self._append(ss, djr)
 
     def inject_job_repository(self, name):
-        ss = self._get_tag_by_attr("subsystem", "xmlns", "urn:jboss:domain:batch-jberet:1.0")
+        ss = self._get_subsystem("urn:jboss:domain:batch-jberet:1.0")
         if ss:
             jobrepo = self.config.createElement('job-repository')
             jobrepo.setAttribute('name', name)
@@ -219,19 +1143,19 @@ class Run(Module):
             jdbc.setAttribute('data-source', name)
             jobrepo.appendChild(jdbc)
 
-            ss.appendChild(jobrepo)
+            self._append(ss, jobrepo)
 
     def inject_datasources(self):
 
-        db_backends = filter(None, os.getenv("DB_SERVICE_PREFIX_MAPPING", "").split(","))
+        db_backends = self.env.list("DB_SERVICE_PREFIX_MAPPING")
 
-        if "TIMER_SERVICE_DATA_STORE" not in os.environ:
+        if "TIMER_SERVICE_DATA_STORE" not in self.env:
             self.inject_timer_service("default-file-store")
 
-        if "DEFAULT_JOB_REPOSITORY" not in os.environ:
+        if "DEFAULT_JOB_REPOSITORY" not in self.env:
             self.inject_default_job_repository("in-memory")
 
-        defaultDatasourceJndi=os.getenv("DEFAULT_DATASOURCE", "")
+        defaultDatasourceJndi=self.env.get("DEFAULT_DATASOURCE", "")
 
         datasources = []
 
@@ -257,8 +1181,11 @@ class Run(Module):
                         self.logger.error( "WARNING! The datasource for {} service WILL NOT be configured.".format(prefix))
                         continue
 
-                host = os.getenv("{}_SERVICE_HOST".format(service))
-                port = os.getenv("{}_SERVICE_PORT".format(service))
+                service_env = self.env.group(service)
+                settings = self.env.group(prefix)
+
+                host = service_env.get("SERVICE_HOST")
+                port = service_env.get("SERVICE_PORT")
 
                 if not (host or port):
                     self.logger.error( "There is a problem with your service configuration!")
@@ -275,16 +1202,16 @@ class Run(Module):
                     continue
 
                 # Custom JNDI environment variable name format: [NAME]_[DATABASE_TYPE]_JNDI
-                jndi_name = os.getenv("{}_JNDI".format(prefix), "java:jboss/datasources/{}".format(service.lower()))
+                jndi_name = settings.get("JNDI", "java:jboss/datasources/{}".format(service.lower()))
 
                 # Database username environment variable name format: [NAME]_[DATABASE_TYPE]_USERNAME
-                username = os.getenv("{}_USERNAME".format(prefix))
+                username = settings.get("USERNAME")
 
                 # Database password environment variable name format: [NAME]_[DATABASE_TYPE]_PASSWORD
-                password = os.getenv("{}_PASSWORD".format(prefix))
+                password = settings.get("PASSWORD")
 
                 # Database name environment variable name format: [NAME]_[DATABASE_TYPE]_DATABASE
-                database = os.getenv("{}_DATABASE".format(prefix))
+                database = settings.get("DATABASE")
 
                 if not all([jndi_name, username, password, database]):
                     self.logger.error( "Ooops, there is a problem with the {} datasource!".format(db.lower()))
@@ -300,19 +1227,37 @@ class Run(Module):
                     continue
 
                 # Transaction isolation level environment variable name format: [NAME]_[DATABASE_TYPE]_TX_ISOLATION
-                tx_isolation = os.getenv("{}_TX_ISOLATION".format(prefix))
+                tx_isolation = settings.get("TX_ISOLATION")
+
+                try:
+                    service_env.port("SERVICE_PORT")
 
-                # min pool size environment variable name format: [NAME]_[DATABASE_TYPE]_MIN_POOL_SIZE
-                min_pool_size = os.getenv("{}_MIN_POOL_SIZE".format(prefix))
+                    # pool sizes, see PoolSizing for the policy and its overrides:
+                    # [NAME]_[DATABASE_TYPE]_{MIN,INITIAL,MAX}_POOL_SIZE, _PREFILL, _CONNECTION_BUDGET
+                    processors, threads = self.thread_pools()
+                    sizing = PoolSizing(settings, self.env, processors, threads)
+                    pool = sizing.sizes()
+                    share = sizing.share()
 
-                # max pool size environment variable name format: [NAME]_[DATABASE_TYPE]_MAX_POOL_SIZE
-                max_pool_size = os.getenv("{}_MAX_POOL_SIZE".format(prefix))
+                    # statement cache, validation, idle timeout and flush strategy,
+                    # see datasource_tuning: [NAME]_[DATABASE_TYPE]_PS_CACHE_SIZE, ...
+                    tuning = self.datasource_tuning(settings, db.lower())
 
-                # jta environment variable name format: [NAME]_[DATABASE_TYPE]_JTA
-                jta = os.getenv("{}_JTA".format(prefix), "true")
+                    # jta environment variable name format: [NAME]_[DATABASE_TYPE]_JTA
+                    jta = settings.boolean("JTA", True)
+
+                    # $NON_XA_DATASOURCE: [NAME]_[DATABASE_TYPE]_NONXA (DB_NONXA)
+                    NON_XA_DATASOURCE = settings.boolean("NONXA", False)
+
+                except InvalidSetting as e:
+                    self.logger.error( "Ooops, there is a problem with the {} datasource!".format(db.lower()))
+                    self.logger.error(str(e))
+                    self.logger.error("")
+                    self.logger.error( "WARNING! The {} datasource for {} service WILL NOT be configured.".format(db.lower(), prefix))
+                    continue
 
-                # $NON_XA_DATASOURCE: [NAME]_[DATABASE_TYPE]_NONXA (DB_NONXA)
-                NON_XA_DATASOURCE = os.getenv("{}_NONXA".format(prefix), "false")
+                if share is not None and pool["max"] > share:
+                    self.logger.error( "WARNING! The {} pool of {} connections is larger than this pod's share of the connection budget ({}), the database may run out of connections when the deployment scales out.".format(prefix, pool["max"], share))
 
                 if db == "MYSQL":
                     driver="mysql"
@@ -353,8 +1298,8 @@ class Run(Module):
                     datasource_jta=jta,
                     NON_XA_DATASOURCE=NON_XA_DATASOURCE,
                     tx_isolation=tx_isolation,
-                    min_pool_size=min_pool_size,
-                    max_pool_size=max_pool_size
+                    pool=pool,
+                    tuning=tuning
                 ))
 
                 if not defaultDatasourceJndi:
@@ -363,27 +1308,61 @@ class Run(Module):
         datasources.append(self.inject_tx_datasource())
 
         if defaultDatasourceJndi:
-            db = self.config.getElementsByTagName("default-bindings")[0]
+            db = self._get_element("default-bindings")
             db.setAttribute("datasource", defaultDatasourceJndi)
 
-        ds = self.config.getElementsByTagName("datasources")[0]
+        ds = self._get_element("datasources")
         for source in datasources:
             if source:
-                ds.appendChild(source)
+                self._append(ds, source)
 
         # stuff from tx-datasource.sh
     # XXX: this is VERY similar to stuff in inject_datasources, lots of opportunity for common
     def inject_tx_datasource(self):
-        tx_backend = os.getenv("TX_DATABASE_PREFIX_MAPPING", "")
+        """
+        The transaction object store, chosen by TX_OBJECT_STORE:
+
+          file     the default file store, unless TX_DATABASE_PREFIX_MAPPING is set
+          journal  the ActiveMQ journal (use-journal-store), asynchronous IO
+                   with TX_JOURNAL_ASYNC_IO=true
+          jdbc     a jdbc-store on the ObjectStore datasource for the
+                   TX_DATABASE_PREFIX_MAPPING service, the default with a mapping
 
-        if tx_backend:
+        Returns the ObjectStore datasource for the jdbc store.
+        """
+        tx_backend = self.env.get("TX_DATABASE_PREFIX_MAPPING", "")
+
+        store = self.env.get("TX_OBJECT_STORE", "jdbc" if tx_backend else "file").lower()
+        if store not in TX_OBJECT_STORES:
+            self.logger.error(str(InvalidSetting("TX_OBJECT_STORE", store, "one of {}".format(", ".join(TX_OBJECT_STORES)))))
+            self.logger.error("WARNING! The transactions subsystem will use the default file store.")
+            return
+
+        if store == "journal":
+            try:
+                async_io = self.env.boolean("TX_JOURNAL_ASYNC_IO", False)
+            except InvalidSetting as e:
+                self.logger.error(str(e))
+                async_io = False
+            self.inject_journal_store(async_io)
+            return
+
+        if store == "jdbc" and not tx_backend:
+            self.logger.error("TX_OBJECT_STORE is jdbc but TX_DATABASE_PREFIX_MAPPING is not set.")
+            self.logger.error("WARNING! The transactions subsystem will use the default file store.")
+            return
+
+        if store == "jdbc":
             service_name = '='.join(tx_backend.split('=')[:-1]) # XXX double check this one
             service = service_name.upper().replace('-','_')
             db = service.split('_')[-1]
             prefix = '='.join(tx_backend.split('=')[1:])
 
-            host = os.getenv("{}_SERVICE_HOST".format(service), "")
-            port = os.getenv("{}_SERVICE_PORT".format(service), "")
+            service_env = self.env.group(service)
+            settings = self.env.group(prefix)
+
+            host = service_env.get("SERVICE_HOST", "")
+            port = service_env.get("SERVICE_PORT", "")
 
             if not host or not port:
                 self.logger.error("There is a problem with your service configuration!")
@@ -396,16 +1375,16 @@ class Run(Module):
                 return
 
             # Custom JNDI environment variable name format: [NAME]_[DATABASE_TYPE]_JNDI appended by ObjectStore
-            jndi_name = os.getenv("{}_JNDI".format(prefix), "java:jboss/datasources/{}".format(service.lower()))
+            jndi_name = settings.get("JNDI", "java:jboss/datasources/{}".format(service.lower()))
 
             # Database username environment variable name format: [NAME]_[DATABASE_TYPE]_USERNAME
-            username = os.getenv("{}_USERNAME".format(prefix))
+            username = settings.get("USERNAME")
 
             # Database password environment variable name format: [NAME]_[DATABASE_TYPE]_PASSWORD
-            password = os.getenv("{}_PASSWORD".format(prefix))
+            password = settings.get("PASSWORD")
 
             # Database name environment variable name format: [NAME]_[DATABASE_TYPE]_DATABASE
-            database = os.getenv("{}_DATABASE".format(prefix))
+            database = settings.get("DATABASE")
 
             if not all([jndi_name, username, password, database]):
                 self.logger.error( "Ooops, there is a problem with the {} datasource!".format(db.lower()))
@@ -421,30 +1400,37 @@ class Run(Module):
                 db="ignore"
 
             # Transaction isolation level environment variable name format: [NAME]_[DATABASE_TYPE]_TX_ISOLATION
-            tx_isolation = os.getenv("{}_TX_ISOLATION".format(prefix))
+            tx_isolation = settings.get("TX_ISOLATION")
+
+            try:
+                # pool sizes, see PoolSizing: [NAME]_[DATABASE_TYPE]_{MIN,INITIAL,MAX}_POOL_SIZE, ...
+                processors, threads = self.thread_pools()
+                pool = PoolSizing(settings, self.env, processors, threads).sizes()
 
-            # min pool size environment variable name format: [NAME]_[DATABASE_TYPE]_MIN_POOL_SIZE
-            min_pool_size = os.getenv("{}_MIN_POOL_SIZE".format(prefix))
+                # table prefixes, see tx_table_prefixes: [NAME]_[DATABASE_TYPE]_TABLE_PREFIX, ...
+                table_prefixes = self.tx_table_prefixes(settings)
 
-            # max pool size environment variable name format: [NAME]_[DATABASE_TYPE]_MAX_POOL_SIZE
-            max_pool_size = os.getenv("{}_MAX_POOL_SIZE".format(prefix))
+            except InvalidSetting as e:
+                self.logger.error(str(e))
+                self.logger.error("WARNING! The {} datasource for {} service WILL NOT be configured.".format(db.lower(),prefix))
+                return
 
             if db == "MYSQL":
                 driver = "mysql"
-                datasource = self.generate_tx_datasource(service.lower(), jndi_name, username, password, host, port, database, driver)
-                self.inject_jdbc_store(jndi_name)
+                datasource = self.generate_tx_datasource(service.lower(), jndi_name, username, password, host, port, database, driver, tx_isolation, pool)
+                self.inject_jdbc_store(jndi_name, table_prefixes)
 
             elif db == "POSTGRESQL":
                 driver = "postgresql"
-                datasource = self.generate_tx_datasource(service.lower(), jndi_name, username, password, host, port, database, driver)
-                self.inject_jdbc_store(jndi_name)
+                datasource = self.generate_tx_datasource(service.lower(), jndi_name, username, password, host, port, database, driver, tx_isolation, pool)
+                self.inject_jdbc_store(jndi_name, table_prefixes)
 
             else:
                 datasource = ""
 
             return datasource
 
-    def generate_tx_datasource(self, service_name, jndi_name, username, password, host, port, database):
+    def generate_tx_datasource(self, service_name, jndi_name, username, password, host, port, database, driver, tx_isolation="", pool=None):
         createElement = self.config.createElement
         createTextNode = self.config.createTextNode
 
@@ -467,20 +1453,8 @@ class Run(Module):
             ti.appendChild(createTextNode(tx_isolation))
             ds.appendChild(ti)
 
-            if min_pool_size or max_pool_size:
-                pool = createElement('pool')
-
-                if min_pool_size:
-                    mps = createElement('min-pool-size')
-                    mps.appendChild(createTextNode(min_pool_size))
-                    ds.appendChild(mps)
-
-                if max_pool_size:
-                    mps = createElement('max-pool-size')
-                    mps.appendChild(createTextNode(max_pool_size))
-                    ds.appendChild(mps)
-
-                ds.appendChild(pool)
+        if pool:
+            ds.appendChild(self.generate_pool(pool))
 
         s = createElement('security')
         u = createElement('user-name')
@@ -493,10 +1467,1114 @@ class Run(Module):
 
         return ds
 
-    def inject_jdbc_store(self, jndi_name):
-        js = self.config.createElement('jdbc-store')
-        js.setAttribute('datasource-jndi-name', "{}ObjectStore".format(jndi_name))
+    def tx_table_prefixes(self, settings):
+        """
+        The table prefix of each jdbc-store store: [NAME]_[DATABASE_TYPE]_TABLE_PREFIX,
+        or _ACTION_TABLE_PREFIX, _COMMUNICATION_TABLE_PREFIX and _STATE_TABLE_PREFIX
+        for one store. With _TABLE_PREFIX_PER_POD=true the prefixes start with
+        the pod name, so pods sharing the database write to their own tables;
+        the pod name has to be stable (a StatefulSet) for recovery to find
+        the records of a previous run.
+        """
+        prefixes = OrderedDict()
+        default = settings.get("TABLE_PREFIX", "")
+        pod = ""
+        if settings.boolean("TABLE_PREFIX_PER_POD", False):
+            pod = re.sub(r"\W", "_", self.env.get("NODE_NAME") or self.env.get("HOSTNAME") or socket.gethostname())
+        for store in TX_JDBC_STORES:
+            prefix = pod + settings.get("{}_TABLE_PREFIX".format(store.upper()), default)
+            if prefix:
+                prefixes[store] = prefix
+        return prefixes
+
+    def inject_jdbc_store(self, jndi_name, table_prefixes={}):
+        js = self._element('jdbc-store', datasource_jndi_name="{}ObjectStore".format(jndi_name))
+        for store, prefix in table_prefixes.items():
+            js.appendChild(self._element(store, table_prefix=prefix))
+        self._inject_object_store(js)
+
+    def inject_journal_store(self, async_io=False):
+        attrs = {"enable_async_io": "true"} if async_io else {}
+        self._inject_object_store(self._element('use-journal-store', **attrs))
+
+    def _inject_object_store(self, store):
+        ss = self._get_subsystem("urn:jboss:domain:transactions:3.0")
+        if ss and not self._replace_placeholder(ss, "JDBC_STORE", [store]):
+            self._append(ss, store)
+
+    def _getenv_compat(self, names, default=""):
+        """The first of NAMES that is set and not empty, for renamed variables"""
+        for name in names:
+            value = self.env.get(name)
+            if value:
+                return value
+        return default
+
+    # stuff from messaging.sh
+    def configure_mq_destinations(self):
+        """The (kind, name) of every destination for the embedded broker."""
+        queues = self.env.list("MQ_QUEUES") or self.env.list("HORNETQ_QUEUES")
+        topics = self.env.list("MQ_TOPICS") or self.env.list("HORNETQ_TOPICS")
+        return [("queue", queue) for queue in queues] + [("topic", topic) for topic in topics]
+
+    def configure_mq_address_settings(self, sizes):
+        """
+        An address-setting for each destination with its own paging limits,
+        MQ_QUEUE_<NAME>_ or MQ_TOPIC_<NAME>_ MAX_SIZE_BYTES, PAGE_SIZE_BYTES
+        and ADDRESS_FULL_POLICY; the rest comes from SIZES, the defaults
+        for every address.
+        """
+        address_settings = []
+        for kind, name in self.mq_destinations:
+            settings = self.env.group(re.sub(r"[-.]", "_", "MQ_{}_{}".format(kind.upper(), name.upper())))
+            if not any(settings.get(key) for key in ["MAX_SIZE_BYTES", "PAGE_SIZE_BYTES", "ADDRESS_FULL_POLICY"]):
+                continue
+            overrides = Overrides(settings)
+            max_size = overrides.override("integer", "MAX_SIZE_BYTES", sizes["MQ_MAX_SIZE_BYTES"], minimum=-1)
+            page_size = overrides.override("integer", "PAGE_SIZE_BYTES", sizes["MQ_PAGE_SIZE_BYTES"], minimum=1)
+            policy = overrides.choice("ADDRESS_FULL_POLICY", MessagingSizing.ADDRESS_FULL_POLICIES,
+                                      sizes["MQ_ADDRESS_FULL_POLICY"])
+            for e in overrides.errors:
+                self.logger.error(str(e))
+                self.logger.error("WARNING! The {} {} will use the default {}.".format(kind, name, e.name))
+            address_settings.append(
+                '<address-setting name={} dead-letter-address="jms.queue.DLQ" expiry-address="jms.queue.ExpiryQueue" '
+                'max-size-bytes="{}" page-size-bytes="{}" address-full-policy="{}" '
+                'message-counter-history-day-limit="10" redistribution-delay="1000"/>'.format(
+                    quoteattr("jms.{}.{}".format(kind, name)), max_size, page_size, policy))
+        return "\n        ".join(address_settings)
+
+    def configure_mq_cluster_password(self):
+        password = self._getenv_compat(["MQ_CLUSTER_PASSWORD", "HORNETQ_CLUSTER_PASSWORD"])
+        if password:
+            self.launch_envs["JBOSS_MESSAGING_ARGS"] += " -Djboss.messaging.cluster.password={}".format(password)
+
+    def configure_mq(self, cgroup_root=None):
+        """
+        Configure the embedded broker unless a remote one was found by
+        inject_brokers. The journal, paging and batching settings are
+        filled in here, see MessagingSizing for the policy and its
+        overrides. The destinations are added by inject_messaging, the
+        <!-- ##DESTINATIONS## --> placeholder marks where they go.
+        """
+        if not self.amq:
+            self.configure_mq_cluster_password()
+
+            activemq_subsystem_file = "{}/bin/launch/activemq-subsystem.xml".format(self.env.get("JBOSS_HOME"))
+            with open(activemq_subsystem_file, "r") as fh:
+                activemq_subsystem = fh.read()
+            self.mq_destinations = self.configure_mq_destinations()
+
+            sizing = MessagingSizing(self.cgroup_limits(cgroup_root), self.env)
+            sizes = sizing.sizes()
+            for e in sizing.errors:
+                self.logger.error(str(e))
+                self.logger.error("WARNING! The embedded broker will be configured with the default {}.".format(e.name))
+            sizes["MQ_ADDRESS_SETTINGS"] = self.configure_mq_address_settings(sizes)
+            activemq_subsystem = PLACEHOLDER_RE.sub(
+                lambda match: str(sizes.get(match.group(1) or match.group(2), match.group(0))), activemq_subsystem)
+
+            self.set_placeholder("MESSAGING_SUBSYSTEM_CONFIG", activemq_subsystem.rstrip("\n"))
+            self.set_placeholder("MESSAGING_PORTS", MESSAGING_PORTS)
+
+    def _element(self, tag, text=None, **attrs):
+        elem = self.config.createElement(tag)
+        for name, value in sorted(attrs.items()):
+            elem.setAttribute(name.replace("_", "-"), value)
+        if text is not None:
+            elem.appendChild(self.config.createTextNode(text))
+        return elem
+
+    def _replace_placeholder(self, parent, name, nodes):
+        """
+        Put NODES in place of the <!-- ##NAME## --> comment among the
+        children of PARENT. This is a single splice of the child list, as
+        minidom's insertBefore looks up its reference node every time and
+        would make adding many elements quadratic.
+
+        Returns False if PARENT has no such placeholder.
+        """
+        children = parent.childNodes
+        marker = "##{}##".format(name)
+        for position, placeholder in enumerate(children):
+            if placeholder.nodeType == placeholder.COMMENT_NODE and placeholder.data.strip() == marker:
+                break
+        else:
+            return False
+
+        previous = placeholder.previousSibling
+        following = placeholder.nextSibling
+        for node in nodes:
+            node.parentNode = parent
+            node.previousSibling = previous
+            if previous is not None:
+                previous.nextSibling = node
+            previous = node
+        if previous is not None:
+            previous.nextSibling = following
+        if following is not None:
+            following.previousSibling = previous
+        children[position:position + 1] = nodes
+        placeholder.parentNode = placeholder.previousSibling = placeholder.nextSibling = None
+
+        for node in nodes:
+            self.index.add(node)
+        return True
+
+    def generate_destination(self, kind, name):
+        return self._element("jms-{}".format(kind), name=name, entries="/{}/{}".format(kind, name))
+
+    def generate_object_config(self, physical, jndi_name, class_name):
+        self.logger.debug("generating object config for {}".format(physical))
+        ao = self._element("admin-object", class_name=class_name, jndi_name=jndi_name, use_java_context="true", pool_name=physical)
+        cp = self._element("config-property", physical, name="PhysicalName")
+        ao.appendChild(cp)
+        return ao
+
+    def broker_options(self, settings):
+        """
+        Connection pool, consumer and reconnect options of a remote broker,
+        from its [NAME]_[BROKER_TYPE]_ variables in SETTINGS:
+
+          MIN_POOL_SIZE, MAX_POOL_SIZE, PREFILL  connection pool (1, 20, false)
+          MDB_MAX_SESSIONS                       exported as the <service>.maxSessions system
+                                                 property, with annotation property replacement
+                                                 enabled, so that an MDB can take it with
+                                                 @ActivationConfigProperty(propertyName="maxSessions",
+                                                 propertyValue="${<service>.maxSessions}") or
+                                                 the same in jboss-ejb3.xml; the ActiveMQ 5
+                                                 resource adapter has no adapter-wide default
+          QUEUE_PREFETCH, TOPIC_PREFETCH         messages pushed to each consumer ahead of time
+          RECONNECT_INITIAL_DELAY, RECONNECT_MAX_DELAY (ms), RECONNECT_BACKOFF_MULTIPLIER,
+          RECONNECT_MAX_ATTEMPTS                 any of these connects through the failover
+                                                 transport, which reconnects with backoff
+        """
+        options = OrderedDict()
+        options["min_pool_size"] = settings.integer("MIN_POOL_SIZE", 1)
+        options["max_pool_size"] = settings.integer("MAX_POOL_SIZE", max(20, options["min_pool_size"]), minimum=1)
+        if options["min_pool_size"] > options["max_pool_size"]:
+            raise InvalidSetting(settings.name("MIN_POOL_SIZE"), options["min_pool_size"],
+                                 "at most {} ({})".format(options["max_pool_size"], settings.name("MAX_POOL_SIZE")))
+        options["prefill"] = settings.boolean("PREFILL", False)
+        options["mdb_max_sessions"] = settings.integer("MDB_MAX_SESSIONS", minimum=1)
+
+        options["jms"] = OrderedDict([("jms.rmIdFromConnectionId", "true")])
+        for key, param in [("QUEUE_PREFETCH", "jms.prefetchPolicy.queuePrefetch"),
+                           ("TOPIC_PREFETCH", "jms.prefetchPolicy.topicPrefetch")]:
+            value = settings.integer(key)
+            if value is not None:
+                options["jms"][param] = value
+
+        options["failover"] = OrderedDict()
+        for key, param in [("RECONNECT_INITIAL_DELAY", "initialReconnectDelay"),
+                           ("RECONNECT_MAX_DELAY", "maxReconnectDelay"),
+                           ("RECONNECT_MAX_ATTEMPTS", "maxReconnectAttempts")]:
+            value = settings.integer(key, minimum=-1 if key == "RECONNECT_MAX_ATTEMPTS" else 0)
+            if value is not None:
+                options["failover"][param] = value
+        multiplier = settings.number("RECONNECT_BACKOFF_MULTIPLIER", minimum=1)
+        if multiplier is not None:
+            options["failover"]["useExponentialBackOff"] = "true" if multiplier > 1 else "false"
+            options["failover"]["backOffMultiplier"] = multiplier
+        return options
+
+    def broker_url(self, host, port, options):
+        """The ServerUrl for a broker, through the failover transport if asked to reconnect."""
+        url = "tcp://{}:{}".format(host, port)
+        params = list(options["failover"].items()) + list(options["jms"].items())
+        if options["failover"]:
+            url = "failover:({})".format(url)
+        return "{}?{}".format(url, "&".join("{}={}".format(name, value) for name, value in params))
+
+    def generate_resource_adapter(self, service_name, jndi_name, username, password, protocol, host, port, prefix, archive, driver, queues, topics, options=None):
+        self.logger.info("Generating resource adapter configuration for service: {} ({})".format(service_name, driver))
+        if driver != "amq":
+            return None
+        options = options or self.broker_options(EnvironmentSnapshot({}))
+
+        ra = self._element("resource-adapter", id=archive)
+        ra.appendChild(self._element("archive", archive))
+        ra.appendChild(self._element("transaction-support", "XATransaction"))
+        for name, value in [("UserName", username), ("Password", password),
+                            ("ServerUrl", self.broker_url(host, port, options))]:
+            ra.appendChild(self._element("config-property", value, name=name))
+
+        cds = self._element("connection-definitions")
+        cd = self._element("connection-definition", class_name="org.apache.activemq.ra.ActiveMQManagedConnectionFactory",
+                           jndi_name=jndi_name, enabled="true", pool_name="{}-ConnectionFactory".format(service_name))
+        pool = self.generate_pool({"min": options["min_pool_size"], "max": options["max_pool_size"],
+                                   "prefill": options["prefill"]}, xa=True)
+        pool.appendChild(self._element("is-same-rm-override", "false"))
+        cd.appendChild(pool)
+        recovery = self._element("recovery")
+        credential = self._element("recover-credential")
+        credential.appendChild(self._element("user-name", username))
+        credential.appendChild(self._element("password", password))
+        recovery.appendChild(credential)
+        cd.appendChild(recovery)
+        cds.appendChild(cd)
+        ra.appendChild(cds)
+
+        # backwards-compatability flag per CLOUD-329
+        simple_def_phys_dest = self.env.get("MQ_SIMPLE_DEFAULT_PHYSICAL_DESTINATION", "").lower() == "true"
+
+        aos = self._element("admin-objects")
+        for kind, names, class_name in [("queue", queues, "org.apache.activemq.command.ActiveMQQueue"),
+                                        ("topic", topics, "org.apache.activemq.command.ActiveMQTopic")]:
+            for name in names:
+                settings = self.env.group(re.sub(r"[-.]", "_", "{}_{}_{}".format(prefix, kind.upper(), name.upper())))
+                if simple_def_phys_dest:
+                    physical = settings.get("PHYSICAL") or name
+                else:
+                    physical = settings.get("PHYSICAL") or "{}/{}".format(kind, name)
+                jndi = settings.get("JNDI") or "java:/{}/{}".format(kind, name)
+                aos.appendChild(self.generate_object_config(physical, jndi, class_name))
+        ra.appendChild(aos)
+        return ra
 
-        ss = self._get_tag_by_attr("subsystem", "xmlns", "urn:jboss:domain:transactions:3.0")
+    def inject_messaging(self):
+        """
+        Add the destinations of the embedded broker and the resource
+        adapters of the remote brokers recorded by configure_mq and
+        inject_brokers, each batch in a single pass over the document.
+        """
+        if self.mq_destinations is not None:
+            ss = self._get_subsystem("urn:jboss:domain:messaging-activemq:1.0")
+            if ss:
+                server = ss.getElementsByTagName("server")[0]
+                self._replace_placeholder(server, "DESTINATIONS",
+                                          [self.generate_destination(kind, name) for kind, name in self.mq_destinations])
+
+        ss = self._get_subsystem("urn:jboss:domain:resource-adapters:4.0")
         if ss:
-            ss.appendChild(js)
+            ras = [self.generate_resource_adapter(*args) for args in self.resource_adapters]
+            self._replace_placeholder(ss.getElementsByTagName("resource-adapters")[0], "RESOURCE_ADAPTERS",
+                                      [ra for ra in ras if ra is not None])
+
+    def inject_brokers(self):
+        """
+        Finds the name of the broker services and records the resource
+        adapters for inject_messaging to generate
+        """
+        brokers = self.env.list("MQ_SERVICE_PREFIX_MAPPING")
+
+        defaultJmsConnectionFactoryJndi = self.env.get("DEFAULT_JMS_CONNECTION_FACTORY", "")
+        property_replacement = False
+
+        self.amq = False
+        self.resource_adapters = []
+        if not brokers:
+            if not defaultJmsConnectionFactoryJndi:
+                defaultJmsConnectionFactoryJndi = "java:jboss/DefaultJMSConnectionFactory"
+        else:
+            for broker in brokers:
+
+                self.logger.info("Processing broker: {}".format(broker))
+
+                service_name = broker.rsplit('=', 1)[0]
+                service = service_name.upper().replace('-','_')
+                broker_type = service.split('_')[-1]
+                prefix = broker.split('=', 1)[-1]
+
+                settings = self.env.group(prefix)
+
+                # XXX: only tcp (openwire) is supported by EAP
+                # Protocol environment variable name format: [NAME]_[BROKER_TYPE]_PROTOCOL
+                protocol = settings.get("PROTOCOL") or "tcp"
+
+                if protocol == "openwire":
+                    protocol = "tcp"
+
+                if protocol != "tcp":
+                    self.logger.error("There is a problem with your service configuration!")
+                    self.logger.error("Only openwire (tcp) transports are supported.")
+                    continue
+
+                protocol_env = re.sub(r"[-+.]", "_", protocol).upper()
+                service_env = self.env.group("{}_{}".format(service, protocol_env))
+
+                host = service_env.get("SERVICE_HOST")
+                port = service_env.get("SERVICE_PORT")
+
+                if not host or not port:
+                    self.logger.error("There is a problem with your service configuration!")
+                    self.logger.error("You provided following MQ mapping (via MQ_SERVICE_PREFIX_MAPPING environment variable): {}. To configure resource adapters we expect {}_SERVICE_HOST and {}_SERVICE_PORT to be set.".format(broker, service, service))
+                    self.logger.error("")
+                    self.logger.error("Current values:")
+                    self.logger.error("")
+                    self.logger.error("{}_{}_SERVICE_HOST: {}".format(service, protocol_env, host))
+                    self.logger.error("{}_{}_SERVICE_PORT: {}".format(service, protocol_env, port))
+                    self.logger.error("")
+                    self.logger.error("Please make sure you provided correct service name and prefix in the mapping. Additionally please check that you do not set portalIP to None in the {} service. Headless services are not supported at this time.".format(service_name))
+                    self.logger.error("")
+                    self.logger.error("WARNING! The {} broker for {} service WILL NOT be configured.".format(broker_type.lower(), prefix))
+                    continue
+
+                # Custom JNDI environment variable name format: [NAME]_[BROKER_TYPE]_JNDI
+                jndi = settings.get("JNDI") or "java:/{}/ConnectionFactory".format(service_name)
+
+                # username environment variable name format: [NAME]_[BROKER_TYPE]_USERNAME
+                username = settings.get("USERNAME", "")
+
+                # password environment variable name format: [NAME]_[BROKER_TYPE]_PASSWORD
+                password = settings.get("PASSWORD", "")
+
+                # queues environment variable name format: [NAME]_[BROKER_TYPE]_QUEUES
+                queues = settings.list("QUEUES")
+
+                # topics environment variable name format: [NAME]_[BROKER_TYPE]_TOPICS
+                topics = settings.list("TOPICS")
+
+                driver = ""
+                archive = ""
+                if broker_type == "AMQ":
+                    driver = "amq"
+                    archive = "activemq-rar.rar"
+
+                try:
+                    options = self.broker_options(settings)
+                except InvalidSetting as e:
+                    self.logger.error("There is a problem with your service configuration!")
+                    self.logger.error(str(e))
+                    self.logger.error("WARNING! The {} broker for {} service WILL NOT be configured.".format(broker_type.lower(), prefix))
+                    continue
+
+                if options["mdb_max_sessions"]:
+                    self.launch_envs["JBOSS_MESSAGING_ARGS"] += " -D{}.maxSessions={}".format(service_name, options["mdb_max_sessions"])
+                    property_replacement = True
+
+                self.resource_adapters.append((service_name, jndi, username, password, protocol, host, port, prefix, archive, driver, queues, topics, options))
+
+                if not defaultJmsConnectionFactoryJndi:
+                    defaultJmsConnectionFactoryJndi = jndi
+
+            if self.resource_adapters:
+                self.amq = True
+                self.launch_envs["JBOSS_MESSAGING_ARGS"] += " -Dejb.resource-adapter-name=activemq-rar.rar"
+
+        defaultJms = ""
+        if defaultJmsConnectionFactoryJndi:
+            defaultJms = "jms-connection-factory={}".format(quoteattr(defaultJmsConnectionFactoryJndi))
+
+        self.set_placeholder("DEFAULT_JMS", defaultJms)
+        # the ee default leaves ${...} in annotations alone
+        self.set_placeholder("ANNOTATION_PROPERTY_REPLACEMENT",
+                             "<annotation-property-replacement>true</annotation-property-replacement>"
+                             if property_replacement else "")
+
+    # stuff from admin.sh
+    def configure_administration(self):
+        username = self._getenv_compat(["ADMIN_USERNAME", "EAP_ADMIN_USERNAME"], "eapadmin")
+        password = self._getenv_compat(["ADMIN_PASSWORD", "EAP_ADMIN_PASSWORD"])
+        if password:
+            self.add_management_user(username, password)
+
+    def add_management_user(self, username, password):
+        """
+        Equivalent of add-user.sh -u USERNAME -p PASSWORD: store the
+        ManagementRealm digest for the user, replacing any previous entry.
+        """
+        config_dir = os.path.dirname(self.get_config_file())
+        digest = hashlib.md5("{}:ManagementRealm:{}".format(username, password).encode("utf-8")).hexdigest()
+        for properties, value in [("mgmt-users.properties", digest), ("mgmt-groups.properties", "")]:
+            path = os.path.join(config_dir, properties)
+            lines = []
+            if os.path.exists(path):
+                with open(path, "r") as fh:
+                    lines = [line for line in fh if not line.startswith("{}=".format(username))]
+            lines.append("{}={}\n".format(username, value))
+            with open(path, "w") as fh:
+                fh.writelines(lines)
+        self.logger.info("Added user '{}' to file '{}'".format(username, os.path.join(config_dir, "mgmt-users.properties")))
+
+    # stuff from ha.sh
+    def view_pods_url(self, namespace):
+        """The Kubernetes API URL that lists the pods KUBE_PING would see."""
+        pods_url = "https://{}:{}/api/{}/namespaces/{}/pods".format(
+            self.env.get("KUBERNETES_SERVICE_HOST") or "kubernetes.default.svc",
+            self.env.get("KUBERNETES_SERVICE_PORT") or "443",
+            self.env.get("OPENSHIFT_KUBE_PING_API_VERSION") or "v1",
+            namespace)
+        labels = self.env.get("OPENSHIFT_KUBE_PING_LABELS")
+        if labels:
+            pods_url = "{}?{}".format(pods_url, urllib.urlencode({"labels": labels}))
+        return pods_url
+
+    def check_view_pods_permission(self):
+        """
+        Start checking in the background that the service account may view
+        pods, so that a slow API server does not hold up the rest of the
+        configuration; report_view_pods_permission logs the result.
+
+        The probe gives up after OPENSHIFT_KUBE_PING_PERMISSION_TIMEOUT
+        seconds. Definite answers are cached per URL and token in
+        OPENSHIFT_KUBE_PING_PERMISSION_CACHE (empty disables the cache).
+        """
+        self.pods_probe = None
+        namespace = self.env.get("OPENSHIFT_KUBE_PING_NAMESPACE")
+        if namespace is None:
+            self.logger.warning("WARNING: Environment variable OPENSHIFT_KUBE_PING_NAMESPACE undefined. Clustering will be unavailable. Please refer to the documentation for configuration.")
+            return
+
+        try:
+            timeout = self.env.integer("OPENSHIFT_KUBE_PING_PERMISSION_TIMEOUT", POD_VIEW_TIMEOUT, minimum=1)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            timeout = POD_VIEW_TIMEOUT
+
+        pods_url = self.view_pods_url(namespace)
+        probe = {"url": pods_url, "code": None, "thread": None, "key": None,
+                 "deadline": time.time() + timeout, "timeout": timeout}
+        self.pods_probe = probe
+        try:
+            with open(SERVICE_ACCOUNT_TOKEN, "r") as fh:
+                token = fh.read().strip()
+        except IOError as e:
+            self.logger.debug("Unable to read {}: {}".format(SERVICE_ACCOUNT_TOKEN, e))
+            probe["code"] = "000"
+            return
+
+        probe["key"] = hashlib.sha256("{}\0{}".format(pods_url, token)).hexdigest()
+        cached = self.load_view_pods_cache().get(probe["key"])
+        if cached:
+            self.logger.debug("Using the cached permission check for {}".format(pods_url))
+            probe["code"] = cached
+            return
+
+        probe["thread"] = threading.Thread(target=self._probe_view_pods_permission, args=(probe, token))
+        probe["thread"].daemon = True
+        probe["thread"].start()
+
+    def _probe_view_pods_permission(self, probe, token):
+        code = "000"
+        try:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+            request = urllib2.Request(probe["url"], headers={"Authorization": "Bearer {}".format(token)})
+            kwargs = {"context": context} if probe["url"].startswith("https:") else {}
+            code = str(urllib2.urlopen(request, timeout=probe["timeout"], **kwargs).getcode())
+        except urllib2.HTTPError as e:
+            code = str(e.code)
+        except (IOError, urllib2.URLError, socket.timeout) as e:
+            self.logger.debug("Unable to query {}: {}".format(probe["url"], e))
+        probe["code"] = code
+
+    def load_view_pods_cache(self):
+        path = self.env.get("OPENSHIFT_KUBE_PING_PERMISSION_CACHE", POD_VIEW_CACHE_FILE)
+        if not path or not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r") as fh:
+                return json.load(fh)
+        except (IOError, ValueError):
+            return {}
+
+    def save_view_pods_cache(self, key, code):
+        path = self.env.get("OPENSHIFT_KUBE_PING_PERMISSION_CACHE", POD_VIEW_CACHE_FILE)
+        if not path:
+            return
+        cache = self.load_view_pods_cache()
+        cache[key] = code
+        try:
+            with open("{}.tmp".format(path), "w") as fh:
+                json.dump(cache, fh)
+            os.rename("{}.tmp".format(path), path)
+        except (IOError, OSError) as e:
+            self.logger.debug("Unable to write {}: {}".format(path, e))
+
+    def report_view_pods_permission(self):
+        """Wait for the permission check, at most until its deadline, and log the result."""
+        probe = self.pods_probe
+        if probe is None:
+            return
+        thread = probe["thread"]
+        if thread is not None:
+            thread.join(max(0, probe["deadline"] - time.time()))
+            if thread.is_alive():
+                self.logger.warning("WARNING: Kubernetes API did not answer within {}s, unable to test permissions to view pods. Clustering may be unavailable. Please refer to the documentation for configuration.".format(probe["timeout"]))
+                return
+
+        pods_code = probe["code"]
+        if thread is not None and pods_code in ["200", "403"]:
+            self.save_view_pods_cache(probe["key"], pods_code)
+
+        if pods_code == "200":
+            self.logger.info("Service account has sufficient permissions to view pods in kubernetes (HTTP {}). Clustering will be available.".format(pods_code))
+        elif pods_code == "403":
+            self.logger.warning("WARNING: Service account has insufficient permissions to view pods in kubernetes (HTTP {}). Clustering will be unavailable. Please refer to the documentation for configuration.".format(pods_code))
+        else:
+            self.logger.warning("WARNING: Service account unable to test permissions to view pods in kubernetes (HTTP {}). Clustering will be unavailable. Please refer to the documentation for configuration.".format(pods_code))
+
+    def configure_ha(self):
+        # Set HA args
+        try:
+            ip_addr = socket.gethostbyname(socket.gethostname())
+        except socket.error as e:
+            self.logger.error("Unable to determine the IP address of {}: {}".format(socket.gethostname(), e))
+            ip_addr = "127.0.0.1"
+        ha_args = "-b {} -bprivate {}".format(ip_addr, ip_addr)
+
+        node_name = self._getenv_compat(["NODE_NAME", "EAP_NODE_NAME", "container_uuid", "HOSTNAME"])
+        if node_name:
+            # CLOUD-427: truncate to 23 characters max (from the end backwards)
+            ha_args = "{} -Djboss.node.name={}".format(ha_args, node_name[-23:])
+        self.launch_envs["JBOSS_HA_ARGS"] = ha_args
+
+        password = self.env.get("JGROUPS_CLUSTER_PASSWORD")
+        if not password:
+            self.logger.warning("WARNING: No password defined for JGroups cluster. AUTH protocol will be disabled. Please define JGROUPS_CLUSTER_PASSWORD.")
+            jgroups_auth = "<!--WARNING: No password defined for JGroups cluster. AUTH protocol has been disabled. Please define JGROUPS_CLUSTER_PASSWORD. -->"
+        else:
+            jgroups_auth = """
+                <protocol type="AUTH">
+                    <property name="auth_class">org.jgroups.auth.MD5Token</property>
+                    <property name="token_hash">SHA</property>
+                    <property name="auth_value">{}</property>
+                </protocol>
+""".format(escape(password))
+
+        self.set_placeholder("JGROUPS_AUTH", jgroups_auth)
+
+        stack = self.env.get("JGROUPS_STACK") or "tcp"
+        if stack not in JGROUPS_STACKS:
+            self.logger.error(str(InvalidSetting("JGROUPS_STACK", stack, "one of {}".format(", ".join(JGROUPS_STACKS)))))
+            stack = "tcp"
+        self.set_placeholder("JGROUPS_STACK", stack)
+
+    def configure_jgroups_encryption(self):
+        jgroups_encrypt = ""
+
+        if self.env.get("JGROUPS_ENCRYPT_SECRET"):
+            name = self.env.get("JGROUPS_ENCRYPT_NAME")
+            password = self.env.get("JGROUPS_ENCRYPT_PASSWORD")
+            if name and password:
+                jgroups_encrypt = """
+        <protocol type="ENCRYPT">
+          <property name="key_store_name">{}/{}</property>
+          <property name="store_password">{}</property>
+          <property name="alias">{}</property>
+        </protocol>""".format(escape(self.env.get("JGROUPS_ENCRYPT_KEYSTORE_DIR", "")), escape(self.env.get("JGROUPS_ENCRYPT_KEYSTORE", "")),
+                              escape(password), escape(name))
+            else:
+                self.logger.warning("WARNING! Partial JGroups encryption configuration, the communication within the cluster WILL NOT be encrypted.")
+
+        self.set_placeholder("JGROUPS_ENCRYPT", jgroups_encrypt)
+
+    def jgroups_tuning(self, settings):
+        """
+        The JGROUPS_SETTINGS of the JGROUPS_PROFILE in SETTINGS (the
+        JGROUPS_ group), each overridden by its JGROUPS_<SETTING> variable.
+        Settings neither the profile nor the environment sets are left out,
+        so the JGroups defaults apply.
+        """
+        profile = settings.get("PROFILE") or "default"
+        if profile not in JGROUPS_PROFILES:
+            raise InvalidSetting(settings.name("PROFILE"), profile, "one of {}".format(", ".join(sorted(JGROUPS_PROFILES))))
+        defaults = JGROUPS_PROFILES[profile]
+
+        tuning = OrderedDict()
+        for setting in JGROUPS_SETTINGS:
+            if setting == "BUNDLER_TYPE":
+                value = settings.get(setting) or defaults.get(setting)
+                if value is not None and value not in JGROUPS_BUNDLERS:
+                    raise InvalidSetting(settings.name(setting), value, "one of {}".format(", ".join(JGROUPS_BUNDLERS)))
+            elif setting == "FC_MIN_THRESHOLD":
+                value = settings.number(setting, defaults.get(setting), maximum=1)
+            else:
+                value = settings.integer(setting, defaults.get(setting))
+            if value is not None:
+                tuning[setting] = value
+
+        # a bundle has to hold a whole fragment and its headers
+        if tuning.get("FRAG_SIZE", 60000) >= tuning.get("MAX_BUNDLE_SIZE", 64000):
+            raise InvalidSetting(settings.name("FRAG_SIZE"), tuning.get("FRAG_SIZE", 60000),
+                                 "less than the MAX_BUNDLE_SIZE of {}".format(tuning.get("MAX_BUNDLE_SIZE", 64000)))
+        return tuning
+
+    def inject_jgroups(self):
+        """
+        Apply the JGROUPS_PROFILE and its overrides (see jgroups_tuning)
+        to the tcp and udp stacks: protocol properties and transport thread
+        pools, replacing any the template already sets.
+        """
+        try:
+            tuning = self.jgroups_tuning(self.env.group("JGROUPS"))
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            self.logger.error("WARNING! The JGroups stacks WILL NOT be tuned.")
+            return
+        if not tuning:
+            return
+
+        ss = self._get_subsystem("urn:jboss:domain:jgroups:4.0")
+        if not ss:
+            return
+        self.logger.info("JGroups tuning: {}".format(", ".join("{}={}".format(k, v) for k, v in tuning.items())))
+        for stack in ss.getElementsByTagName("stack"):
+            protocols = {}
+            for elem in stack.childNodes:
+                if elem.nodeType == elem.ELEMENT_NODE and elem.tagName in ["transport", "protocol"]:
+                    protocols["transport" if elem.tagName == "transport" else elem.getAttribute("type")] = elem
+            transport = protocols.get("transport")
+
+            for setting, value in tuning.items():
+                target, name = JGROUPS_SETTINGS[setting]
+                value = str(value)
+                if target in JGROUPS_THREAD_POOLS:
+                    if transport is not None:
+                        self._jgroups_thread_pool(transport, target).setAttribute(name, value)
+                    continue
+                names = [name]
+                if target == "transport" and transport is not None and transport.getAttribute("type") == "UDP":
+                    names = JGROUPS_UDP_PROPERTIES.get(name, names)
+                for protocol in target.split():
+                    if protocol in protocols:
+                        for property_name in names:
+                            self._jgroups_property(protocols[protocol], property_name, value)
+
+    def _jgroups_property(self, protocol, name, value):
+        """Set the NAME property of PROTOCOL, before any thread pools."""
+        for elem in protocol.getElementsByTagName("property"):
+            if elem.getAttribute("name") == name:
+                while elem.firstChild:
+                    elem.removeChild(elem.firstChild)
+                elem.appendChild(self.config.createTextNode(value))
+                return
+        self._insert_child(protocol, self._element("property", value, name=name), JGROUPS_THREAD_POOLS)
+
+    def _jgroups_thread_pool(self, transport, tag):
+        """The TAG thread pool (e.g. default-thread-pool) of TRANSPORT, added if missing."""
+        for elem in transport.childNodes:
+            if elem.nodeType == elem.ELEMENT_NODE and elem.tagName == tag:
+                return elem
+        following = JGROUPS_THREAD_POOLS[JGROUPS_THREAD_POOLS.index(tag) + 1:]
+        return self._insert_child(transport, self._element(tag), following)
+
+    def _insert_child(self, parent, elem, following):
+        """Add ELEM to PARENT before its first child tagged one of FOLLOWING."""
+        for sibling in parent.childNodes:
+            if sibling.nodeType == sibling.ELEMENT_NODE and sibling.tagName in following:
+                parent.insertBefore(elem, sibling)
+                self.index.add(elem)
+                return elem
+        return self._append(parent, elem)
+
+    def infinispan_tuning(self, settings):
+        """
+        The settings of a web or ejb cache container in SETTINGS (its
+        INFINISPAN_<CONTAINER>_ group), only those that are set:
+
+          CACHE                 the default cache: repl, every node holds every
+                                session, or dist, OWNERS nodes hold each one
+          OWNERS                copies of each entry in the dist cache (2)
+          EVICTION_MAX_ENTRIES  entries kept in memory per node, 0 for no bound
+          EVICTION_STRATEGY     which entries to evict (LRU)
+          EXPIRATION_MAX_IDLE   milliseconds before an unused entry expires, 0 never
+          FILE_STORE            false to drop the file-store, so evicted entries
+                                are not passivated to disk (true)
+        """
+        tuning = OrderedDict()
+        cache = settings.get("CACHE")
+        if cache:
+            if cache not in INFINISPAN_CACHES:
+                raise InvalidSetting(settings.name("CACHE"), cache, "one of {}".format(", ".join(INFINISPAN_CACHES)))
+            tuning["cache"] = cache
+        owners = settings.integer("OWNERS", minimum=1)
+        if owners is not None:
+            tuning["owners"] = owners
+        max_entries = settings.integer("EVICTION_MAX_ENTRIES")
+        if max_entries is not None:
+            tuning["eviction_max_entries"] = max_entries
+        strategy = settings.get("EVICTION_STRATEGY")
+        if strategy:
+            if strategy.upper() not in INFINISPAN_EVICTION_STRATEGIES:
+                raise InvalidSetting(settings.name("EVICTION_STRATEGY"), strategy,
+                                     "one of {}".format(", ".join(INFINISPAN_EVICTION_STRATEGIES)))
+            tuning["eviction_strategy"] = strategy.upper()
+        max_idle = settings.integer("EXPIRATION_MAX_IDLE")
+        if max_idle is not None:
+            tuning["expiration_max_idle"] = max_idle
+        if settings.get("FILE_STORE"):
+            tuning["file_store"] = settings.boolean("FILE_STORE", True)
+        return tuning
+
+    def inject_infinispan(self):
+        """
+        Apply the INFINISPAN_WEB_ and INFINISPAN_EJB_ settings (see
+        infinispan_tuning) to the web and ejb cache containers: the default
+        cache, and the owners, eviction, expiration and file-store of both
+        of their caches.
+        """
+        tunings = []
+        for container in INFINISPAN_CONTAINERS:
+            try:
+                tuning = self.infinispan_tuning(self.env.group("INFINISPAN_{}".format(container.upper())))
+            except InvalidSetting as e:
+                self.logger.error(str(e))
+                self.logger.error("WARNING! The {} cache container WILL NOT be tuned.".format(container))
+                continue
+            if tuning:
+                tunings.append((container, tuning))
+        if not tunings:
+            return
+
+        ss = self._get_subsystem("urn:jboss:domain:infinispan:4.0")
+        if not ss:
+            return
+        containers = dict((elem.getAttribute("name"), elem) for elem in ss.getElementsByTagName("cache-container"))
+        for name, tuning in tunings:
+            container = containers.get(name)
+            if container is None:
+                self.logger.error("couldn't find the {} cache-container".format(name))
+                continue
+            self.logger.info("Infinispan {} cache: {}".format(name, ", ".join("{}={}".format(k, v) for k, v in tuning.items())))
+            if "cache" in tuning:
+                container.setAttribute("default-cache", tuning["cache"])
+            if tuning.get("eviction_max_entries") and tuning.get("file_store") is False:
+                self.logger.warning("WARNING! The {} cache evicts without a file-store, evicted entries will be lost.".format(name))
+
+            for cache in container.childNodes:
+                if cache.nodeType != cache.ELEMENT_NODE or cache.getAttribute("name") not in INFINISPAN_CACHES:
+                    continue
+                if "owners" in tuning and cache.tagName == "distributed-cache":
+                    cache.setAttribute("owners", str(tuning["owners"]))
+
+                if tuning.get("eviction_max_entries") == 0:
+                    self._remove_cache_element(cache, "eviction")
+                elif "eviction_max_entries" in tuning or "eviction_strategy" in tuning:
+                    eviction = self._cache_element(cache, "eviction")
+                    eviction.setAttribute("strategy", tuning.get("eviction_strategy") or eviction.getAttribute("strategy") or "LRU")
+                    if "eviction_max_entries" in tuning:
+                        eviction.setAttribute("max-entries", str(tuning["eviction_max_entries"]))
+
+                if tuning.get("expiration_max_idle") == 0:
+                    self._remove_cache_element(cache, "expiration")
+                elif "expiration_max_idle" in tuning:
+                    self._cache_element(cache, "expiration").setAttribute("max-idle", str(tuning["expiration_max_idle"]))
+
+                if tuning.get("file_store") is False:
+                    self._remove_cache_element(cache, "file-store")
+                elif tuning.get("file_store"):
+                    self._cache_element(cache, "file-store")
+
+    def _cache_element(self, cache, tag):
+        """The TAG child of CACHE, added in schema order if missing."""
+        for elem in cache.childNodes:
+            if elem.nodeType == elem.ELEMENT_NODE and elem.tagName == tag:
+                return elem
+        position = INFINISPAN_CACHE_ELEMENTS.index(tag)
+        return self._insert_child(cache, self._element(tag), INFINISPAN_CACHE_ELEMENTS[position + 1:])
+
+    def _remove_cache_element(self, cache, tag):
+        for elem in list(cache.childNodes):
+            if elem.nodeType == elem.ELEMENT_NODE and elem.tagName == tag:
+                cache.removeChild(elem)
+
+    def undertow_tuning(self, settings):
+        """
+        The listener attributes in SETTINGS (the UNDERTOW_ group), only
+        those that are set:
+
+          MAX_CONNECTIONS     concurrent connections per listener
+          MAX_POST_SIZE       largest request body in bytes, 0 for no limit
+          NO_REQUEST_TIMEOUT  milliseconds an idle connection is kept open
+          TCP_BACKLOG         connections waiting to be accepted
+          BUFFER_POOL         the io buffer-pool the listeners use (default)
+          ENABLE_HTTP2        offer HTTP/2 on the https listener (false)
+        """
+        tuning = OrderedDict()
+        for setting, attribute in UNDERTOW_LISTENER_SETTINGS.items():
+            if setting == "BUFFER_POOL":
+                value = settings.get(setting) or None
+            else:
+                value = settings.integer(setting, minimum=0 if setting == "MAX_POST_SIZE" else 1)
+            if value is not None:
+                tuning[attribute] = str(value)
+        if settings.boolean("ENABLE_HTTP2", False):
+            tuning["enable-http2"] = "true"
+        return tuning
+
+    def inject_undertow(self):
+        """
+        Apply the UNDERTOW_ listener settings (see undertow_tuning) to the
+        http, https and ajp listeners; HTTP/2 only to https. The io worker
+        and buffer pool they share are sized by configure_thread_pools.
+        """
+        try:
+            tuning = self.undertow_tuning(self.env.group("UNDERTOW"))
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            self.logger.error("WARNING! The undertow listeners WILL NOT be tuned.")
+            return
+        if not tuning:
+            return
+
+        pool = tuning.get("buffer-pool")
+        if pool:
+            io = self._get_subsystem("urn:jboss:domain:io:1.1")
+            pools = [elem.getAttribute("name") for elem in io.getElementsByTagName("buffer-pool")] if io else []
+            if pool not in pools:
+                self.logger.error(str(InvalidSetting("UNDERTOW_BUFFER_POOL", pool, "one of {}".format(", ".join(pools)))))
+                del tuning["buffer-pool"]
+
+        ss = self._get_subsystem("urn:jboss:domain:undertow:3.1")
+        if not ss:
+            return
+        self.logger.info("Undertow listeners: {}".format(", ".join("{}={}".format(k, v) for k, v in tuning.items())))
+        for tag in UNDERTOW_LISTENERS:
+            for listener in ss.getElementsByTagName(tag):
+                for attribute, value in tuning.items():
+                    if attribute != "enable-http2" or tag == "https-listener":
+                        listener.setAttribute(attribute, value)
+
+    # stuff from https.sh
+    def configure_https(self):
+        ssl_config = "<!-- No SSL configuration discovered -->"
+        https_connector = "<!-- No HTTPS configuration discovered -->"
+
+        password = self._getenv_compat(["HTTPS_PASSWORD", "EAP_HTTPS_PASSWORD"])
+        keystore_dir = self._getenv_compat(["HTTPS_KEYSTORE_DIR", "EAP_HTTPS_KEYSTORE_DIR"])
+        keystore = self._getenv_compat(["HTTPS_KEYSTORE", "EAP_HTTPS_KEYSTORE"])
+
+        if password and keystore_dir and keystore:
+            keystore_provider = ""
+            if self.env.get("HTTPS_KEYSTORE_TYPE"):
+                keystore_provider = "provider={} ".format(quoteattr(self.env.get("HTTPS_KEYSTORE_TYPE")))
+            ssl_config = """<server-identities>
+                    <ssl>
+                        <keystore {}path={} keystore-password={}/>
+                    </ssl>
+                </server-identities>""".format(keystore_provider, quoteattr("{}/{}".format(keystore_dir, keystore)), quoteattr(password))
+
+            https_connector = '<https-listener name="https" socket-binding="https" security-realm="ApplicationRealm"/>'
+        elif password or keystore_dir or keystore:
+            self.logger.warning("WARNING! Partial HTTPS configuration, the https connector WILL NOT be configured.")
+
+        self.set_placeholder("SSL", ssl_config)
+        self.set_placeholder("HTTPS_CONNECTOR", https_connector)
+
+    # stuff from json_logging.sh
+    def configure_json_logging(self):
+        logging_file = os.path.join(os.path.dirname(self.get_config_file()), "logging.properties")
+        if not os.path.exists(logging_file):
+            return
+        with open(logging_file, "r") as fh:
+            lines = fh.readlines()
+        stripped = [re.sub(r"^.*\.module=org\.jboss\.logmanager\.ext$", "", line) for line in lines]
+        if stripped != lines:
+            with open(logging_file, "w") as fh:
+                fh.writelines(stripped)
+
+    def configure_logging(self):
+        """
+        Fill in the logging subsystem: the console formatter, the ASYNC
+        handler's queue and overflow action, and the logger categories.
+
+        ENABLE_JSON_LOGGING selects the OPENSHIFT (Logstash) formatter
+        instead of COLOR-PATTERN. LOGGING_ASYNC_OVERFLOW_ACTION=discard drops
+        records when LOGGING_ASYNC_QUEUE_LENGTH are waiting for the console,
+        rather than blocking the threads that log. LOGGER_CATEGORIES is a
+        list of CATEGORY:LEVEL, e.g. "org.hibernate.SQL:DEBUG,com.acme:TRACE".
+        """
+        try:
+            json_logging = self.env.boolean("ENABLE_JSON_LOGGING", False)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            json_logging = False
+        try:
+            queue_length = self.env.integer("LOGGING_ASYNC_QUEUE_LENGTH", LOGGING_ASYNC_QUEUE_LENGTH, minimum=1)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            queue_length = LOGGING_ASYNC_QUEUE_LENGTH
+        overflow_action = (self.env.get("LOGGING_ASYNC_OVERFLOW_ACTION") or "block").lower()
+        if overflow_action not in LOGGING_OVERFLOW_ACTIONS:
+            self.logger.error(str(InvalidSetting("LOGGING_ASYNC_OVERFLOW_ACTION", overflow_action,
+                                                 "one of {}".format(", ".join(LOGGING_OVERFLOW_ACTIONS)))))
+            overflow_action = "block"
+
+        categories = OrderedDict(LOGGING_CATEGORIES)
+        for item in self.env.list("LOGGER_CATEGORIES"):
+            category, _, level = item.rpartition(":")
+            category, level = category.strip(), level.strip().upper()
+            if not category or " " in category or level not in LOG_LEVELS:
+                self.logger.error(str(InvalidSetting("LOGGER_CATEGORIES", item, "CATEGORY:LEVEL with a level of {}".format(", ".join(LOG_LEVELS)))))
+                self.logger.error("WARNING! The logger for '{}' WILL NOT be configured.".format(item))
+                continue
+            categories[category] = level
+
+        self.set_placeholder("LOGGING_FORMATTER", "OPENSHIFT" if json_logging else "COLOR-PATTERN")
+        self.set_placeholder("LOGGING_ASYNC_QUEUE_LENGTH", str(queue_length))
+        self.set_placeholder("LOGGING_ASYNC_OVERFLOW_ACTION", overflow_action)
+        self.set_placeholder("LOGGERS", "\n            ".join(
+            """<logger category={}>
+                <level name="{}"/>
+            </logger>""".format(quoteattr(category), level) for category, level in categories.items()))
+
+    # stuff from security-domains.sh
+    def configure_security_domains(self):
+        domains = "<!-- no additional security domains configured -->"
+        name = self._getenv_compat(["SECDOMAIN_NAME", "EAP_SECDOMAIN_NAME"])
+        if name:
+            users_properties = self._getenv_compat(["SECDOMAIN_USERS_PROPERTIES", "EAP_SECDOMAIN_USERS_PROPERTIES"], "users.properties")
+            roles_properties = self._getenv_compat(["SECDOMAIN_ROLES_PROPERTIES", "EAP_SECDOMAIN_ROLES_PROPERTIES"], "roles.properties")
+            config_dir = os.path.dirname(self.get_config_file())
+            if os.path.isfile(os.path.join(config_dir, users_properties)) and os.path.isfile(os.path.join(config_dir, roles_properties)):
+                login_module = self.env.get("SECDOMAIN_LOGIN_MODULE") or "UsersRoles"
+
+                realm = ""
+                if login_module == "RealmUsersRoles":
+                    realm = '<module-option name="realm" value="ApplicationRealm"/>'
+
+                stack = ""
+                if self._getenv_compat(["SECDOMAIN_PASSWORD_STACKING", "EAP_SECDOMAIN_PASSWORD_STACKING"]):
+                    stack = '<module-option name="password-stacking" value="useFirstPass"/>'
+
+                domains = """
+            <security-domain name={} cache-type="default">
+                <authentication>
+                    <login-module code={} flag="required">
+                        <module-option name="usersProperties" value={}/>
+                        <module-option name="rolesProperties" value={}/>
+                        {}
+                        {}
+                    </login-module>
+                </authentication>
+            </security-domain>""".format(quoteattr(name), quoteattr(login_module),
+                                         quoteattr("${{jboss.server.config.dir}}/{}".format(users_properties)),
+                                         quoteattr("${{jboss.server.config.dir}}/{}".format(roles_properties)),
+                                         realm, stack)
+            else:
+                self.logger.warning("WARNING! Both user and roles files must exist before an additional security domain can be configured, current values are {} and {}.".format(users_properties, roles_properties))
+
+        self.set_placeholder("ADDITIONAL_SECURITY_DOMAINS", domains)
+
+    # stuff from jboss_modules_system_pkgs.sh
+    def configure_jboss_modules_system_pkgs(self):
+        pkgs = "org.jboss.logmanager,jdk.nashorn.api"
+        if self.env.get("JBOSS_MODULES_SYSTEM_PKGS_APPEND"):
+            pkgs = "{},{}".format(pkgs, self.env.get("JBOSS_MODULES_SYSTEM_PKGS_APPEND"))
+        self.launch_envs["JBOSS_MODULES_SYSTEM_PKGS"] = pkgs
+
+    def configure_jvm(self, cgroup_root=None):
+        """
+        Size the JVM to the container's cgroup limits, see JvmSizing for the
+        policy and its overrides. The options are passed to standalone.conf
+        as JVM_SIZING_OPTS; JVM_SIZING=false leaves the JVM defaults alone.
+        """
+        try:
+            if not self.env.boolean("JVM_SIZING", True):
+                return
+            limits = self.cgroup_limits(cgroup_root)
+            sizing, opts = JvmSizing(limits, self.env).options()
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            self.logger.error("WARNING! The JVM will not be sized to the container limits.")
+            return
+        self.logger.info("JVM sizing: {}".format(", ".join("{}={}".format(k, v) for k, v in sizing.items() if v is not None)))
+        self.launch_envs["JVM_SIZING_OPTS"] = opts
+
+    def configure_thread_pools(self, cgroup_root=None):
+        """
+        Size the ejb3, batch-jberet, jca and io thread pools to the
+        container, see ThreadPoolSizing for the policy and its overrides.
+        """
+        processors, sizes = self.thread_pools(cgroup_root)
+        self.logger.info("Thread pools: {}".format(", ".join("{}={}".format(k, v) for k, v in sizes.items())))
+        for name, value in sizes.items():
+            self.set_placeholder(name, str(value))
+
+    def cgroup_limits(self, cgroup_root=None):
+        """The CgroupLimits under CGROUP_ROOT, or the container's."""
+        return CgroupLimits(cgroup_root or self.cgroup_root, self.host_cpus)
+
+    def thread_pools(self, cgroup_root=None):
+        """
+        The processors and thread pool sizes for the container, computed
+        once and shared by the thread pools and the datasource pools.
+        """
+        if self._thread_pools is None:
+            sizing = ThreadPoolSizing(self.cgroup_limits(cgroup_root), self.env)
+            sizes = sizing.sizes()
+            for e in sizing.errors:
+                self.logger.error(str(e))
+                self.logger.error("WARNING! {} will be sized from the container.".format(e.name))
+            self._thread_pools = (sizing.processors, sizes)
+        return self._thread_pools
+
+    def configure_deployment_scanner(self):
+        """
+        DEPLOYMENT_SCAN_MODE picks how deployments/ is deployed:
+
+          periodic  scanned at boot and every DEPLOYMENT_SCAN_INTERVAL ms (5000)
+          boot      scanned once at boot, for images whose deployments never change
+          index     listed now, into <deployments>, and the scanner disabled;
+                    see deployments_index
+
+        DEPLOYMENT_TIMEOUT is the seconds a deployment may take (600).
+        """
+        try:
+            explode = self.env.boolean("AUTO_DEPLOY_EXPLODED", False)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            explode = False
+        self.set_placeholder("AUTO_DEPLOY_EXPLODED", "true" if explode else "false")
+
+        mode = self.env.get("DEPLOYMENT_SCAN_MODE") or "periodic"
+        if mode not in DEPLOYMENT_SCAN_MODES:
+            self.logger.error(str(InvalidSetting("DEPLOYMENT_SCAN_MODE", mode, "one of {}".format(", ".join(DEPLOYMENT_SCAN_MODES)))))
+            mode = "periodic"
+        try:
+            interval = self.env.integer("DEPLOYMENT_SCAN_INTERVAL", 5000, minimum=1)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            interval = 5000
+        try:
+            timeout = self.env.integer("DEPLOYMENT_TIMEOUT", 600, minimum=1)
+        except InvalidSetting as e:
+            self.logger.error(str(e))
+            timeout = 600
+
+        deployments = ""
+        if mode == "index":
+            deployments = self.deployments_index(explode)
+        # a scan interval below 1 scans only at boot
+        self.set_placeholder("DEPLOYMENT_SCAN_ENABLED", "false" if mode == "index" else "true")
+        self.set_placeholder("DEPLOYMENT_SCAN_INTERVAL", str(interval if mode == "periodic" else 0))
+        self.set_placeholder("DEPLOYMENT_TIMEOUT", str(timeout))
+        self.set_placeholder("DEPLOYMENTS", deployments)
+
+    def get_deployments_dir(self):
+        return "{}/standalone/deployments".format(self.env.get("JBOSS_HOME"))
+
+    def deployments_index(self, explode=False):
+        """
+        Unmanaged <deployments> for what the scanner would deploy from
+        deployments/: archives, and exploded directories when EXPLODE or
+        marked .dodeploy, unless marked .skipdeploy.
+        """
+        deployments_dir = self.get_deployments_dir()
+        try:
+            names = sorted(os.listdir(deployments_dir))
+        except OSError as e:
+            self.logger.error("Unable to list {}: {}".format(deployments_dir, e))
+            return ""
+
+        entries = []
+        for name in names:
+            if name.startswith(".") or os.path.splitext(name)[1] not in DEPLOYMENT_EXTENSIONS:
+                continue
+            if "{}.skipdeploy".format(name) in names:
+                continue
+            exploded = os.path.isdir(os.path.join(deployments_dir, name))
+            if exploded and not (explode or "{}.dodeploy".format(name) in names):
+                continue
+            entries.append("""
+        <deployment name={0} runtime-name={0}>
+            <{1} path={2} relative-to="jboss.server.base.dir"/>
+        </deployment>""".format(quoteattr(name), "fs-exploded" if exploded else "fs-archive",
+                               quoteattr("deployments/{}".format(name))))
+        self.logger.info("Indexed {} deployment(s) in {}".format(len(entries), deployments_dir))
+        if not entries:
+            return ""
+        return "<deployments>{}\n    </deployments>".format("".join(entries))
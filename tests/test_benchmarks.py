@@ -0,0 +1,33 @@
+import unittest
+import mock
+import os
+
+from benchmarks import bench_config
+
+class TestBenchmarks(unittest.TestCase):
+    BASELINE = {"wall_ms": 100.0, "peak_rss_kb": 20000, "output_bytes": 1000}
+
+    def test_within_tolerance(self):
+        result = {"wall_ms": 150.0, "peak_rss_kb": 24000, "output_bytes": 1050}
+        self.assertEqual(bench_config.regressions(result, self.BASELINE), [])
+
+    def test_regressions(self):
+        result = {"wall_ms": 500.0, "peak_rss_kb": 40000, "output_bytes": 2000}
+        self.assertEqual(len(bench_config.regressions(result, self.BASELINE)), 3)
+
+    def test_failure(self):
+        result = {"error": "TypeError"}
+        self.assertEqual(bench_config.regressions(result, self.BASELINE), ["failed: TypeError"])
+        self.assertEqual(bench_config.regressions(result, None), [])
+
+    def test_run_case(self):
+        with mock.patch.dict(os.environ), mock.patch("run.LAUNCH_ENVS_FILE"):
+            result = bench_config.run_case("datasources-10", 1)
+        self.assertGreater(result["output_bytes"], 0)
+
+    def test_baselines_cover_cases(self):
+        self.assertEqual(sorted(bench_config.load_baselines()), sorted(bench_config.CASES))
+
+
+if __name__ == '__main__':
+    unittest.main()
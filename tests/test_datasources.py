@@ -10,6 +10,7 @@ import shutil
 
 # XXX should probably restructure the module like base
 from run import Run
+from environment import EnvironmentSnapshot, InvalidSetting
 
 from cct.errors import CCTError
 
@@ -98,6 +99,134 @@ class TestDataSources(unittest.TestCase):
         """Replicate running the whole datasources at once"""
         self.run.inject_datasources()
 
+    def test_generate_datasource_pool(self):
+        """The pool sizes are nested in the pool element, in schema order"""
+        sizes = {"min": 2, "initial": 4, "max": 20, "prefill": True}
+        for nonxa, tag in [(True, "pool"), (False, "xa-pool")]:
+            ds = self.run.generate_datasource(pool_name="test", driver="postgresql", NON_XA_DATASOURCE=nonxa, pool=sizes)
+            self.assertEqual([n.tagName for n in ds.childNodes if n.tagName.endswith("-size")], [])
+            pool = ds.getElementsByTagName(tag)[0]
+            self.assertEqual([(n.tagName, n.firstChild.data) for n in pool.childNodes],
+                             [("min-pool-size", "2"), ("initial-pool-size", "4"),
+                              ("max-pool-size", "20"), ("prefill", "true")])
+
+    def _children(self, ds, tag):
+        return [(n.tagName, n.firstChild.data if n.firstChild else n.getAttribute("class-name"))
+                for n in ds.getElementsByTagName(tag)[0].childNodes]
+
+    def test_generate_datasource_tuning(self):
+        """Background validation, statement cache and idle timeout, in schema order"""
+        tuning = self.run.datasource_tuning(EnvironmentSnapshot({}).group("TEST"), "mysql")
+        ds = self.run.generate_datasource(pool_name="test", driver="mysql", checker="Checker", sorter="Sorter",
+                                          NON_XA_DATASOURCE=False, tuning=tuning)
+        self.assertEqual([n.tagName for n in ds.childNodes][-5:],
+                         ["xa-pool", "security", "validation", "timeout", "statement"])
+        self.assertEqual(self._children(ds, "xa-pool"), [("flush-strategy", "IdleConnections")])
+        self.assertEqual(self._children(ds, "validation"),
+                         [("valid-connection-checker", "Checker"), ("validate-on-match", "false"),
+                          ("background-validation", "true"), ("background-validation-millis", "10000"),
+                          ("use-fast-fail", "true"), ("exception-sorter", "Sorter")])
+        self.assertEqual(self._children(ds, "timeout"), [("idle-timeout-minutes", "10")])
+        self.assertEqual(self._children(ds, "statement"),
+                         [("prepared-statement-cache-size", "256"), ("share-prepared-statements", "true")])
+
+    def test_datasource_tuning_overrides(self):
+        settings = EnvironmentSnapshot({"TEST_PS_CACHE_SIZE": "0", "TEST_BACKGROUND_VALIDATION_MILLIS": "0",
+                                        "TEST_IDLE_TIMEOUT": "0", "TEST_FLUSH_STRATEGY": "EntirePool"}).group("TEST")
+        tuning = self.run.datasource_tuning(settings, "postgresql")
+        ds = self.run.generate_datasource(pool_name="test", driver="postgresql", NON_XA_DATASOURCE=True, tuning=tuning)
+        self.assertEqual([n.tagName for n in ds.childNodes][-3:], ["pool", "security", "validation"])
+        self.assertEqual(self._children(ds, "validation")[1], ("validate-on-match", "true"))
+        self.assertEqual(self._children(ds, "pool"), [("flush-strategy", "EntirePool")])
+        self.assertEqual(self.run.datasource_tuning(EnvironmentSnapshot({}).group("TEST"), "postgresql")["ps_cache_size"], 64)
+        self.assertRaises(InvalidSetting, self.run.datasource_tuning,
+                          EnvironmentSnapshot({"TEST_FLUSH_STRATEGY": "Sometimes"}).group("TEST"), "mysql")
+
+    def _inject_test_datasource(self, **environ):
+        environ.update({
+            "DB_SERVICE_PREFIX_MAPPING": "test-postgresql=TEST",
+            "TEST_POSTGRESQL_SERVICE_HOST": "10.0.0.1",
+            "TEST_POSTGRESQL_SERVICE_PORT": "5432",
+            "TEST_USERNAME": "user",
+            "TEST_PASSWORD": "secret",
+            "TEST_DATABASE": "db",
+            "TEST_NONXA": "true",
+        })
+        with mock.patch.dict(os.environ, environ, clear=True):
+            run = Run('run','run')
+        run.config = self.run.config
+        run.inject_datasources()
+        return [d for d in run.config.getElementsByTagName("datasource") if d.getAttribute("pool-name") == "test_postgresql-TEST"][-1]
+
+    def test_inject_datasources_pool_without_budget(self):
+        """Without a budget the pool keeps the server's defaults"""
+        ds = self._inject_test_datasource()
+        self.assertEqual(self._children(ds, "pool"), [("flush-strategy", "IdleConnections")])
+        ds = self._inject_test_datasource(TEST_MAX_POOL_SIZE="30")
+        self.assertEqual(self._children(ds, "pool"), [("max-pool-size", "30"), ("flush-strategy", "IdleConnections")])
+
+    def test_inject_datasources_pool_budget(self):
+        environ = {
+            "DB_SERVICE_PREFIX_MAPPING": "test-postgresql=TEST",
+            "TEST_POSTGRESQL_SERVICE_HOST": "10.0.0.1",
+            "TEST_POSTGRESQL_SERVICE_PORT": "5432",
+            "TEST_USERNAME": "user",
+            "TEST_PASSWORD": "secret",
+            "TEST_DATABASE": "db",
+            "TEST_NONXA": "true",
+            "TEST_CONNECTION_BUDGET": "60",
+            "DB_POOL_REPLICAS": "5",
+        }
+        with mock.patch.dict(os.environ, environ, clear=True):
+            run = Run('run','run')
+        run.config = self.run.config
+        run.inject_datasources()
+        ds = [d for d in run.config.getElementsByTagName("datasource") if d.getAttribute("pool-name") == "test_postgresql-TEST"][0]
+        self.assertEqual(ds.getElementsByTagName("connection-url")[0].firstChild.data, "jdbc:postgresql://10.0.0.1:5432/db")
+        self.assertEqual(ds.getElementsByTagName("max-pool-size")[0].firstChild.data, "10")
+
+    TX_ENV = {
+        "TX_DATABASE_PREFIX_MAPPING": "txstore-postgresql=TX",
+        "TXSTORE_POSTGRESQL_SERVICE_HOST": "10.1.0.1",
+        "TXSTORE_POSTGRESQL_SERVICE_PORT": "5432",
+        "TX_USERNAME": "tx",
+        "TX_PASSWORD": "secret",
+        "TX_DATABASE": "tx",
+    }
+
+    def _tx_store(self, **environ):
+        with mock.patch.dict(os.environ, environ, clear=True):
+            run = Run('run','run')
+        run.config = xml.dom.minidom.parse(os.path.join(self.workdir, "standalone-openshift.xml"))
+        datasource = run.inject_tx_datasource()
+        ss = run._get_subsystem("urn:jboss:domain:transactions:3.0")
+        return datasource, [n for n in ss.childNodes if n.nodeType == n.ELEMENT_NODE][-1]
+
+    def test_tx_jdbc_store(self):
+        environ = dict(self.TX_ENV, TX_MAX_POOL_SIZE="12", TX_TABLE_PREFIX="app_", TX_STATE_TABLE_PREFIX="state_")
+        datasource, store = self._tx_store(**environ)
+        self.assertEqual(datasource.getAttribute("jndi-name"), "java:jboss/datasources/txstore_postgresqlObjectStore")
+        self.assertEqual(datasource.getElementsByTagName("connection-url")[0].firstChild.data, "jdbc:postgresql://10.1.0.1:5432/tx")
+        self.assertEqual(datasource.getElementsByTagName("pool")[0].getElementsByTagName("max-pool-size")[0].firstChild.data, "12")
+        self.assertEqual(store.toxml(), '<jdbc-store datasource-jndi-name="java:jboss/datasources/txstore_postgresqlObjectStore">'
+                                        '<action table-prefix="app_"/><communication table-prefix="app_"/>'
+                                        '<state table-prefix="state_"/></jdbc-store>')
+
+    def test_tx_jdbc_store_per_pod(self):
+        datasource, store = self._tx_store(HOSTNAME="eap-app-0", TX_TABLE_PREFIX_PER_POD="true", **self.TX_ENV)
+        self.assertEqual([n.getAttribute("table-prefix") for n in store.childNodes], ["eap_app_0"] * 3)
+
+    def test_tx_journal_store(self):
+        datasource, store = self._tx_store(TX_OBJECT_STORE="journal", TX_JOURNAL_ASYNC_IO="true", **self.TX_ENV)
+        self.assertIsNone(datasource)
+        self.assertEqual(store.toxml(), '<use-journal-store enable-async-io="true"/>')
+
+    def test_tx_file_store(self):
+        for environ in [{}, {"TX_OBJECT_STORE": "jdbc"}, {"TX_OBJECT_STORE": "tape"}]:
+            datasource, store = self._tx_store(**environ)
+            self.assertIsNone(datasource)
+            self.assertEqual(store.tagName, "recovery-environment")
+
 
 if __name__ == '__main__':
     unittest.main()
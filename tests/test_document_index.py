@@ -0,0 +1,38 @@
+import unittest
+import xml.dom.minidom
+
+from run import Run, DocumentIndex, SubsystemDocument
+
+TEMPLATE = "os-eap7-openshift/added/standalone-openshift.xml"
+
+class TestDocumentIndex(unittest.TestCase):
+    def setUp(self):
+        self.text = open(TEMPLATE).read().replace('##DEFAULT_JMS##', '')
+
+    def test_minidom_index(self):
+        index = DocumentIndex(xml.dom.minidom.parseString(self.text))
+        self.assertEqual(len(index.subsystems), 32)
+        self.assertEqual(index.element("datasources").tagName, "datasources")
+        self.assertEqual(index.subsystem("urn:jboss:domain:ejb3:4.0").getAttribute("xmlns"),
+                         "urn:jboss:domain:ejb3:4.0")
+        self.assertIsNone(index.subsystem("urn:jboss:domain:missing:1.0"))
+
+    def test_streaming_index_is_lazy(self):
+        doc = SubsystemDocument(self.text)
+        index = DocumentIndex(doc)
+        self.assertEqual(len(index.sections), 32)
+        self.assertIsNotNone(index.subsystem("urn:jboss:domain:transactions:3.0"))
+        self.assertEqual(len([s for s in doc.sections if s.element is not None]), 1)
+
+    def test_inserted_nodes_are_indexed(self):
+        run = Run('run','run')
+        run.config = xml.dom.minidom.parseString(self.text)
+        profile = run.config.getElementsByTagName("profile")[0]
+        ss = run.config.createElement("subsystem")
+        ss.setAttribute("xmlns", "urn:jboss:domain:keycloak:1.1")
+        run._append(profile, ss)
+        self.assertIs(run._get_subsystem("urn:jboss:domain:keycloak:1.1"), ss)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from environment import EnvironmentSnapshot, InvalidSetting, Overrides
+
+class TestEnvironmentSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.env = EnvironmentSnapshot({
+            "TEST_MYSQL_USERNAME": "user",
+            "TEST_MYSQL_MAX_POOL_SIZE": "20",
+            "TEST_MYSQL_NONXA": "true",
+            "TEST_MYSQL_MIN_POOL_SIZE": "lots",
+            "TEST_MYSQL_SERVICE_HOST": "10.0.0.1",
+            "TEST_MYSQL_SERVICE_PORT": "3306",
+            "MQ_QUEUES": "a, b,,c",
+            "EMPTY": "",
+        })
+
+    def test_group(self):
+        settings = self.env.group("TEST_MYSQL")
+        self.assertEqual(settings.get("USERNAME"), "user")
+        self.assertEqual(settings.get("SERVICE_HOST"), "10.0.0.1")
+        self.assertIsNone(settings.get("PASSWORD"))
+        self.assertEqual(self.env.group("TEST").get("MYSQL_USERNAME"), "user")
+        self.assertEqual(self.env.group("MISSING").values, {})
+
+    def test_typed(self):
+        settings = self.env.group("TEST_MYSQL")
+        self.assertEqual(settings.integer("MAX_POOL_SIZE"), 20)
+        self.assertEqual(settings.port("SERVICE_PORT"), 3306)
+        self.assertTrue(settings.boolean("NONXA"))
+        self.assertFalse(settings.boolean("JTA", False))
+        self.assertEqual(self.env.integer("EMPTY", 5), 5)
+
+    def test_invalid(self):
+        with self.assertRaises(InvalidSetting) as cm:
+            self.env.group("TEST_MYSQL").integer("MIN_POOL_SIZE")
+        self.assertEqual(cm.exception.name, "TEST_MYSQL_MIN_POOL_SIZE")
+        with self.assertRaises(InvalidSetting):
+            self.env.group("TEST_MYSQL").boolean("USERNAME")
+
+    def test_overrides(self):
+        overrides = Overrides(self.env.group("TEST_MYSQL"))
+        self.assertEqual(overrides.override("integer", "MIN_POOL_SIZE", 5, minimum=1), 5)
+        self.assertEqual(overrides.override("integer", "MAX_POOL_SIZE", 5), 20)
+        self.assertEqual(overrides.choice("USERNAME", ["USER"], "ADMIN"), "USER")
+        self.assertEqual(overrides.choice("NONXA", ["XA"], "XA"), "XA")
+        self.assertEqual(overrides.choice("MISSING", ["XA"], "XA"), "XA")
+        self.assertEqual([e.name for e in overrides.errors], ["TEST_MYSQL_MIN_POOL_SIZE", "TEST_MYSQL_NONXA"])
+
+    def test_list(self):
+        self.assertEqual(self.env.list("MQ_QUEUES"), ["a", "b", "c"])
+        self.assertEqual(self.env.list("MQ_TOPICS"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import mock
+import tempfile
+import json
+import os
+import shutil
+import xml.dom.minidom
+
+import fleet
+import run
+
+class TestFleet(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestFleet")
+        self.output = os.path.join(self.workdir, "out")
+        os.makedirs(self.output)
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _write(self, name, content):
+        path = os.path.join(self.workdir, name)
+        with open(path, "w") as fh:
+            fh.write(content)
+        return path
+
+    def test_load_environment(self):
+        env = self._write("a.env", "# tenant a\nexport MQ_QUEUES=a,b\nAPP_PASSWORD='s3cr=t'\n\nEMPTY=\n")
+        self.assertEqual(fleet.load_environment(env), {"MQ_QUEUES": "a,b", "APP_PASSWORD": "s3cr=t", "EMPTY": ""})
+        self.assertEqual(fleet.load_environment(self._write("b.json", '{"REPLICAS": 3}')), {"REPLICAS": "3"})
+        self.assertRaises(ValueError, fleet.load_environment, self._write("c.env", "not a variable\n"))
+
+    def test_environment_names(self):
+        self.assertEqual(fleet.environment_names(["x/a.json", "y/a.env", "b.env"]), ["a", "a-2", "b"])
+
+    def test_render_fleet(self):
+        paths = [self._write("default.json", "{}"),
+                 self._write("queues.env", "MQ_QUEUES=orders\n"),
+                 self._write("invalid.json", '{"JVM_GC": "zgc"}')]
+        launch_envs = run.LAUNCH_ENVS_FILE
+        results = fleet.render_fleet(paths, self.output, jobs=1, memory=2 * 1024 ** 3, cpus=2)
+        self.assertEqual(run.LAUNCH_ENVS_FILE, launch_envs)
+        self.assertEqual([r["name"] for r in results], ["default", "queues", "invalid"])
+        self.assertEqual(json.load(open(os.path.join(self.output, "summary.json"))), results)
+
+        queues = xml.dom.minidom.parse(os.path.join(self.output, "queues", "standalone-openshift.xml"))
+        self.assertEqual([q.getAttribute("name") for q in queues.getElementsByTagName("jms-queue")][-1], "orders")
+        self.assertIn('JVM_SIZING_OPTS="-Xms1024m -Xmx1024m ', open(os.path.join(self.output, "default", "launch_envs")).read())
+        self.assertIn("write_precompiled_default",
+                      [phase["name"] for phase in json.load(open(os.path.join(self.output, "default", "timeline.json")))["phases"]])
+        self.assertFalse([m for m in results[0]["messages"] if m.startswith("ERROR")])
+        self.assertIn("ERROR: Invalid value for JVM_GC: 'zgc' (expected one of g1, parallel, serial)", results[2]["messages"])
+
+    def test_render_fleet_host_independent(self):
+        """The rendered sizing follows --cpus and --host-cpus, not the CPUs of the machine rendering it"""
+        paths = [self._write("default.json", "{}")]
+        with mock.patch("multiprocessing.cpu_count", return_value=1):
+            fleet.render_fleet(paths, self.output, jobs=1, memory=2 * 1024 ** 3, cpus=4, host_cpus=8)
+        self.assertIn('JVM_SIZING_OPTS="-Xms1024m -Xmx1024m -XX:MaxMetaspaceSize=204m -XX:MaxDirectMemorySize=204m '
+                      '-XX:ActiveProcessorCount=4 -XX:ParallelGCThreads=4 -XX:+UseParallelGC"',
+                      open(os.path.join(self.output, "default", "launch_envs")).read())
+
+    def test_render_fleet_pool(self):
+        paths = [self._write("t{}.json".format(i), '{{"MQ_QUEUES": "q{}"}}'.format(i)) for i in range(4)]
+        results = fleet.render_fleet(paths, self.output, jobs=2)
+        self.assertEqual([r["name"] for r in results], ["t0", "t1", "t2", "t3"])
+        self.assertFalse([r for r in results if "failed" in r])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import unittest
+import mock
+import tempfile
+import os
+import shutil
+
+from environment import EnvironmentSnapshot, InvalidSetting
+from jvm import CgroupLimits, JvmSizing, ThreadPoolSizing, PoolSizing
+from run import Run
+
+GIB = 1024 * 1024 * 1024
+
+class TestJvm(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="TestJvm")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _cgroup(self, files):
+        """Fake cgroup filesystem"""
+        for name, content in files.items():
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "w") as fh:
+                fh.write(content + "\n")
+        return CgroupLimits(self.root)
+
+    def _v2(self, memory="max", cpu="max 100000"):
+        return self._cgroup({"cgroup.controllers": "cpu memory", "memory.max": memory, "cpu.max": cpu})
+
+    def _v1(self, memory="9223372036854771712", quota="-1", period="100000"):
+        return self._cgroup({"memory/memory.limit_in_bytes": memory,
+                             "cpu,cpuacct/cpu.cfs_quota_us": quota,
+                             "cpu,cpuacct/cpu.cfs_period_us": period})
+
+    def _size(self, limits, **environ):
+        with mock.patch("multiprocessing.cpu_count", return_value=32):
+            return JvmSizing(limits, EnvironmentSnapshot(environ)).options()
+
+    def test_v2_limits(self):
+        limits = self._v2(str(2 * GIB), "150000 100000")
+        self.assertEqual(limits.version, 2)
+        self.assertEqual(limits.memory(), 2 * GIB)
+        self.assertEqual(limits.cpus(), 1.5)
+
+    def test_v1_limits(self):
+        limits = self._v1(str(GIB), "50000")
+        self.assertEqual(limits.version, 1)
+        self.assertEqual(limits.memory(), GIB)
+        self.assertEqual(limits.cpus(), 0.5)
+
+    def test_unlimited(self):
+        for limits in [self._v1(), CgroupLimits(os.path.join(self.root, "missing"))]:
+            sizing, opts = self._size(limits)
+            self.assertIsNone(sizing["max_heap_mb"])
+            self.assertEqual(opts, "-XX:ActiveProcessorCount=32 -XX:ParallelGCThreads=23 -XX:+UseParallelGC")
+
+    def test_quota(self):
+        """GC threads follow the quota, not the 32 host CPUs"""
+        sizing, opts = self._size(self._v2(str(4 * GIB), "200000 100000"))
+        self.assertEqual(opts, "-Xms2048m -Xmx2048m -XX:MaxMetaspaceSize=409m -XX:MaxDirectMemorySize=409m "
+                               "-XX:ActiveProcessorCount=2 -XX:ParallelGCThreads=2 -XX:+UseParallelGC")
+
+    def test_quota_above_host(self):
+        """A quota above the host CPUs is capped at them, or at the CPUs given for the node"""
+        limits = self._v2(str(4 * GIB), "400000 100000")
+        with mock.patch("multiprocessing.cpu_count", return_value=1):
+            sizing, opts = JvmSizing(limits, EnvironmentSnapshot({})).options()
+            self.assertEqual(sizing["active_processor_count"], 1)
+            self.assertEqual(sizing["gc"], "serial")
+            sizing, opts = JvmSizing(CgroupLimits(limits.root, host_cpus=8), EnvironmentSnapshot({})).options()
+        self.assertEqual(sizing["active_processor_count"], 4)
+        self.assertEqual(sizing["gc"], "parallel")
+        self.assertIn("-XX:ActiveProcessorCount=4 ", opts)
+
+    def test_small_container(self):
+        sizing, opts = self._size(self._v1(str(GIB / 2), "100000"))
+        self.assertEqual(sizing["gc"], "serial")
+        self.assertEqual(sizing["max_metaspace_mb"], 96)
+        self.assertEqual(sizing["max_direct_memory_mb"], 64)
+        self.assertNotIn("ParallelGCThreads", opts)
+
+    def test_large_container(self):
+        sizing, opts = self._size(self._v2(str(16 * GIB), "1200000 100000"))
+        self.assertEqual(sizing["gc"], "g1")
+        self.assertEqual(sizing["parallel_gc_threads"], 10)
+        self.assertEqual(sizing["conc_gc_threads"], 3)
+        self.assertEqual(sizing["max_metaspace_mb"], 512)
+
+    def test_overrides(self):
+        sizing, opts = self._size(self._v2(str(4 * GIB), "400000 100000"),
+                                  CONTAINER_HEAP_PERCENT="0.75", INITIAL_HEAP_PERCENT="0.25",
+                                  JVM_GC="g1", JVM_CONC_GC_THREADS="2", JVM_MAX_METASPACE_SIZE="300")
+        self.assertEqual((sizing["max_heap_mb"], sizing["initial_heap_mb"]), (3072, 768))
+        self.assertIn("-XX:+UseG1GC", opts)
+        self.assertIn("-XX:ConcGCThreads=2", opts)
+        self.assertIn("-XX:MaxMetaspaceSize=300m", opts)
+
+    def test_gc_already_selected(self):
+        sizing, opts = self._size(self._v2(str(4 * GIB), "400000 100000"), JAVA_OPTS_APPEND="-XX:+UseShenandoahGC")
+        self.assertIsNone(sizing["gc"])
+        self.assertNotIn("GC", opts)
+
+    def test_invalid(self):
+        self.assertRaises(InvalidSetting, self._size, self._v2(), JVM_GC="zgc")
+        self.assertRaises(InvalidSetting, self._size, self._v2(str(GIB)), CONTAINER_HEAP_PERCENT="50")
+
+    def test_configure_jvm(self):
+        limits = self._v2(str(2 * GIB), "100000 100000")
+        with mock.patch.dict(os.environ, {}, clear=True):
+            run = Run('run','run')
+        run.configure_jvm(limits.root)
+        self.assertTrue(run.launch_envs["JVM_SIZING_OPTS"].startswith("-Xms1024m -Xmx1024m "))
+
+        with mock.patch.dict(os.environ, {"JVM_SIZING": "false"}, clear=True):
+            run = Run('run','run')
+        run.configure_jvm(limits.root)
+        self.assertEqual(run.launch_envs["JVM_SIZING_OPTS"], "")
+
+    def _pools(self, limits, **environ):
+        with mock.patch("multiprocessing.cpu_count", return_value=32):
+            return ThreadPoolSizing(limits, EnvironmentSnapshot(environ)).sizes()
+
+    def test_thread_pools_one_cpu(self):
+        sizes = self._pools(self._v2(str(GIB), "100000 100000"))
+        self.assertEqual(sizes["EJB3_MAX_THREADS"], 10)
+        self.assertEqual(sizes["JCA_SHORT_RUNNING_MAX_THREADS"], 8)
+        self.assertEqual(sizes["IO_WORKER_IO_THREADS"], 2)
+        self.assertEqual((sizes["IO_BUFFER_SIZE"], sizes["IO_BUFFERS_PER_SLICE"]), (16384, 20))
+
+    def test_buffer_cache(self):
+        """One 1 MiB region per 64 MiB of heap, at most WildFly's 10"""
+        self.assertEqual(self._pools(self._v2(str(512 * 1024 * 1024), "100000 100000"))["BUFFER_CACHE_MAX_REGIONS"], 4)
+        self.assertEqual(self._pools(self._v2(str(160 * 1024 * 1024), "100000 100000"))["BUFFER_CACHE_MAX_REGIONS"], 1)
+        sizes = self._pools(self._v2(), BUFFER_CACHE_BUFFER_SIZE="4096")
+        self.assertEqual([sizes[name] for name in ["BUFFER_CACHE_BUFFER_SIZE", "BUFFER_CACHE_BUFFERS_PER_REGION",
+                                                   "BUFFER_CACHE_MAX_REGIONS"]], [4096, 1024, 10])
+
+    def test_thread_pools_sixteen_cpus(self):
+        sizes = self._pools(self._v2(str(8 * GIB), "1600000 100000"), BATCH_MAX_THREADS="5")
+        self.assertEqual(sizes["EJB3_MAX_THREADS"], 64)
+        self.assertEqual(sizes["BATCH_MAX_THREADS"], 5)
+        self.assertEqual(sizes["IO_WORKER_TASK_MAX_THREADS"], 256)
+
+    def test_thread_pools_small_heap(self):
+        """Threads are capped by the heap, buffers shrink with it"""
+        sizes = self._pools(self._v2(str(160 * 1024 * 1024), "800000 100000"))
+        self.assertEqual(sizes["JCA_SHORT_RUNNING_MAX_THREADS"], 20)
+        self.assertEqual((sizes["IO_BUFFER_SIZE"], sizes["IO_BUFFERS_PER_SLICE"]), (1024, 10))
+
+    def test_configure_thread_pools(self):
+        limits = self._v2(str(2 * GIB), "200000 100000")
+        environ = {"EJB3_MAX_THREADS": "x", "BATCH_MAX_THREADS": "6", "JVM_ACTIVE_PROCESSOR_COUNT": "0"}
+        with mock.patch.dict(os.environ, environ, clear=True):
+            run = Run('run','run')
+        with mock.patch("multiprocessing.cpu_count", return_value=32), \
+             mock.patch.object(run.logger, "error") as error:
+            run.configure_thread_pools(limits.root)
+        # only the invalid setting falls back, the other overrides stay
+        self.assertEqual(run.placeholders["EJB3_MAX_THREADS"], "10")
+        self.assertEqual(run.placeholders["BATCH_MAX_THREADS"], "6")
+        self.assertEqual(run.placeholders["JCA_LONG_RUNNING_MAX_THREADS"], "8")
+        self.assertIn("EJB3_MAX_THREADS", error.call_args_list[0][0][0])
+        self.assertEqual(run.thread_pools()[0], 2)
+
+    THREADS = {"IO_WORKER_TASK_MAX_THREADS": 64, "EJB3_MAX_THREADS": 16, "BATCH_MAX_THREADS": 8}
+
+    def _pool(self, prefixed={}, **environ):
+        env = EnvironmentSnapshot(dict(environ, **dict(("TEST_" + k, v) for k, v in prefixed.items())))
+        return PoolSizing(env.group("TEST"), env, 4, self.THREADS).sizes()
+
+    def test_pool_without_budget(self):
+        """Without a budget the server's defaults apply, not the 88 threads' demand"""
+        self.assertEqual(list(self._pool().items()),
+                         [("min", None), ("initial", None), ("max", None), ("prefill", None)])
+        self.assertEqual(list(self._pool({"MAX_POOL_SIZE": "30", "PREFILL": "true"}).items()),
+                         [("min", None), ("initial", None), ("max", 30), ("prefill", True)])
+
+    def test_pool_with_budget(self):
+        """With a budget the pool covers every thread that may need a connection, within the share"""
+        self.assertEqual(list(self._pool(DB_CONNECTION_BUDGET="1000").items()),
+                         [("min", 4), ("initial", 4), ("max", 88), ("prefill", True)])
+
+    def test_pool_budget_share(self):
+        """The budget is shared by the replicas and the pod a rolling update adds"""
+        self.assertEqual(self._pool(DB_CONNECTION_BUDGET="100", DB_POOL_REPLICAS="4")["max"], 20)
+        self.assertEqual(self._pool({"CONNECTION_BUDGET": "30"}, DB_CONNECTION_BUDGET="100",
+                                    DB_POOL_REPLICAS="4", DB_POOL_SURGE="0")["max"], 7)
+        sizes = self._pool(DB_CONNECTION_BUDGET="10", DB_POOL_REPLICAS="9")
+        self.assertEqual((sizes["min"], sizes["max"]), (1, 1))
+
+    def test_pool_overrides(self):
+        sizes = self._pool({"MIN_POOL_SIZE": "0", "INITIAL_POOL_SIZE": "50", "MAX_POOL_SIZE": "10"})
+        self.assertEqual(list(sizes.items()), [("min", 0), ("initial", 10), ("max", 10), ("prefill", None)])
+        sizes = self._pool({"MIN_POOL_SIZE": "0", "INITIAL_POOL_SIZE": "50", "MAX_POOL_SIZE": "10"}, DB_CONNECTION_BUDGET="100")
+        self.assertEqual(list(sizes.items()), [("min", 0), ("initial", 10), ("max", 10), ("prefill", False)])
+        self.assertEqual(self._pool({"MIN_POOL_SIZE": "100"}, DB_CONNECTION_BUDGET="100")["max"], 100)
+        self.assertTrue(self._pool({"MIN_POOL_SIZE": "0", "PREFILL": "true"})["prefill"])
+        self.assertRaises(InvalidSetting, self._pool, {"MIN_POOL_SIZE": "5", "MAX_POOL_SIZE": "4"})
+        self.assertRaises(InvalidSetting, self._pool, DB_CONNECTION_BUDGET="10", DB_POOL_REPLICAS="0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,421 @@
+import unittest
+import mock
+import tempfile
+import os
+import shutil
+import xml.dom.minidom
+
+from run import Run
+from environment import InvalidSetting
+
+# tests for the steps ported from openshift-configure.sh
+
+class TestLaunch(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestLaunch")
+        self.jboss_home = os.path.join(self.workdir, "eap")
+        os.makedirs(os.path.join(self.jboss_home, "standalone", "configuration"))
+        os.makedirs(os.path.join(self.jboss_home, "bin", "launch"))
+        shutil.copy("os-eap7-launch/added/launch/activemq-subsystem.xml",
+                    os.path.join(self.jboss_home, "bin", "launch"))
+        shutil.copy("os-eap7-openshift/added/standalone-openshift.xml",
+                    os.path.join(self.jboss_home, "standalone", "configuration"))
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _run(self, **environ):
+        environ.setdefault("JBOSS_HOME", self.jboss_home)
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return Run('run','run')
+
+    def _messaging(self, run):
+        """Run the messaging steps and return the resulting document."""
+        run.inject_brokers()
+        run.configure_mq()
+        run.setup_xml()
+        run.inject_messaging()
+        run.teardown_xml()
+        return xml.dom.minidom.parse(run.get_config_file())
+
+    def test_configure_ha(self):
+        run = self._run(HOSTNAME="a-very-long-pod-name-1234567890", JGROUPS_CLUSTER_PASSWORD="p&ss")
+        run.configure_ha()
+        self.assertTrue(run.launch_envs["JBOSS_HA_ARGS"].endswith("-Djboss.node.name=ong-pod-name-1234567890"))
+        self.assertIn("<property name=\"auth_value\">p&amp;ss</property>", run.placeholders["JGROUPS_AUTH"])
+
+    def test_configure_ha_without_password(self):
+        run = self._run()
+        run.configure_ha()
+        self.assertTrue(run.placeholders["JGROUPS_AUTH"].startswith("<!--WARNING"))
+
+    def test_configure_https_partial(self):
+        run = self._run(HTTPS_PASSWORD="secret")
+        run.configure_https()
+        self.assertEqual(run.placeholders["HTTPS_CONNECTOR"], "<!-- No HTTPS configuration discovered -->")
+
+    def test_configure_https(self):
+        run = self._run(EAP_HTTPS_PASSWORD="secret", HTTPS_KEYSTORE_DIR="/etc/keys", HTTPS_KEYSTORE="keystore.jks")
+        run.configure_https()
+        self.assertIn('path="/etc/keys/keystore.jks"', run.placeholders["SSL"])
+        self.assertIn("https-listener", run.placeholders["HTTPS_CONNECTOR"])
+
+    def test_inject_brokers(self):
+        run = self._run(MQ_SERVICE_PREFIX_MAPPING="broker-amq=MQ",
+                        BROKER_AMQ_TCP_SERVICE_HOST="10.0.0.1",
+                        BROKER_AMQ_TCP_SERVICE_PORT="61616",
+                        MQ_QUEUES="orders",
+                        MQ_QUEUE_ORDERS_JNDI="java:/queue/Orders")
+        doc = self._messaging(run)
+        self.assertTrue(run.amq)
+        ra, = doc.getElementsByTagName("resource-adapter")
+        self.assertEqual(ra.getElementsByTagName("config-property")[2].firstChild.data,
+                         "tcp://10.0.0.1:61616?jms.rmIdFromConnectionId=true")
+        ao, = ra.getElementsByTagName("admin-object")
+        self.assertEqual(ao.getAttribute("jndi-name"), "java:/queue/Orders")
+        self.assertEqual(ao.getAttribute("pool-name"), "queue/orders")
+        self.assertEqual(run.placeholders["DEFAULT_JMS"], 'jms-connection-factory="java:/broker-amq/ConnectionFactory"')
+        self.assertNotIn("MESSAGING_SUBSYSTEM_CONFIG", run.placeholders)
+
+    def test_inject_brokers_tuning(self):
+        run = self._run(MQ_SERVICE_PREFIX_MAPPING="broker-amq=MQ",
+                        BROKER_AMQ_TCP_SERVICE_HOST="10.0.0.1",
+                        BROKER_AMQ_TCP_SERVICE_PORT="61616",
+                        MQ_MIN_POOL_SIZE="5", MQ_MAX_POOL_SIZE="50", MQ_PREFILL="true",
+                        MQ_MDB_MAX_SESSIONS="30", MQ_QUEUE_PREFETCH="10",
+                        MQ_RECONNECT_INITIAL_DELAY="100", MQ_RECONNECT_BACKOFF_MULTIPLIER="2")
+        doc = self._messaging(run)
+        ra, = doc.getElementsByTagName("resource-adapter")
+        self.assertEqual(ra.getElementsByTagName("config-property")[2].firstChild.data,
+                         "failover:(tcp://10.0.0.1:61616)?initialReconnectDelay=100&useExponentialBackOff=true"
+                         "&backOffMultiplier=2.0&jms.rmIdFromConnectionId=true&jms.prefetchPolicy.queuePrefetch=10")
+        pool, = ra.getElementsByTagName("xa-pool")
+        self.assertEqual([(n.tagName, n.firstChild.data) for n in pool.childNodes],
+                         [("min-pool-size", "5"), ("max-pool-size", "50"),
+                          ("prefill", "true"), ("is-same-rm-override", "false")])
+        self.assertIn("-Dbroker-amq.maxSessions=30", run.launch_envs["JBOSS_MESSAGING_ARGS"])
+        replacement, = doc.getElementsByTagName("annotation-property-replacement")
+        self.assertEqual(replacement.firstChild.data, "true")
+        # after spec-descriptor-property-replacement, as the ee schema orders them
+        self.assertEqual(replacement.previousSibling.previousSibling.tagName, "spec-descriptor-property-replacement")
+
+    def test_inject_brokers_invalid_tuning(self):
+        run = self._run(MQ_SERVICE_PREFIX_MAPPING="broker-amq=MQ",
+                        BROKER_AMQ_TCP_SERVICE_HOST="10.0.0.1",
+                        BROKER_AMQ_TCP_SERVICE_PORT="61616",
+                        MQ_MIN_POOL_SIZE="30", MQ_MAX_POOL_SIZE="10")
+        run.inject_brokers()
+        self.assertEqual(run.resource_adapters, [])
+
+    def test_configure_mq(self):
+        run = self._run(MQ_QUEUES="a,b", HORNETQ_TOPICS="t")
+        doc = self._messaging(run)
+        self.assertFalse(run.amq)
+        queues = [(q.getAttribute("name"), q.getAttribute("entries")) for q in doc.getElementsByTagName("jms-queue")]
+        self.assertEqual(queues[-2:], [("a", "/queue/a"), ("b", "/queue/b")])
+        topic, = doc.getElementsByTagName("jms-topic")
+        self.assertEqual(topic.getAttribute("entries"), "/topic/t")
+        # the destinations replace the placeholder, before the connection factories
+        self.assertEqual(topic.nextSibling.nextSibling.tagName, "connection-factory")
+        self.assertEqual(doc.getElementsByTagName("resource-adapters")[0].getElementsByTagName("resource-adapter"), [])
+        self.assertNotIn("cluster.password", run.launch_envs["JBOSS_MESSAGING_ARGS"])
+        self.assertEqual(doc.getElementsByTagName("annotation-property-replacement"), [])
+
+    def test_configure_mq_tuning(self):
+        cgroup = os.path.join(self.workdir, "cgroup")
+        os.makedirs(cgroup)
+        for name, content in [("cgroup.controllers", "cpu memory"), ("memory.max", str(2 * 1024 ** 3))]:
+            with open(os.path.join(cgroup, name), "w") as fh:
+                fh.write(content)
+        run = self._run(MQ_QUEUES="orders,audit", MQ_JOURNAL_TYPE="nio", MQ_BATCH_DELAY="0",
+                        MQ_QUEUE_ORDERS_MAX_SIZE_BYTES="-1", MQ_QUEUE_ORDERS_ADDRESS_FULL_POLICY="block")
+        run.inject_brokers()
+        run.configure_mq(cgroup)
+        run.setup_xml()
+        run.inject_messaging()
+        run.teardown_xml()
+        doc = xml.dom.minidom.parse(run.get_config_file())
+        server, = [s for s in doc.getElementsByTagName("server") if s.hasAttribute("journal-type")]
+        self.assertEqual(server.getAttribute("journal-type"), "NIO")
+        self.assertEqual(server.getAttribute("journal-buffer-timeout"), "3333333")
+        settings = dict((s.getAttribute("name"), s) for s in doc.getElementsByTagName("address-setting"))
+        self.assertEqual(sorted(settings), ["#", "jms.queue.orders"])
+        # 5% of the 1 GiB heap
+        self.assertEqual(settings["#"].getAttribute("max-size-bytes"), "53687091")
+        self.assertEqual(settings["#"].getAttribute("page-size-bytes"), "10737418")
+        self.assertEqual(settings["jms.queue.orders"].getAttribute("max-size-bytes"), "-1")
+        self.assertEqual(settings["jms.queue.orders"].getAttribute("address-full-policy"), "BLOCK")
+        self.assertEqual(set(p.getAttribute("value") for p in doc.getElementsByTagName("param")
+                             if p.getAttribute("name") == "batch-delay"), set(["0"]))
+
+    def test_configure_mq_invalid_tuning(self):
+        run = self._run(MQ_JOURNAL_TYPE="MAPPED")
+        run.configure_mq()
+        self.assertIn('journal-type="ASYNCIO"', run.placeholders["MESSAGING_SUBSYSTEM_CONFIG"])
+        self.assertNotIn("##MQ_", run.placeholders["MESSAGING_SUBSYSTEM_CONFIG"])
+
+    def test_configure_mq_invalid_tuning_keeps_overrides(self):
+        # each invalid setting falls back alone, empty ones are unset
+        run = self._run(MQ_QUEUES="orders", MQ_JOURNAL_TYPE="MAPPED", MQ_ADDRESS_FULL_POLICY="",
+                        MQ_BATCH_DELAY="0", MQ_JOURNAL_MIN_FILES="x",
+                        MQ_QUEUE_ORDERS_MAX_SIZE_BYTES="x", MQ_QUEUE_ORDERS_ADDRESS_FULL_POLICY="block")
+        run.inject_brokers()
+        with mock.patch.object(run.logger, "error") as error:
+            run.configure_mq()
+        messages = [c[0][0] for c in error.call_args_list]
+        self.assertEqual(len(messages), 6)
+        self.assertIn("MQ_JOURNAL_TYPE", messages[0])
+        self.assertIn("MQ_JOURNAL_MIN_FILES", messages[2])
+        self.assertIn("MQ_QUEUE_ORDERS_MAX_SIZE_BYTES", messages[4])
+        run.setup_xml()
+        run.inject_messaging()
+        run.teardown_xml()
+        doc = xml.dom.minidom.parse(run.get_config_file())
+        server, = [s for s in doc.getElementsByTagName("server") if s.hasAttribute("journal-type")]
+        self.assertEqual(server.getAttribute("journal-type"), "ASYNCIO")
+        self.assertEqual(server.getAttribute("journal-min-files"), "2")
+        self.assertEqual(set(p.getAttribute("value") for p in doc.getElementsByTagName("param")
+                             if p.getAttribute("name") == "batch-delay"), set(["0"]))
+        settings = dict((s.getAttribute("name"), s) for s in doc.getElementsByTagName("address-setting"))
+        self.assertEqual(settings["#"].getAttribute("address-full-policy"), "PAGE")
+        orders = settings["jms.queue.orders"]
+        self.assertEqual(orders.getAttribute("max-size-bytes"), settings["#"].getAttribute("max-size-bytes"))
+        self.assertEqual(orders.getAttribute("address-full-policy"), "BLOCK")
+
+    def test_configure_administration(self):
+        run = self._run(ADMIN_USERNAME="admin", ADMIN_PASSWORD="secret")
+        run.configure_administration()
+        run.configure_administration()
+        users = open(os.path.join(self.jboss_home, "standalone", "configuration", "mgmt-users.properties")).read()
+        self.assertEqual(users, "admin=1eb173832c3b8726e6c99a96d186eabc\n")
+
+    def test_configure_deployment_scanner(self):
+        run = self._run(AUTO_DEPLOY_EXPLODED="true")
+        run.configure_deployment_scanner()
+        self.assertEqual(run.placeholders["AUTO_DEPLOY_EXPLODED"], "true")
+        self.assertEqual([run.placeholders[name] for name in
+                          ["DEPLOYMENT_SCAN_ENABLED", "DEPLOYMENT_SCAN_INTERVAL", "DEPLOYMENT_TIMEOUT", "DEPLOYMENTS"]],
+                         ["true", "5000", "600", ""])
+
+    def test_deployment_scanner_boot(self):
+        run = self._run(DEPLOYMENT_SCAN_MODE="boot", DEPLOYMENT_SCAN_INTERVAL="1000", DEPLOYMENT_TIMEOUT="1200")
+        run.configure_deployment_scanner()
+        self.assertEqual([run.placeholders[name] for name in
+                          ["DEPLOYMENT_SCAN_ENABLED", "DEPLOYMENT_SCAN_INTERVAL", "DEPLOYMENT_TIMEOUT"]],
+                         ["true", "0", "1200"])
+
+    def test_deployment_scanner_index(self):
+        deployments = os.path.join(self.jboss_home, "standalone", "deployments")
+        os.makedirs(os.path.join(deployments, "exploded.war"))
+        os.makedirs(os.path.join(deployments, "marked.war"))
+        for name in ["app.war", "a&b.ear", "marked.war.dodeploy", "skipped.jar", "skipped.jar.skipdeploy",
+                     "README.txt", ".hidden.war"]:
+            open(os.path.join(deployments, name), "w").close()
+
+        run = self._run(DEPLOYMENT_SCAN_MODE="index")
+        run.configure_deployment_scanner()
+        self.assertEqual(run.placeholders["DEPLOYMENT_SCAN_ENABLED"], "false")
+        index = xml.dom.minidom.parseString(run.placeholders["DEPLOYMENTS"])
+        contents = [elem for elem in index.getElementsByTagName("*") if elem.tagName.startswith("fs-")]
+        self.assertEqual([(elem.parentNode.getAttribute("runtime-name"), elem.tagName, elem.getAttribute("path"))
+                          for elem in contents],
+                         [("a&b.ear", "fs-archive", "deployments/a&b.ear"),
+                          ("app.war", "fs-archive", "deployments/app.war"),
+                          ("marked.war", "fs-exploded", "deployments/marked.war")])
+
+        run = self._run(DEPLOYMENT_SCAN_MODE="index", AUTO_DEPLOY_EXPLODED="true")
+        run.configure_deployment_scanner()
+        self.assertIn('<fs-exploded path="deployments/exploded.war"', run.placeholders["DEPLOYMENTS"])
+
+        fingerprint = run.render_fingerprint()
+        open(os.path.join(deployments, "new.war"), "w").close()
+        self.assertNotEqual(run.render_fingerprint(), fingerprint)
+
+    def test_deployment_scanner_invalid(self):
+        run = self._run(DEPLOYMENT_SCAN_MODE="never", DEPLOYMENT_SCAN_INTERVAL="0", DEPLOYMENT_TIMEOUT="x")
+        with mock.patch.object(run.logger, "error") as error:
+            run.configure_deployment_scanner()
+        self.assertEqual(error.call_count, 3)
+        self.assertEqual([run.placeholders[name] for name in
+                          ["DEPLOYMENT_SCAN_ENABLED", "DEPLOYMENT_SCAN_INTERVAL", "DEPLOYMENT_TIMEOUT"]],
+                         ["true", "5000", "600"])
+
+        run = self._run(DEPLOYMENT_SCAN_MODE="index")
+        with mock.patch.object(run.logger, "error") as error:
+            run.configure_deployment_scanner()
+        self.assertEqual(error.call_count, 1)
+        self.assertEqual(run.placeholders["DEPLOYMENTS"], "")
+
+    def _jgroups(self, run):
+        """Run the JGroups steps and return the stacks by name."""
+        run.inject_brokers()
+        run.configure_ha()
+        run.setup_xml()
+        run.inject_jgroups()
+        run.teardown_xml()
+        config = xml.dom.minidom.parse(run.get_config_file())
+        return config, dict((stack.getAttribute("name"), stack) for stack in config.getElementsByTagName("stack"))
+
+    def _properties(self, stack, tag, type):
+        elem = [elem for elem in stack.getElementsByTagName(tag) if elem.getAttribute("type") == type][0]
+        return [(prop.getAttribute("name"), prop.firstChild.data) for prop in elem.getElementsByTagName("property")]
+
+    def test_jgroups_defaults(self):
+        """Without a profile the stacks are left alone"""
+        run = self._run()
+        config, stacks = self._jgroups(run)
+        self.assertEqual(config.getElementsByTagName("channel")[0].getAttribute("stack"), "tcp")
+        self.assertEqual(stacks["tcp"].getElementsByTagName("property"), [])
+        self.assertTrue(run.uses_default_document())
+
+    def test_jgroups_profile(self):
+        run = self._run(JGROUPS_PROFILE="high-throughput", JGROUPS_FD_TIMEOUT="8000", JGROUPS_STACK="udp")
+        self.assertFalse(run.uses_default_document())
+        config, stacks = self._jgroups(run)
+        self.assertEqual(config.getElementsByTagName("channel")[0].getAttribute("stack"), "udp")
+        self.assertEqual(self._properties(stacks["tcp"], "protocol", "FD"), [("timeout", "8000"), ("max_tries", "5")])
+        self.assertEqual(self._properties(stacks["udp"], "protocol", "UFC"), [("max_credits", "4000000"), ("min_threshold", "0.4")])
+        self.assertEqual(self._properties(stacks["tcp"], "transport", "TCP")[2:],
+                         [("recv_buf_size", "20000000"), ("send_buf_size", "1000000")])
+        self.assertIn(("mcast_recv_buf_size", "20000000"), self._properties(stacks["udp"], "transport", "UDP"))
+        transport = stacks["udp"].getElementsByTagName("transport")[0]
+        children = [elem for elem in transport.childNodes if elem.nodeType == elem.ELEMENT_NODE]
+        self.assertEqual([elem.tagName for elem in children][-2:], ["default-thread-pool", "oob-thread-pool"])
+        self.assertEqual(stacks["udp"].getElementsByTagName("thread-pool"), [])
+        self.assertEqual([(pool.getAttribute("min-threads"), pool.getAttribute("max-threads"), pool.getAttribute("queue-length"))
+                          for pool in children[-2:]], [("20", "300", "100"), ("20", "300", "")])
+        self.assertFalse(children[-1].hasAttribute("name"))
+
+    def test_jgroups_tuning_invalid(self):
+        for environ in [{"JGROUPS_PROFILE": "fast"}, {"JGROUPS_BUNDLER_TYPE": "ring"},
+                        {"JGROUPS_FC_MIN_THRESHOLD": "2"}, {"JGROUPS_FRAG_SIZE": "70000"}]:
+            run = self._run(**environ)
+            self.assertRaises(InvalidSetting, run.jgroups_tuning, run.env.group("JGROUPS"))
+
+        run = self._run(JGROUPS_PROFILE="low-latency", JGROUPS_FD_TIMEOUT="soon", JGROUPS_STACK="sctp")
+        with mock.patch.object(run.logger, "error") as error:
+            config, stacks = self._jgroups(run)
+        self.assertEqual(error.call_count, 3)
+        self.assertEqual(config.getElementsByTagName("channel")[0].getAttribute("stack"), "tcp")
+        self.assertEqual(stacks["tcp"].getElementsByTagName("property"), [])
+
+    def _caches(self, run):
+        """Run the Infinispan steps and return the cache containers by name."""
+        run.inject_brokers()
+        run.setup_xml()
+        run.inject_infinispan()
+        run.teardown_xml()
+        config = xml.dom.minidom.parse(run.get_config_file())
+        return dict((elem.getAttribute("name"), elem) for elem in config.getElementsByTagName("cache-container"))
+
+    def _cache(self, container, tag):
+        cache = container.getElementsByTagName(tag)[0]
+        return [elem.tagName for elem in cache.childNodes if elem.nodeType == elem.ELEMENT_NODE], cache
+
+    def test_infinispan_dist(self):
+        run = self._run(INFINISPAN_WEB_CACHE="dist", INFINISPAN_WEB_OWNERS="3",
+                        INFINISPAN_WEB_EVICTION_MAX_ENTRIES="5000", INFINISPAN_WEB_EXPIRATION_MAX_IDLE="1800000")
+        self.assertFalse(run.uses_default_document())
+        containers = self._caches(run)
+        self.assertEqual(containers["web"].getAttribute("default-cache"), "dist")
+        children, dist = self._cache(containers["web"], "distributed-cache")
+        self.assertEqual(children, ["locking", "transaction", "eviction", "expiration", "file-store"])
+        self.assertEqual(dist.getAttribute("owners"), "3")
+        eviction = dist.getElementsByTagName("eviction")[0]
+        self.assertEqual((eviction.getAttribute("strategy"), eviction.getAttribute("max-entries")), ("LRU", "5000"))
+        self.assertEqual(dist.getElementsByTagName("expiration")[0].getAttribute("max-idle"), "1800000")
+        self.assertEqual(containers["ejb"].getAttribute("default-cache"), "repl")
+
+    def test_infinispan_without_store(self):
+        run = self._run(INFINISPAN_EJB_FILE_STORE="false", INFINISPAN_EJB_EVICTION_MAX_ENTRIES="0",
+                        INFINISPAN_WEB_EVICTION_STRATEGY="lirs")
+        containers = self._caches(run)
+        self.assertEqual(self._cache(containers["ejb"], "replicated-cache")[0], ["transaction"])
+        self.assertEqual(self._cache(containers["ejb"], "distributed-cache")[0], ["locking", "transaction"])
+        children, repl = self._cache(containers["web"], "replicated-cache")
+        self.assertEqual(children, ["transaction", "eviction", "file-store"])
+        self.assertEqual(repl.getElementsByTagName("eviction")[0].getAttribute("strategy"), "LIRS")
+
+    def test_infinispan_invalid(self):
+        run = self._run(INFINISPAN_WEB_CACHE="local", INFINISPAN_EJB_OWNERS="0")
+        with mock.patch.object(run.logger, "error") as error:
+            containers = self._caches(run)
+        self.assertEqual(error.call_count, 4)
+        self.assertEqual(containers["web"].getAttribute("default-cache"), "repl")
+        self.assertEqual(containers["ejb"].getElementsByTagName("distributed-cache")[0].getAttribute("owners"), "2")
+
+    def _listeners(self, run):
+        """Run the undertow steps and return the listeners by tag."""
+        run.inject_brokers()
+        run.configure_https()
+        run.setup_xml()
+        run.inject_undertow()
+        run.teardown_xml()
+        config = xml.dom.minidom.parse(run.get_config_file())
+        return dict((tag, config.getElementsByTagName(tag)) for tag in ["http-listener", "https-listener", "ajp-listener"])
+
+    def test_undertow_listeners(self):
+        run = self._run(UNDERTOW_MAX_CONNECTIONS="20000", UNDERTOW_TCP_BACKLOG="4096", UNDERTOW_MAX_POST_SIZE="0",
+                        UNDERTOW_NO_REQUEST_TIMEOUT="30000", UNDERTOW_BUFFER_POOL="default", UNDERTOW_ENABLE_HTTP2="true",
+                        HTTPS_PASSWORD="secret", HTTPS_KEYSTORE_DIR="/etc/eap", HTTPS_KEYSTORE="keystore.jks")
+        self.assertFalse(run.uses_default_document())
+        listeners = self._listeners(run)
+        for tag, elems in listeners.items():
+            self.assertEqual([elems[0].getAttribute(name) for name in
+                              ["max-connections", "tcp-backlog", "max-post-size", "no-request-timeout", "buffer-pool"]],
+                             ["20000", "4096", "0", "30000", "default"])
+        self.assertEqual(listeners["https-listener"][0].getAttribute("enable-http2"), "true")
+        self.assertFalse(listeners["http-listener"][0].hasAttribute("enable-http2"))
+
+    def test_undertow_invalid(self):
+        run = self._run(UNDERTOW_MAX_CONNECTIONS="0")
+        with mock.patch.object(run.logger, "error") as error:
+            listeners = self._listeners(run)
+        self.assertEqual(error.call_count, 2)
+        self.assertFalse(listeners["http-listener"][0].hasAttribute("max-connections"))
+
+        run = self._run(UNDERTOW_BUFFER_POOL="large", UNDERTOW_TCP_BACKLOG="128")
+        with mock.patch.object(run.logger, "error") as error:
+            listeners = self._listeners(run)
+        self.assertEqual(error.call_count, 1)
+        self.assertFalse(listeners["ajp-listener"][0].hasAttribute("buffer-pool"))
+        self.assertEqual(listeners["ajp-listener"][0].getAttribute("tcp-backlog"), "128")
+
+    def _loggers(self, run):
+        subsystem = xml.dom.minidom.parseString("<subsystem>{}</subsystem>".format(run.placeholders["LOGGERS"]))
+        return [(logger.getAttribute("category"), logger.getElementsByTagName("level")[0].getAttribute("name"))
+                for logger in subsystem.getElementsByTagName("logger")]
+
+    def test_configure_logging_defaults(self):
+        run = self._run()
+        run.configure_logging()
+        self.assertEqual([run.placeholders[name] for name in
+                          ["LOGGING_FORMATTER", "LOGGING_ASYNC_QUEUE_LENGTH", "LOGGING_ASYNC_OVERFLOW_ACTION"]],
+                         ["COLOR-PATTERN", "512", "block"])
+        self.assertEqual(self._loggers(run), [("com.arjuna", "WARN"), ("org.jboss.as.config", "DEBUG"), ("sun.rmi", "WARN")])
+
+    def test_configure_logging(self):
+        run = self._run(ENABLE_JSON_LOGGING="true", LOGGING_ASYNC_QUEUE_LENGTH="8192",
+                        LOGGING_ASYNC_OVERFLOW_ACTION="DISCARD",
+                        LOGGER_CATEGORIES="org.hibernate.SQL:debug, com.arjuna:INFO")
+        run.configure_logging()
+        self.assertEqual([run.placeholders[name] for name in
+                          ["LOGGING_FORMATTER", "LOGGING_ASYNC_QUEUE_LENGTH", "LOGGING_ASYNC_OVERFLOW_ACTION"]],
+                         ["OPENSHIFT", "8192", "discard"])
+        self.assertEqual(self._loggers(run), [("com.arjuna", "INFO"), ("org.jboss.as.config", "DEBUG"),
+                                              ("sun.rmi", "WARN"), ("org.hibernate.SQL", "DEBUG")])
+
+    def test_configure_logging_invalid(self):
+        run = self._run(LOGGING_ASYNC_QUEUE_LENGTH="0", LOGGING_ASYNC_OVERFLOW_ACTION="drop",
+                        LOGGER_CATEGORIES="com.acme,com.acme:LOUD,com.acme.sql:TRACE")
+        with mock.patch.object(run.logger, "error") as error:
+            run.configure_logging()
+        self.assertEqual(run.placeholders["LOGGING_ASYNC_QUEUE_LENGTH"], "512")
+        self.assertEqual(run.placeholders["LOGGING_ASYNC_OVERFLOW_ACTION"], "block")
+        self.assertEqual(self._loggers(run)[-1], ("com.acme.sql", "TRACE"))
+        self.assertEqual(len(self._loggers(run)), 4)
+        self.assertEqual(error.call_count, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
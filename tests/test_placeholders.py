@@ -0,0 +1,57 @@
+import unittest
+import mock
+import tempfile
+import os
+import shutil
+
+from run import Run
+
+class TestPlaceholders(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestPlaceholders")
+        self.run = Run('run','run')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_chained_placeholders(self):
+        """A placeholder re-introduced by an earlier substitution is filled in"""
+        self.run.set_placeholder("TIMER_SERVICE", "<timer><!-- ##DATASTORES## --></timer>")
+        self.run.set_placeholder("DATASTORES", "<a/><!-- ##DATASTORES## -->")
+        self.run.set_placeholder("DATASTORES", "<b/>")
+        self.assertEqual(self.run.placeholders["TIMER_SERVICE"], "<timer><a/><b/></timer>")
+
+    def test_consumed_placeholder_ignored(self):
+        self.run.set_placeholder("SSL", "first")
+        self.run.set_placeholder("SSL", "second")
+        self.assertEqual(self.run.placeholders["SSL"], "first")
+
+    def test_load_placeholders(self):
+        path = os.path.join(self.workdir, "placeholders")
+        with open(path, "w") as fh:
+            fh.write("JGROUPS_AUTH\t\\n<protocol type=\"AUTH\"/>\\n\n")
+            fh.write("DEFAULT_JMS\t\n")
+        self.run.load_placeholders(path)
+        self.assertEqual(self.run.placeholders["JGROUPS_AUTH"], "\n<protocol type=\"AUTH\"/>\n")
+        self.assertEqual(self.run.placeholders["DEFAULT_JMS"], "")
+
+    def test_render_template(self):
+        """All placeholders are rendered, unknown ones are left untouched"""
+        config_file = os.path.join(self.workdir, "standalone-openshift.xml")
+        shutil.copy("os-eap7-openshift/added/standalone-openshift.xml", config_file)
+
+        self.run.set_placeholder("JGROUPS_AUTH", "<protocol type=\"AUTH\"/>")
+        self.run.set_placeholder("DEFAULT_JMS", "")
+        with mock.patch.object(Run, "get_config_file", return_value=config_file):
+            self.run.render_template()
+
+        rendered = open(config_file).read()
+        self.assertEqual(rendered.count("<protocol type=\"AUTH\"/>"), 2)
+        self.assertNotIn("##JGROUPS_AUTH##", rendered)
+        self.assertNotIn("##DEFAULT_JMS##", rendered)
+        self.assertIn("<!-- ##SSL## -->", rendered)
+        self.assertIn("##SOAP11_HTTP ##SOAP11_HTTP_MTOM", rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
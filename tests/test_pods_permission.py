@@ -0,0 +1,97 @@
+import unittest
+import mock
+import tempfile
+import threading
+import time
+import os
+import shutil
+import BaseHTTPServer
+import SocketServer
+
+import run as run_module
+from run import Run
+
+# tests for the background pod view permission check, against a stub API server
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("Authorization")))
+        time.sleep(self.server.delay)
+        self.send_response(self.server.code)
+        self.end_headers()
+        self.wfile.write("{}")
+
+    def log_message(self, *args):
+        pass
+
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class TestPodsPermission(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestPodsPermission")
+        self.token = os.path.join(self.workdir, "token")
+        with open(self.token, "w") as fh:
+            fh.write("s3cr3t\n")
+        self.cache = os.path.join(self.workdir, "permissions.json")
+
+        self.server = StubServer(("127.0.0.1", 0), StubHandler)
+        self.server.code = 200
+        self.server.delay = 0
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.workdir)
+
+    def _check(self, **environ):
+        environ.setdefault("OPENSHIFT_KUBE_PING_NAMESPACE", "myproject")
+        environ.setdefault("OPENSHIFT_KUBE_PING_PERMISSION_CACHE", self.cache)
+        with mock.patch.dict(os.environ, environ, clear=True):
+            run = Run('run','run')
+        url = "http://127.0.0.1:{}/api/v1/namespaces/myproject/pods".format(self.server.server_address[1])
+        run.logger = mock.Mock()
+        with mock.patch.object(run_module, "SERVICE_ACCOUNT_TOKEN", self.token), \
+             mock.patch.object(run, "view_pods_url", return_value=url):
+            run.check_view_pods_permission()
+        return run
+
+    def test_permitted(self):
+        run = self._check()
+        run.report_view_pods_permission()
+        self.assertIn("sufficient permissions", run.logger.info.call_args[0][0])
+        self.assertEqual(self.server.requests, [("/api/v1/namespaces/myproject/pods", "Bearer s3cr3t")])
+
+    def test_forbidden(self):
+        self.server.code = 403
+        run = self._check()
+        run.report_view_pods_permission()
+        self.assertIn("insufficient permissions", run.logger.warning.call_args[0][0])
+
+    def test_cached(self):
+        self._check().report_view_pods_permission()
+        run = self._check()
+        run.report_view_pods_permission()
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertIn("HTTP 200", run.logger.info.call_args[0][0])
+
+    def test_errors_not_cached(self):
+        self.server.code = 500
+        self._check().report_view_pods_permission()
+        self._check().report_view_pods_permission()
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_deadline(self):
+        self.server.delay = 3
+        start = time.time()
+        run = self._check(OPENSHIFT_KUBE_PING_PERMISSION_TIMEOUT="1")
+        self.assertLess(time.time() - start, 0.5)
+        run.report_view_pods_permission()
+        self.assertLess(time.time() - start, 2)
+        self.assertIn("did not answer within 1s", run.logger.warning.call_args[0][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
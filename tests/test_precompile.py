@@ -0,0 +1,146 @@
+import unittest
+import mock
+import tempfile
+import xml.dom.minidom
+import os
+import shutil
+
+import run as run_module
+
+from run import Run, SubsystemDocument
+
+TEMPLATE = "os-eap7-openshift/added/standalone-openshift.xml"
+
+def canonical(path):
+    """The document without whitespace-only text, for comparison."""
+    doc = xml.dom.minidom.parse(path)
+    def strip(node):
+        for child in list(node.childNodes):
+            if child.nodeType == child.TEXT_NODE and not child.data.strip():
+                node.removeChild(child)
+            else:
+                strip(child)
+    strip(doc)
+    return doc.toxml()
+
+class TestPrecompile(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestPrecompile")
+        self.jboss_home = os.path.join(self.workdir, "eap")
+        self.config = os.path.join(self.jboss_home, "standalone", "configuration", "standalone-openshift.xml")
+        os.makedirs(os.path.dirname(self.config))
+        os.makedirs(os.path.join(self.jboss_home, "bin", "launch"))
+        shutil.copy("os-eap7-launch/added/launch/activemq-subsystem.xml",
+                    os.path.join(self.jboss_home, "bin", "launch"))
+        shutil.copy(TEMPLATE, self.config)
+        self._run().precompile()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _run(self, **environ):
+        environ.setdefault("JBOSS_HOME", self.jboss_home)
+        environ.setdefault("STARTUP_TIMELINE_FILE", "")
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return Run('run','run')
+
+    def _configure(self, **environ):
+        shutil.copy(TEMPLATE, self.config)
+        run = self._run(**environ)
+        with mock.patch("run.LAUNCH_ENVS_FILE", os.path.join(self.workdir, "launch_envs")):
+            run.configure()
+        return run, canonical(self.config)
+
+    def test_defaults_without_parsing(self):
+        environ = {"JGROUPS_CLUSTER_PASSWORD": "secret", "AUTO_DEPLOY_EXPLODED": "true"}
+        _, expected = self._configure(CONFIG_PRECOMPILED="false", **environ)
+        with mock.patch("xml.dom.minidom.parseString") as parse:
+            run, result = self._configure(**environ)
+        self.assertFalse(parse.called)
+        self.assertEqual(result, expected)
+        self.assertIn("write_precompiled_default", [phase["name"] for phase in run.timeline.phases])
+
+    def test_changes_from_defaults(self):
+        environ = {
+            "DB_SERVICE_PREFIX_MAPPING": "test-postgresql=TEST",
+            "TEST_POSTGRESQL_SERVICE_HOST": "10.0.0.1",
+            "TEST_POSTGRESQL_SERVICE_PORT": "5432",
+            "TEST_USERNAME": "user",
+            "TEST_PASSWORD": "secret",
+            "TEST_DATABASE": "db",
+            "MQ_QUEUES": "orders",
+        }
+        _, expected = self._configure(CONFIG_PRECOMPILED="false", **environ)
+        for backend in ["minidom", "streaming"]:
+            run, result = self._configure(CONFIG_XML_BACKEND=backend, **environ)
+            self.assertEqual(result, expected)
+            self.assertIsNotNone(run.precompiled)
+
+    # a valid value for each DOCUMENT_ENV variable, "1000" for the others
+    DOCUMENT_VALUES = {
+        "DB_SERVICE_PREFIX_MAPPING": "test-postgresql=TEST",
+        "TX_DATABASE_PREFIX_MAPPING": "test-postgresql=TEST",
+        "TX_OBJECT_STORE": "journal",
+        "TIMER_SERVICE_DATA_STORE": "test-postgresql",
+        "DEFAULT_JOB_REPOSITORY": "test-postgresql",
+        "DEFAULT_DATASOURCE": "java:jboss/datasources/Test",
+        "DB_JNDI": "java:/custom/DS",
+        "DB_POOL": "Custom",
+        "JGROUPS_PROFILE": "low-latency",
+        "JGROUPS_BUNDLER_TYPE": "sender-sends",
+        "JGROUPS_FC_MIN_THRESHOLD": "0.5",
+        "JGROUPS_FRAG_SIZE": "30000",
+        "INFINISPAN_WEB_CACHE": "dist",
+        "INFINISPAN_EJB_CACHE": "dist",
+        "INFINISPAN_WEB_EVICTION_STRATEGY": "LIRS",
+        "INFINISPAN_EJB_EVICTION_STRATEGY": "LIRS",
+        "INFINISPAN_WEB_FILE_STORE": "false",
+        "INFINISPAN_EJB_FILE_STORE": "false",
+        "UNDERTOW_BUFFER_POOL": "default",
+        "UNDERTOW_ENABLE_HTTP2": "true",
+    }
+
+    def test_document_env(self):
+        """Every DOCUMENT_ENV variable, set or empty, renders the same on both paths"""
+        for name in sorted(set(run_module.DOCUMENT_ENV) | set(self.DOCUMENT_VALUES)):
+            for value in [self.DOCUMENT_VALUES.get(name, "1000"), ""]:
+                environ = {name: value}
+                _, expected = self._configure(CONFIG_PRECOMPILED="false", **environ)
+                _, result = self._configure(**environ)
+                self.assertEqual(result, expected, "{}={!r}".format(name, value))
+
+    def test_changed_template(self):
+        """A template changed after precompile (e.g. by an S2I build) is rendered, not the stale output"""
+        marker = '    </extensions>\n    <system-properties><property name="marker" value="s2i"/></system-properties>\n'
+        template = open(TEMPLATE).read().replace("    </extensions>\n", marker, 1)
+        with open(self.config, "w") as fh:
+            fh.write(template)
+        run = self._run()
+        self.assertIsNone(run.load_precompiled())
+        with mock.patch("run.LAUNCH_ENVS_FILE", os.path.join(self.workdir, "launch_envs")):
+            run.configure()
+        properties = xml.dom.minidom.parse(self.config).getElementsByTagName("property")
+        self.assertEqual([p.getAttribute("value") for p in properties if p.getAttribute("name") == "marker"], ["s2i"])
+
+    def test_non_ascii_values(self):
+        """Values are spliced into the precompiled texts as UTF-8, on both precompiled paths"""
+        for environ in [{}, {"MQ_QUEUES": "orders"}]:
+            environ["JGROUPS_CLUSTER_PASSWORD"] = "p\xc3\xa4ss"
+            _, expected = self._configure(CONFIG_PRECOMPILED="false", **environ)
+            run, result = self._configure(**environ)
+            self.assertIsNotNone(run.precompiled)
+            self.assertEqual(result, expected)
+            self.assertIn("p\xc3\xa4ss", open(self.config).read())
+
+    def test_sections(self):
+        """The precompiled sections are the ones a scan would find"""
+        run = self._run(CONFIG_XML_BACKEND="streaming")
+        run.precompiled = run.load_precompiled()
+        run.setup_xml()
+        scanned = SubsystemDocument(run.render(open(TEMPLATE).read()))
+        self.assertEqual([(s.namespace, s.text) for s in run.config.sections],
+                         [(s.namespace, s.text) for s in scanned.sections])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import mock
+import tempfile
+import os
+import shutil
+
+from run import Run
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestRenderCache")
+        self.jboss_home = os.path.join(self.workdir, "eap")
+        os.makedirs(os.path.join(self.jboss_home, "standalone", "configuration"))
+        shutil.copy("os-eap7-openshift/added/standalone-openshift.xml",
+                    os.path.join(self.jboss_home, "standalone", "configuration"))
+        self.env = mock.patch.dict(os.environ, {
+            "JBOSS_HOME": self.jboss_home,
+            "CONFIG_RENDER_CACHE_DIR": os.path.join(self.workdir, "cache"),
+        })
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        shutil.rmtree(self.workdir)
+
+    def _run(self):
+        run = Run('run','run')
+        run.get_render_cache_files = lambda: [run.get_config_file()]
+        return run
+
+    def test_miss_then_hit(self):
+        run = self._run()
+        self.assertFalse(run.restore_render_cache())
+        with open(run.get_config_file(), "w") as fh:
+            fh.write("<server/>")
+        run.save_render_cache()
+
+        # a restarted container starts again from the unrendered template
+        shutil.copy("os-eap7-openshift/added/standalone-openshift.xml", run.get_config_file())
+        run = self._run()
+        self.assertTrue(run.restore_render_cache())
+        self.assertEqual(open(run.get_config_file()).read(), "<server/>")
+
+    def test_environment_change_misses(self):
+        run = self._run()
+        run.restore_render_cache()
+        run.save_render_cache()
+
+        with mock.patch.dict(os.environ, {"DB_SERVICE_PREFIX_MAPPING": "test-mysql=TEST"}):
+            self.assertFalse(self._run().restore_render_cache())
+
+    def test_invalidate(self):
+        run = self._run()
+        run.restore_render_cache()
+        run.save_render_cache()
+
+        with mock.patch.dict(os.environ, {"CONFIG_RENDER_CACHE_INVALIDATE": "true"}):
+            self.assertFalse(self._run().restore_render_cache())
+        self.assertEqual(os.listdir(run.render_cache_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
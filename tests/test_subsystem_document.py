@@ -0,0 +1,52 @@
+import unittest
+import xml.dom.minidom
+import StringIO
+
+from run import Run, SubsystemDocument
+
+TEMPLATE = "os-eap7-openshift/added/standalone-openshift.xml"
+
+class TestSubsystemDocument(unittest.TestCase):
+    def setUp(self):
+        self.text = open(TEMPLATE).read().replace('##DEFAULT_JMS##', '')
+        self.doc = SubsystemDocument(self.text)
+
+    def _write(self, doc):
+        out = StringIO.StringIO()
+        doc.writexml(out)
+        return out.getvalue()
+
+    def test_untouched_round_trip(self):
+        """Nothing is parsed and the output is byte for byte the input"""
+        self.assertEqual(self._write(self.doc), self.text)
+        self.assertTrue(all(section.element is None for section in self.doc.sections))
+
+    def test_sections(self):
+        roots = [xml.dom.minidom.parseString(section.text).documentElement.tagName
+                 for section in self.doc.sections]
+        self.assertEqual(roots.count("subsystem"), 32)
+        self.assertIn("socket-binding-group", roots)
+        self.assertNotIn("profile", roots)
+
+    def test_only_modified_subsystems_parsed(self):
+        run = Run('run','run')
+        run.config = self.doc
+        run.inject_datasources()
+
+        parsed = [section.element.getAttribute("xmlns") for section in self.doc.sections
+                  if section.element is not None]
+        self.assertEqual(sorted(parsed), [
+            "urn:jboss:domain:batch-jberet:1.0",
+            "urn:jboss:domain:datasources:4.0",
+            "urn:jboss:domain:ee:4.0",
+            "urn:jboss:domain:ejb3:4.0",
+        ])
+
+        # the result is still a valid document with the datasource injected
+        result = xml.dom.minidom.parseString(self._write(self.doc))
+        self.assertEqual(len(result.getElementsByTagName("datasource")), 1)
+        self.assertEqual(len(result.getElementsByTagName("timer-service")), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import unittest
+import mock
+import tempfile
+import json
+import os
+import shutil
+import StringIO
+
+from run import Run
+from timeline import StartupTimeline
+
+class TestTimeline(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestTimeline")
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def _run(self, **environ):
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return Run('run','run')
+
+    def test_phases(self):
+        timeline = StartupTimeline()
+        with timeline.phase("setup_xml"):
+            pass
+        timeline.spawned(2)
+        result = timeline.as_dict()
+        self.assertEqual([phase["name"] for phase in result["phases"]], ["setup_xml"])
+        self.assertEqual(result["subprocesses"], 2)
+        self.assertGreater(result["peak_rss_kb"], 0)
+
+    def test_load_shell_timeline(self):
+        run = self._run()
+        path = os.path.join(self.workdir, "launch_timeline")
+        start = int(run.timeline.started * 1e9)
+        with open(path, "w") as fh:
+            fh.write("configure_ha {} {}\n".format(start + 1000000, start + 3000000))
+            fh.write("garbage\n")
+        run.load_shell_timeline(path)
+        phase, = run.timeline.phases
+        self.assertEqual(phase["name"], "configure_ha")
+        self.assertAlmostEqual(phase["start_ms"], 1.0, places=1)
+        self.assertAlmostEqual(phase["duration_ms"], 2.0, places=1)
+        self.assertTrue(phase["shell"])
+
+    def test_write_timeline(self):
+        path = os.path.join(self.workdir, "timeline.json")
+        run = self._run(STARTUP_TIMELINE_FILE=path, STARTUP_TIMELINE_SUMMARY="true")
+        with run.timeline.phase("configure_ha"):
+            pass
+        with mock.patch("sys.stdout", new_callable=StringIO.StringIO) as stdout:
+            run.write_timeline()
+        self.assertEqual(json.load(open(path))["phases"][0]["name"], "configure_ha")
+        self.assertTrue(stdout.getvalue().startswith("startup: "))
+        self.assertIn("configure_ha=", stdout.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import mock
+import tempfile
+import os
+import shutil
+
+from run import Run
+
+class TestWriteConfig(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="TestWriteConfig")
+        self.config = os.path.join(self.workdir, "standalone-openshift.xml")
+        with open(self.config, "w") as fh:
+            fh.write("<server/>")
+        os.chmod(self.config, 0o640)
+        self.run = Run('run','run')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_unchanged(self):
+        inode = os.stat(self.config).st_ino
+        self.run.write_config(self.config, "<server/>")
+        self.assertEqual(os.stat(self.config).st_ino, inode)
+        self.assertEqual(self.run.timeline.annotations["config_output"]["bytes_written"], 0)
+        self.assertFalse(self.run.timeline.annotations["config_output"]["changed"])
+
+    def test_changed(self):
+        self.run.write_config(self.config, "<server><profile/></server>", 0.002)
+        self.assertEqual(open(self.config).read(), "<server><profile/></server>")
+        self.assertEqual(os.stat(self.config).st_mode & 0o777, 0o640)
+        self.assertEqual(self.run.timeline.annotations["config_output"],
+                         {"bytes_written": 27, "serialise_ms": 2.0, "changed": True})
+
+    def test_failed_write_keeps_original(self):
+        with mock.patch("os.rename", side_effect=OSError("disk full")):
+            self.assertRaises(OSError, self.run.write_config, self.config, "<server><profile/></server>")
+        self.assertEqual(open(self.config).read(), "<server/>")
+        self.assertEqual(os.listdir(self.workdir), ["standalone-openshift.xml"])
+
+
+if __name__ == '__main__':
+    unittest.main()
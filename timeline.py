@@ -0,0 +1,81 @@
+"""
+Copyright (c) 2015 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the MIT license. See the LICENSE file for details.
+"""
+
+import json
+import time
+import resource
+
+from contextlib import contextmanager
+
+def peak_rss_kb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in KiB (ru_maxrss is in KiB on Linux)."""
+    return resource.getrusage(who).ru_maxrss
+
+class StartupTimeline(object):
+    """
+    Wall time and peak RSS of each startup phase, plus the number of
+    processes spawned, written as JSON for aggregation across pod starts.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.phases = []
+        self.subprocesses = 0
+        self.annotations = {}
+
+    def _ms(self, seconds):
+        return round(seconds * 1000.0, 3)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, start, time.time())
+
+    def add_phase(self, name, start, end, **extra):
+        """Record a phase from absolute start and end times in seconds."""
+        phase = {
+            "name": name,
+            "start_ms": self._ms(start - self.started),
+            "duration_ms": self._ms(end - start),
+            "peak_rss_kb": peak_rss_kb(),
+        }
+        phase.update(extra)
+        self.phases.append(phase)
+
+    def spawned(self, count=1):
+        self.subprocesses += count
+
+    def annotate(self, key, value):
+        self.annotations[key] = value
+
+    def as_dict(self):
+        timeline = {
+            "started": self.started,
+            "total_ms": self._ms(time.time() - self.started),
+            "peak_rss_kb": peak_rss_kb(),
+            "children_peak_rss_kb": peak_rss_kb(resource.RUSAGE_CHILDREN),
+            "subprocesses": self.subprocesses,
+            "phases": self.phases,
+        }
+        timeline.update(self.annotations)
+        return timeline
+
+    def write(self, path):
+        with open(path, "w") as fh:
+            json.dump(self.as_dict(), fh, indent=2, sort_keys=True)
+
+    def summary(self):
+        """One line: total time, peak RSS, subprocesses and the slowest phases."""
+        timeline = self.as_dict()
+        slowest = sorted(self.phases, key=lambda phase: phase["duration_ms"], reverse=True)[:3]
+        return "startup: {:.1f}ms peak_rss={}KiB subprocesses={} slowest: {}".format(
+            timeline["total_ms"], timeline["peak_rss_kb"], self.subprocesses,
+            ", ".join("{}={:.1f}ms".format(phase["name"], phase["duration_ms"]) for phase in slowest))